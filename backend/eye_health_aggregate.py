@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Weighted population aggregation for workforce reporting
+Takes a population described by counts (or weights) per (ageGroup, sex,
+screenTime) cell, scores each distinct cell once with the batch prediction
+functions and reduces with NumPy group-bys: weighted mean eye risk,
+weighted quantiles and risk-level histograms, overall and per group
+
+Request:
+{"cells": [{"ageGroup": "25–34", "sex": "Female", "screenTime": 9, "count": 120000}, ...],
+ "groupBy": ["ageGroup"], "quantiles": [0.1, 0.5, 0.9]}
+"""
+import sys
+import json
+import math
+import warnings
+
+import numpy as np
+
+from eye_health_batch import predict_eye_health_risk_final_batch, predict_eye_health_with_screentime_batch
+from eye_health_metrics import span, increment
+from eye_health_validation import get_validator, invalid_result
+import eye_health_predictor_final as final
+import eye_health_predictor_screentime as screentime
+
+RISK_LEVELS = ('Low', 'Medium', 'High')
+DEFAULT_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+MAX_CELLS = 100000
+# Largest total count accepted: below 2**53, so counts add up exactly and
+# the weighted sums stay finite
+MAX_POPULATION = 1e15
+
+# Screen time bands of apply_screen_time_adjustment (upper bounds, inclusive);
+# every hour value within a band gets the same risk, so a band is scored once
+SCREEN_TIME_BAND_UPPER = np.array([2, 4, 6, 8, 10, 12, np.inf])
+SCREEN_TIME_BAND_LABELS = ('0–2', '2–4', '4–6', '6–8', '8–10', '10–12', '12+')
+
+# predictor -> (batch function, validated fields, fields that select the risk)
+PREDICTORS = {
+    'screentime': (predict_eye_health_with_screentime_batch, screentime.VALIDATED_FIELDS,
+                   {'ageGroup': '25–34', 'screenTime': 8}),
+    'final': (predict_eye_health_risk_final_batch, final.VALIDATED_FIELDS,
+              {'ageGroup': '25–34', 'sex': ''}),
+}
+# Fields cells can be grouped by, with the value used when a cell omits one
+GROUP_DEFAULTS = {'ageGroup': '25–34', 'sex': '', 'screenTime': 8}
+
+
+def get_screen_time_band(hours):
+    """Index into SCREEN_TIME_BAND_LABELS for a number of hours"""
+    return int(np.searchsorted(SCREEN_TIME_BAND_UPPER, hours, side='left'))
+
+
+def get_predictor_models(models, predictor):
+    """The model set under the key the predictor's batch function reads"""
+    if predictor == 'final' and 'eye' not in models:
+        return {'eye': models['eye_original']}
+    if predictor == 'screentime' and 'eye_original' not in models:
+        return {'eye_original': models['eye']}
+    return models
+
+
+def parse_weight(cell):
+    """(weight, None) or (None, message) from a cell's count or weight"""
+    weight = cell.get('count', cell.get('weight', 1))
+    if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not math.isfinite(weight) or weight < 0:
+        return None, f"count must be a non-negative number, got {weight!r}"
+    return weight, None
+
+
+def as_records(cells):
+    """A list of cell dicts, or a dict of equal-length columns, as a list of dicts"""
+    if isinstance(cells, dict):
+        lengths = {len(values) for values in cells.values() if isinstance(values, list)}
+        if len(lengths) != 1 or len(cells) != sum(isinstance(v, list) for v in cells.values()):
+            raise ValueError("cells columns must be lists of the same length")
+        names = list(cells)
+        return [dict(zip(names, values)) for values in zip(*(cells[name] for name in names))]
+    if not isinstance(cells, list):
+        raise ValueError("cells must be a list of objects or a dict of columns")
+    return cells
+
+
+def index_keys(keys):
+    """Dense index per key in first-seen order; returns (inverse array, distinct keys)"""
+    index = {}
+    inverse = np.fromiter((index.setdefault(key, len(index)) for key in keys), dtype=np.int64, count=len(keys))
+    return inverse, list(index)
+
+
+def summarize_groups(weights, risk, levels, quantiles):
+    """
+    Group-by reductions over a (groups x scored cells) weight matrix
+    risk: eye risk per scored cell, levels: risk level index per scored cell
+    Returns population, weighted mean, quantiles and level histograms per group
+    """
+    population = weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = weights @ risk / population
+    histogram = weights @ np.eye(len(RISK_LEVELS))[levels]
+
+    # Weighted quantiles: smallest risk whose cumulative weight reaches q * population
+    # (at least a sliver of it, so q = 0 skips cells with zero weight)
+    order = np.argsort(risk, kind='stable')
+    sorted_risk = risk[order]
+    cumulative = np.cumsum(weights[:, order], axis=1)
+    quantile_values = np.empty((len(population), len(quantiles)))
+    for j, q in enumerate(quantiles):
+        target = np.maximum(q * population * (1 - 1e-12), population * 1e-12)
+        positions = (cumulative < target[:, np.newaxis]).sum(axis=1)
+        quantile_values[:, j] = sorted_risk[np.minimum(positions, len(risk) - 1)]
+    return population, mean, quantile_values, histogram
+
+
+def format_summary(population, mean, quantile_values, histogram, quantiles):
+    """JSON summary of one group"""
+    return {
+        "population": float(population),
+        "mean_eye_risk": round(float(mean), 4) if population > 0 else None,
+        "quantiles": {f"p{q * 100:g}": float(value) if population > 0 else None
+                      for q, value in zip(quantiles, quantile_values)},
+        "risk_levels": {
+            level: {"count": float(count), "share": round(float(count / population), 6) if population > 0 else None}
+            for level, count in zip(RISK_LEVELS, histogram)
+        },
+    }
+
+
+def parse_quantiles(value):
+    """(quantiles, None) or (None, message)"""
+    if value is None:
+        return DEFAULT_QUANTILES, None
+    if (not isinstance(value, list) or not value
+            or not all(isinstance(q, (int, float)) and not isinstance(q, bool) and 0 <= q <= 1 for q in value)):
+        return None, f"quantiles must be a list of numbers between 0 and 1, got {value!r}"
+    return tuple(value), None
+
+
+def aggregate_population(payload, models, predictor='screentime'):
+    """
+    Aggregate eye risk over a population given as weighted cells
+    Each distinct (ageGroup, screen time band) cell, or (ageGroup, sex) for the
+    final predictor, is scored once; cells that fail validation are reported
+    under 'rejected' and left out of every total
+    """
+    if not isinstance(payload, dict):
+        return invalid_result({"input": f"Input must be a JSON object, got {type(payload).__name__}"})
+    errors = {}
+    predictor = payload.get('predictor', predictor)
+    if predictor not in PREDICTORS:
+        errors['predictor'] = f"predictor must be one of {', '.join(PREDICTORS)}"
+    quantiles, message = parse_quantiles(payload.get('quantiles'))
+    if message:
+        errors['quantiles'] = message
+    group_by = payload.get('groupBy', [])
+    group_by = [group_by] if isinstance(group_by, str) else group_by
+    if not isinstance(group_by, list) or not all(field in GROUP_DEFAULTS for field in group_by):
+        errors['groupBy'] = f"groupBy must list fields from {', '.join(GROUP_DEFAULTS)}"
+    try:
+        cells = as_records(payload.get('cells', []))
+        if len(cells) > MAX_CELLS:
+            errors['cells'] = f"At most {MAX_CELLS} cells per request, got {len(cells)}"
+    except ValueError as e:
+        errors['cells'] = str(e)
+    if errors:
+        increment('aggregate.rejected')
+        return invalid_result(errors)
+
+    predict_batch, fields, defaults = PREDICTORS[predictor]
+    if 'screenTime' in group_by and 'screenTime' not in fields:
+        # Grouping by screen time band needs valid hours even when the risk ignores them
+        fields = fields + ('screenTime',)
+
+    with span('encode'):
+        records, record_errors = get_validator(models, fields).validate_many(cells)
+        valid_records = []
+        weights = []
+        rejected = []
+        for i, (record, cell_errors) in enumerate(zip(records, record_errors)):
+            weight = None
+            if cell_errors is None:
+                weight, message = parse_weight(record)
+                if message:
+                    cell_errors = {"count": message}
+            if cell_errors is not None:
+                rejected.append({"index": i, "errors": cell_errors})
+                continue
+            valid_records.append(record)
+            weights.append(weight)
+
+        # Score key: only the fields the predictor's risk depends on
+        def score_key(record):
+            key = []
+            for field, default in defaults.items():
+                value = record.get(field, default)
+                key.append(get_screen_time_band(value) if field == 'screenTime' else value)
+            return tuple(key)
+
+        cell_index, scored_keys = index_keys([score_key(record) for record in valid_records])
+        representatives = [None] * len(scored_keys)
+        for record, index in zip(valid_records, cell_index.tolist()):
+            if representatives[index] is None:
+                representatives[index] = record
+
+    population = sum(weights)
+    if population > MAX_POPULATION:
+        increment('aggregate.rejected')
+        return invalid_result({"cells": f"Total count must be at most {MAX_POPULATION:g}, got {population:g}"})
+
+    increment('aggregate.requests')
+    increment('aggregate.scored_cells', len(representatives))
+    if representatives:
+        results = predict_batch(representatives, get_predictor_models(models, predictor))
+        risk = np.array([result['eye_risk'] for result in results], dtype=np.float64)
+        levels = np.array([RISK_LEVELS.index(result['risk_level']) for result in results], dtype=np.int64)
+    else:
+        risk = np.zeros(0)
+        levels = np.zeros(0, dtype=np.int64)
+
+    with span('aggregate'):
+        weights = np.asarray(weights, dtype=np.float64)
+        n_scored = len(scored_keys)
+
+        def group_label(record, field):
+            value = record.get(field, GROUP_DEFAULTS[field])
+            return SCREEN_TIME_BAND_LABELS[get_screen_time_band(value)] if field == 'screenTime' else value
+
+        if group_by:
+            group_index, group_keys = index_keys([tuple(group_label(record, field) for field in group_by)
+                                                  for record in valid_records])
+        else:
+            group_index, group_keys = np.zeros(len(valid_records), dtype=np.int64), [()]
+        n_groups = max(len(group_keys), 1)
+        matrix = np.bincount(group_index * n_scored + cell_index, weights=weights,
+                             minlength=n_groups * n_scored).reshape(n_groups, n_scored)
+
+        if n_scored:
+            overall = summarize_groups(matrix.sum(axis=0, keepdims=True), risk, levels, quantiles)
+            grouped = summarize_groups(matrix, risk, levels, quantiles) if group_by else None
+        else:
+            overall = (np.zeros(1), np.zeros(1), np.zeros((1, len(quantiles))), np.zeros((1, len(RISK_LEVELS))))
+            grouped = None
+
+    response = {
+        "predictor": predictor,
+        "cells": len(cells),
+        "scored_cells": n_scored,
+        **format_summary(*(values[0] for values in overall), quantiles),
+        "rejected": rejected,
+    }
+    if grouped is not None:
+        response["groups"] = [
+            {**dict(zip(group_by, key)), **format_summary(*(values[g] for values in grouped), quantiles)}
+            for g, key in enumerate(group_keys)
+        ]
+    return response
+
+
+def aggregate_final(payload, models):
+    """Worker op for the final script"""
+    return aggregate_population(payload, models, 'final')
+
+
+def aggregate_screentime(payload, models):
+    """Worker op for the screen time script"""
+    return aggregate_population(payload, models, 'screentime')
+
+
+def verify_aggregate_parity():
+    """Compare aggregates with per-person batch predictions on an expanded population"""
+    models = screentime.load_eye_models_with_screentime(include_screentime_model=False)
+    rng = np.random.default_rng(7)
+    age_groups = ['0–14', '15–24', '25–34', '35–44', '45–54', '55–64', '65–74', '75–84', '85+', '25-34']
+    cells = [{'ageGroup': age_group, 'sex': sex, 'screenTime': hours, 'count': int(rng.integers(0, 40))}
+             for age_group in age_groups for sex in ('Male', 'Female', 'Persons')
+             for hours in (1, 2, 3.5, 5, 7, 9, 11, 14)]
+    cells.append({'ageGroup': 'zz', 'count': 5})
+
+    mismatches = []
+    for predictor, (predict_batch, _, _) in PREDICTORS.items():
+        result = aggregate_population({'cells': cells, 'groupBy': ['sex']}, models, predictor)
+        people = [cell for cell in cells[:-1] for _ in range(cell['count'])]
+        people = [{**person, 'ageGroup': person['ageGroup'].replace('-', '–')} for person in people]
+        people_results = predict_batch(people, get_predictor_models(models, predictor))
+        risks = np.array([r['eye_risk'] for r in people_results])
+        levels = [r['risk_level'] for r in people_results]
+        expected_mean = round(float(risks.mean()), 4)
+        expected_median = float(np.sort(risks)[math.ceil(0.5 * len(risks)) - 1])
+        expected_levels = {level: float(levels.count(level)) for level in RISK_LEVELS}
+        actual_levels = {level: value['count'] for level, value in result['risk_levels'].items()}
+        if (abs(result['mean_eye_risk'] - expected_mean) > 1e-3 or result['quantiles']['p50'] != expected_median
+                or actual_levels != expected_levels or result['population'] != len(people)
+                or len(result['rejected']) != 1):
+            mismatches.append({'predictor': predictor, 'aggregate': result,
+                               'expected': {'mean': expected_mean, 'p50': expected_median, 'levels': expected_levels}})
+    return mismatches
+
+
+def main():
+    """Aggregate a population JSON file/string, or check against per-person scoring with --check"""
+    if '--check' in sys.argv:
+        mismatches = verify_aggregate_parity()
+        print(json.dumps({
+            "parity": not mismatches,
+            "mismatches": len(mismatches),
+            "examples": mismatches[:2]
+        }, default=str))
+        if mismatches:
+            sys.exit(1)
+        return
+
+    positional = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not positional:
+        print("Usage: python eye_health_aggregate.py POPULATION_JSON | --check", file=sys.stderr)
+        sys.exit(2)
+    try:
+        with open(positional[0], 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+    except OSError:
+        payload = json.loads(positional[0])
+
+    models = screentime.load_eye_models_with_screentime(include_screentime_model=False)
+    if "error" in models:
+        print(json.dumps({"error": models["error"]}))
+        return
+    print(json.dumps(aggregate_population(payload, models)))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
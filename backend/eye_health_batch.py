@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Vectorized Batch Eye Health Prediction
+Scores many records with one predict_proba call and array-based adjustments
+Results match predict_eye_health_risk_final / predict_eye_health_with_screentime
+record for record, in input order
+"""
+import sys
+import json
+import warnings
+
+import numpy as np
+
+from eye_health_predictor_final import (
+    load_eye_models,
+    predict_eye_health_risk_final,
+    get_demographic_adjustments,
+)
+from eye_health_encoding import (
+    get_compiled_eye_encoders, unseen_label_message, invalid_screen_time_message, UNKNOWN_CODE
+)
+from eye_health_metrics import record_fallback, span
+from eye_health_predictor_screentime import (
+    load_eye_models_with_screentime,
+    predict_eye_health_with_screentime,
+    calculate_screen_time_impact,
+)
+
+
+def to_columns(records, defaults):
+    """
+    Normalize a list of dicts or a dict of columns into equal-length columns
+    defaults: field name -> value used when a record omits the field
+    """
+    if isinstance(records, dict):
+        lengths = {len(values) for values in records.values()}
+        if len(lengths) > 1:
+            raise ValueError("All columns must have the same length")
+        n = lengths.pop() if lengths else 0
+        return {
+            field: list(records[field]) if field in records else [default] * n
+            for field, default in defaults.items()
+        }
+
+    return {
+        field: [record.get(field, default) for record in records]
+        for field, default in defaults.items()
+    }
+
+
+def encode_age_groups(age_groups, eye_models):
+    """Encode age groups in one pass; unknown or unhashable values become UNKNOWN_CODE"""
+    return get_compiled_eye_encoders(eye_models)['value'].encode_many(age_groups)
+
+
+def predict_base_probabilities(codes, eye_models):
+    """One predict_proba call over every known code; NaN for unknown codes"""
+    base_prob = np.full(len(codes), np.nan, dtype=np.float64)
+    known = codes != UNKNOWN_CODE
+    if known.any():
+        compiled = get_compiled_eye_encoders(eye_models)
+        X_input = np.empty((int(known.sum()), 3), dtype=np.int64)
+        X_input[:, 0] = compiled['type_code']
+        X_input[:, 1] = codes[known]
+        X_input[:, 2] = compiled['dim_code']
+        base_prob[known] = eye_models['model'].predict_proba(X_input)[:, 1]
+    return base_prob
+
+
+def apply_demographic_adjustments_array(base_risk, sexes):
+    """Array version of apply_demographic_adjustments (sex multiplier, 10-95% clamp)"""
+    sexes = np.asarray(sexes, dtype=object)
+    multiplier = np.where(sexes == 'Male', 1.05, np.where(sexes == 'Female', 0.98, 1.0))
+    adjusted_risk = np.asarray(base_risk, dtype=np.float64) * multiplier
+    # Same comparisons as max(10.0, min(95.0, x)) so edge cases match exactly
+    adjusted_risk = np.where(adjusted_risk < 95.0, adjusted_risk, 95.0)
+    return np.where(adjusted_risk > 10.0, adjusted_risk, 10.0)
+
+
+def apply_screen_time_adjustment_array(base_prob, screen_times):
+    """Array version of apply_screen_time_adjustment (band multiplier, 95% cap)"""
+    screen_times = np.asarray(screen_times, dtype=np.float64)
+    multiplier = np.select(
+        [screen_times <= 2, screen_times <= 4, screen_times <= 6,
+         screen_times <= 8, screen_times <= 10, screen_times <= 12],
+        [0.8, 0.9, 1.0, 1.1, 1.2, 1.3],
+        1.5
+    )
+    adjusted_prob = np.asarray(base_prob, dtype=np.float64) * multiplier
+    return np.where(adjusted_prob < 0.95, adjusted_prob, 0.95)
+
+
+def get_risk_level_array(probability):
+    """Array version of get_risk_level"""
+    probability = np.asarray(probability, dtype=np.float64)
+    return np.select([probability < 0.3, probability < 0.7], ["Low", "Medium"], "High")
+
+
+def get_confidence_score_array(probability):
+    """Array version of get_confidence_score"""
+    probability = np.asarray(probability, dtype=np.float64)
+    return np.select(
+        [(probability < 0.2) | (probability > 0.8), (probability < 0.4) | (probability > 0.6)],
+        ["High", "Medium"],
+        "Low"
+    )
+
+
+def coerce_screen_times(screen_times):
+    """Convert screen times to floats; mark values the scalar path cannot compare"""
+    values = np.empty(len(screen_times), dtype=np.float64)
+    valid = np.ones(len(screen_times), dtype=bool)
+    for i, screen_time in enumerate(screen_times):
+        if isinstance(screen_time, (int, float)):
+            values[i] = screen_time
+        else:
+            values[i] = np.nan
+            valid[i] = False
+    return values, valid
+
+
+def predict_eye_health_risk_final_batch(records, models):
+    """
+    Batch version of predict_eye_health_risk_final
+    records: list of input dicts, or a dict of columns (ageGroup, sex)
+    """
+    columns = to_columns(records, {'ageGroup': '25–34', 'sex': ''})
+    with span('encode'):
+        codes = encode_age_groups(columns['ageGroup'], models['eye'])
+
+    # Unknown age groups fall back to 50% base risk, as predict_age_based_risk does
+    with span('predict_proba'):
+        base_prob = predict_base_probabilities(codes, models['eye'])
+    unknown = int((codes == UNKNOWN_CODE).sum())
+    if unknown:
+        record_fallback('unknown_age_group', unknown)
+
+    with span('adjustment'):
+        base_risk = np.where(codes != UNKNOWN_CODE, base_prob * 100, 50.0)
+        adjusted_risk = apply_demographic_adjustments_array(base_risk, columns['sex'])
+        risk_levels = get_risk_level_array(adjusted_risk / 100)
+        confidences = get_confidence_score_array(adjusted_risk / 100)
+
+    results = []
+    for i, sex in enumerate(columns['sex']):
+        results.append({
+            "eye_risk": round(float(adjusted_risk[i]), 2),
+            "risk_level": str(risk_levels[i]),
+            "confidence": str(confidences[i]),
+            "base_age_risk": float(base_risk[i]),
+            "demographic_adjustments": get_demographic_adjustments({'sex': sex})
+        })
+    return results
+
+
+def predict_eye_health_with_screentime_batch(records, models):
+    """
+    Batch version of predict_eye_health_with_screentime
+    records: list of input dicts, or a dict of columns (ageGroup, screenTime)
+    """
+    columns = to_columns(records, {'ageGroup': '25–34', 'screenTime': 8})
+    original_model = models['eye_original']
+    with span('encode'):
+        codes = encode_age_groups(columns['ageGroup'], original_model)
+        screen_times, valid_screen_times = coerce_screen_times(columns['screenTime'])
+
+    with span('predict_proba'):
+        base_prob = predict_base_probabilities(codes, original_model)
+    with span('adjustment'):
+        adjusted_prob = apply_screen_time_adjustment_array(base_prob, screen_times)
+        risk_levels = get_risk_level_array(adjusted_prob)
+        confidences = get_confidence_score_array(adjusted_prob)
+
+    results = []
+    for i, screen_time in enumerate(columns['screenTime']):
+        if codes[i] == UNKNOWN_CODE:
+            record_fallback('unknown_age_group')
+            error = unseen_label_message(columns['ageGroup'][i])
+        elif not valid_screen_times[i]:
+            record_fallback('original_model_error')
+            error = invalid_screen_time_message(screen_time)
+        else:
+            error = None
+
+        if error:
+            results.append({
+                "eye_risk": 50.0,
+                "risk_level": "Medium",
+                "confidence": "Low",
+                "error": error
+            })
+            continue
+
+        results.append({
+            "eye_risk": round(float(adjusted_prob[i]) * 100, 2),
+            "risk_level": str(risk_levels[i]),
+            "confidence": str(confidences[i]),
+            "model_used": "original_with_screentime_adjustment",
+            "screen_time_impact": calculate_screen_time_impact(screen_time),
+            "base_risk": round(float(base_prob[i]) * 100, 2)
+        })
+    return results
+
+
+def verify_batch_parity():
+    """Compare batch results with the per-record functions over a grid of inputs"""
+    final_models = load_eye_models()
+    screentime_models = load_eye_models_with_screentime()
+    for models in (final_models, screentime_models):
+        if "error" in models:
+            return [{"error": models["error"]}]
+
+    age_groups = final_models['eye']['le_value'].classes_.tolist() + ['25-34', None]
+    records = [
+        {'ageGroup': age_group, 'sex': sex, 'screenTime': screen_time}
+        for age_group in age_groups
+        for sex in ('Male', 'Female', 'Persons')
+        for screen_time in (0, 2, 3.5, 6, 8, 9, 10, 12, 16, 24)
+    ]
+
+    live_final = [predict_eye_health_risk_final(r, final_models) for r in records]
+    live_screentime = [predict_eye_health_with_screentime(r, screentime_models) for r in records]
+    batch_final = predict_eye_health_risk_final_batch(records, final_models)
+    batch_screentime = predict_eye_health_with_screentime_batch(records, screentime_models)
+
+    mismatches = []
+    for record, live, batch in zip(records, live_final, batch_final):
+        if live != batch:
+            mismatches.append({'path': 'final', 'input': record, 'live': live, 'batch': batch})
+    for record, live, batch in zip(records, live_screentime, batch_screentime):
+        if live != batch:
+            mismatches.append({'path': 'screentime', 'input': record, 'live': live, 'batch': batch})
+    return mismatches
+
+
+def main():
+    """Check batch results against the per-record functions (--check)"""
+    if '--check' not in sys.argv:
+        print("Usage: python eye_health_batch.py --check", file=sys.stderr)
+        sys.exit(2)
+
+    mismatches = verify_batch_parity()
+    print(json.dumps({
+        "parity": not mismatches,
+        "mismatches": len(mismatches),
+        "examples": mismatches[:5]
+    }, default=str))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
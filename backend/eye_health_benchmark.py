@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for the eye health prediction paths
+Measures cold-process latency, warm per-record latency, encoding,
+predict_proba, recommendation generation, JSON serialization and batch
+throughput for both predictor scripts, and compares against a saved baseline
+
+The loaders use the compiled bundle when it exists (see eye_health_bundle.py),
+so encode.* and predict_proba.* time whichever backend was loaded. The
+encoder benchmark is named after it (encode.bundle or encode.pickles), the
+backend is recorded under meta.backend, and a baseline taken on another
+backend is refused; set EYE_HEALTH_BUNDLE=off to benchmark the pickles
+
+Usage: python eye_health_benchmark.py [--output PATH] [--baseline PATH]
+       [--threshold 0.10] [--quick]
+"""
+import sys
+import json
+import os
+import time
+import platform
+import statistics
+import subprocess
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+
+import eye_health_predictor_final as final
+import eye_health_predictor_screentime as screentime
+from eye_health_batch import predict_eye_health_risk_final_batch, predict_eye_health_with_screentime_batch
+from eye_health_encoding import get_compiled_eye_encoders
+from eye_health_render import render_final_response, render_screentime_response
+from eye_health_stream import get_option
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_INPUT = {"ageGroup": "45–54", "sex": "Female", "screenTime": 9}
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+AGE_GROUPS = ("0–14", "15–24", "25–34", "35–44", "45–54", "55–64", "65–74", "75–84", "85+")
+
+# Default relative slowdown that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+
+@contextmanager
+def quiet_stderr():
+    """Silence anything the predictor scripts write to stderr (log lines at a low EYE_HEALTH_LOG_LEVEL)"""
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+
+def model_backend(eye):
+    """'bundle' or 'pickles', with the classes the encode and predict_proba benchmarks time"""
+    return {
+        "name": "bundle" if 'bundle_version' in eye else "pickles",
+        "model": type(eye['model']).__name__,
+        "encoder": type(eye['le_value']).__name__,
+    }
+
+
+def summarize(samples):
+    """Latency statistics in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "unit": "ms",
+        "n": len(ordered),
+        "median": round(statistics.median(ordered) * 1000, 6),
+        "mean": round(statistics.fmean(ordered) * 1000, 6),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 6),
+        "min": round(ordered[0] * 1000, 6),
+    }
+
+
+def time_calls(fn, repeat, number):
+    """Per-call seconds for repeat rounds of number calls each"""
+    fn()  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def bench_cold_process(script, repeat):
+    """Wall time of a fresh interpreter running main() once"""
+    samples = []
+    payload = json.dumps(SAMPLE_INPUT)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(BACKEND_DIR, script), payload],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def make_batch(size):
+    """Deterministic records cycling through age groups, sexes and screen times"""
+    return [
+        {"ageGroup": AGE_GROUPS[i % len(AGE_GROUPS)],
+         "sex": ("Male", "Female", "Persons")[i % 3],
+         "screenTime": i % 17}
+        for i in range(size)
+    ]
+
+
+def bench_batch_throughput(predict_batch, models, sizes, min_seconds):
+    """Records per second at each batch size"""
+    results = {}
+    for size in sizes:
+        records = make_batch(size)
+        predict_batch(records, models)  # warm up
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            predict_batch(records, models)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+        results[str(size)] = {"unit": "records/s", "value": round(size * calls / elapsed, 1)}
+    return results
+
+
+def run_benchmarks(quick=False):
+    """Run every benchmark and return a JSON-serializable report"""
+    repeat = 5 if quick else 20
+    number = 50 if quick else 200
+    cold_repeat = 2 if quick else 5
+    min_seconds = 0.2 if quick else 1.0
+
+    final_models = final.load_eye_models()
+    screentime_models = screentime.load_eye_models_with_screentime()
+    for models in (final_models, screentime_models):
+        if "error" in models:
+            raise RuntimeError(models["error"])
+
+    eye = final_models['eye']
+    backend = model_backend(eye)
+    compiled = get_compiled_eye_encoders(eye)
+    age_group = SAMPLE_INPUT['ageGroup']
+    X_input = np.array([[compiled['type_code'], compiled['value'].encode(age_group), compiled['dim_code']]])
+
+    final_result = final.build_eye_health_result(dict(SAMPLE_INPUT), final_models)
+    with quiet_stderr():
+        screentime_result = screentime.build_eye_health_result(dict(SAMPLE_INPUT), screentime_models)
+        screentime_warm = time_calls(
+            lambda: screentime.predict_eye_health_with_screentime(SAMPLE_INPUT, screentime_models),
+            repeat, number)
+
+    final_prediction = {key: value for key, value in final_result.items()
+                        if key not in ('recommendations', 'input_data')}
+    screentime_prediction = {key: value for key, value in screentime_result.items()
+                             if key not in ('recommendations', 'input_data')}
+
+    results = {
+        "final.cold_process": bench_cold_process('eye_health_predictor_final.py', cold_repeat),
+        "screentime.cold_process": bench_cold_process('eye_health_predictor_screentime.py', cold_repeat),
+        "final.warm_predict": summarize(time_calls(
+            lambda: final.predict_eye_health_risk_final(SAMPLE_INPUT, final_models), repeat, number)),
+        "screentime.warm_predict": summarize(screentime_warm),
+        f"encode.{backend['name']}": summarize(time_calls(
+            lambda: (eye['le_type'].transform(['Age']), eye['le_value'].transform([age_group]),
+                     eye['le_dim'].transform(['Unnamed: 2'])), repeat, number)),
+        "encode.compiled": summarize(time_calls(
+            lambda: compiled['value'].encode(age_group), repeat, number)),
+        "predict_proba.single": summarize(time_calls(
+            lambda: eye['model'].predict_proba(X_input), repeat, number)),
+        "recommendations.final": summarize(time_calls(
+            lambda: final.generate_eye_health_recommendations(SAMPLE_INPUT, final_result), repeat, number)),
+        "recommendations.screentime": summarize(time_calls(
+            lambda: screentime.generate_eye_health_recommendations_with_screentime(
+                SAMPLE_INPUT, screentime_result), repeat, number)),
+        "serialize.final": summarize(time_calls(lambda: json.dumps(final_result), repeat, number)),
+        "serialize.screentime": summarize(time_calls(lambda: json.dumps(screentime_result), repeat, number)),
+        "render.final": summarize(time_calls(
+            lambda: render_final_response(SAMPLE_INPUT, final_prediction), repeat, number)),
+        "render.screentime": summarize(time_calls(
+            lambda: render_screentime_response(SAMPLE_INPUT, screentime_prediction), repeat, number)),
+    }
+    for size, value in bench_batch_throughput(predict_eye_health_risk_final_batch, final_models,
+                                              BATCH_SIZES, min_seconds).items():
+        results[f"final.batch_throughput.{size}"] = value
+    for size, value in bench_batch_throughput(predict_eye_health_with_screentime_batch, screentime_models,
+                                              BATCH_SIZES, min_seconds).items():
+        results[f"screentime.batch_throughput.{size}"] = value
+
+    return {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "quick": quick,
+            "backend": backend,
+        },
+        "results": results,
+    }
+
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare medians (lower is better) and throughputs (higher is better)
+    Returns a list of regressions beyond threshold
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or previous.get('unit') != current.get('unit'):
+            continue
+        if current['unit'] == 'ms':
+            before, after = previous['median'], current['median']
+            change = (after - before) / before if before else 0.0
+        else:
+            before, after = previous['value'], current['value']
+            change = (before - after) / before if before else 0.0
+        current['change_vs_baseline'] = round(change, 4)
+        if change > threshold:
+            regressions.append({"benchmark": name, "unit": current['unit'],
+                                "baseline": before, "current": after, "slowdown": round(change, 4)})
+    return regressions
+
+
+def main():
+    """Run the suite, write the JSON report and optionally flag regressions"""
+    argv = sys.argv[1:]
+    report = run_benchmarks(quick='--quick' in argv)
+
+    baseline_path = get_option(argv, '--baseline')
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        baseline_backend = baseline.get('meta', {}).get('backend')
+        backend = report['meta']['backend']
+        if baseline_backend != backend:
+            # encode.* and predict_proba.* would compare different implementations
+            described = (baseline_backend or {}).get('name', 'unknown')
+            print(json.dumps({"error": f"Baseline was taken on the {described} backend, this run on "
+                                       f"{backend['name']}; not comparable", "backend": backend,
+                              "baseline_backend": baseline_backend}))
+            sys.exit(1)
+        threshold = float(get_option(argv, '--threshold', DEFAULT_THRESHOLD))
+        regressions = compare_to_baseline(report, baseline, threshold)
+        report['regressions'] = regressions
+
+    output = json.dumps(report, indent=2)
+    output_path = get_option(argv, '--output')
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    print(output)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
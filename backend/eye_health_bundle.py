@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Versioned single-file model bundle for the eye health predictors
+--build compiles the eye models and their encoders from the loose pickles in
+MODELS_DIR into models/eye_models.bundle: a JSON manifest (format, content
+hash, source pickle hashes, array layout) followed by the flat tree arrays of
+eye_health_trees, the encoder classes as string arrays and the pred_contrib
+tables of eye_health_explain. The predictor
+loaders read the whole file in one call, verify the hash and build the model
+sets from views into that buffer, without unpickling or importing sklearn or
+lightgbm. A missing, corrupt, stale (a source pickle changed) or
+older-format bundle falls back to the pickles
+
+File layout: MAGIC, manifest length (uint64 little endian), manifest JSON,
+payload (arrays, each aligned to ALIGNMENT bytes)
+"""
+import sys
+import json
+import os
+import time
+import struct
+import hashlib
+import logging
+import warnings
+
+from eye_health_startup import lazy_import, load_artifact, timed_phase
+from eye_health_metrics import get_logger, log_event, increment
+
+np = lazy_import('numpy')
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+
+# EYE_HEALTH_BUNDLE overrides the path; 'off' keeps the loaders on the pickles
+BUNDLE_PATH = os.environ.get('EYE_HEALTH_BUNDLE') or os.path.join(MODELS_DIR, 'eye_models.bundle')
+
+MAGIC = b'EYEBNDL\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# Model set -> (model pickle, encoder pickles); the screen time encoders are
+# one pickled dict of LabelEncoders keyed by feature
+BUNDLE_SETS = {
+    'eye': ('eye_model_final.pkl', {
+        'le_type': 'le_type_eye_final.pkl',
+        'le_value': 'le_value_eye_final.pkl',
+        'le_dim': 'le_dim.pkl',
+    }),
+    'eye_screentime': ('eye_model_screentime.pkl', 'eye_encoders_screentime.pkl'),
+}
+
+log = get_logger('bundle')
+
+# path -> ((size, mtime_ns), sha256) of source pickles hashed by check_sources
+_source_hashes = {}
+
+
+class BundleError(Exception):
+    """The bundle file is missing, corrupt or in an unsupported format"""
+
+
+def bundle_enabled(path=BUNDLE_PATH):
+    """Whether the loaders should try the bundle before the pickles"""
+    return path != 'off' and os.path.isfile(path)
+
+
+def file_sha256(path):
+    """SHA-256 of a file's contents"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def file_stat(path):
+    """[size, mtime in ns] of a file, the cheap check before hashing it"""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def content_hash(manifest, payload):
+    """Hash over the manifest (without its hash field) and the payload"""
+    described = {key: value for key, value in manifest.items() if key != 'sha256'}
+    digest = hashlib.sha256(json.dumps(described, sort_keys=True).encode('utf-8'))
+    digest.update(payload)
+    return digest.hexdigest()
+
+
+def bundle_contributions(set_name, model, encoders):
+    """pred_contrib over every reachable encoded cell, so explanations need no lightgbm at load"""
+    from eye_health_explain import compute_contributions, reachable_codes
+
+    if set_name == 'eye_screentime':
+        model_set = {'model': model, 'encoders': encoders}
+    else:
+        model_set = {'model': model, **encoders}
+    return compute_contributions(model, reachable_codes(model_set, set_name)[1], set_name)
+
+
+def compile_bundle_sets(models_dir=MODELS_DIR):
+    """
+    Extract every model set from the pickles
+    Returns ({array name: array}, {set: layout}, {pickle: sha256}, {pickle: [size, mtime_ns]})
+    """
+    from eye_health_trees import extract_tree_arrays, ARRAY_NAMES
+
+    arrays, sets, sources, stats = {}, {}, {}, {}
+    for set_name, (model_file, encoder_files) in BUNDLE_SETS.items():
+        model_path = os.path.join(models_dir, model_file)
+        model = load_artifact(model_path)
+        tree_arrays, meta = extract_tree_arrays(model)
+        sources[model_file] = file_sha256(model_path)
+        stats[model_file] = file_stat(model_path)
+        for name in ARRAY_NAMES:
+            arrays[f"{set_name}/trees/{name}"] = tree_arrays[name]
+
+        if isinstance(encoder_files, dict):
+            encoders = {}
+            for key, filename in encoder_files.items():
+                path = os.path.join(models_dir, filename)
+                encoders[key] = load_artifact(path)
+                sources[filename] = file_sha256(path)
+                stats[filename] = file_stat(path)
+        else:
+            path = os.path.join(models_dir, encoder_files)
+            encoders = load_artifact(path)
+            sources[encoder_files] = file_sha256(path)
+            stats[encoder_files] = file_stat(path)
+
+        for key, encoder in encoders.items():
+            arrays[f"{set_name}/encoders/{key}"] = np.asarray([str(value) for value in encoder.classes_.tolist()])
+        arrays[f"{set_name}/contrib"] = bundle_contributions(set_name, model, encoders)
+        sets[set_name] = {
+            'tree_meta': meta,
+            'encoders': list(encoders),
+            'encoders_as_dict': not isinstance(encoder_files, dict),
+        }
+    return arrays, sets, sources, stats
+
+
+def write_bundle(path=BUNDLE_PATH, models_dir=MODELS_DIR):
+    """Compile the pickles into one bundle file; returns its manifest"""
+    arrays, sets, sources, stats = compile_bundle_sets(models_dir)
+
+    layout, chunks, offset = {}, [], 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        padding = -offset % ALIGNMENT
+        chunks.append(b'\x00' * padding)
+        offset += padding
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        data = array.tobytes()
+        chunks.append(data)
+        offset += len(data)
+    payload = b''.join(chunks)
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'built': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'sources': sources,
+        'source_stats': stats,
+        'sets': sets,
+        'arrays': layout,
+        'payload_bytes': len(payload),
+    }
+    manifest['sha256'] = content_hash(manifest, payload)
+    header = json.dumps(manifest, sort_keys=True).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+    # Write next to the target and rename, so readers never see half a bundle
+    temp_path = f"{path}.tmp{os.getpid()}"
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(payload)
+    os.replace(temp_path, path)
+    return manifest
+
+
+def read_bundle(path=BUNDLE_PATH, verify=True):
+    """
+    Read a bundle in one call and check its hash
+    Returns (manifest, {array name: read-only array view})
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        raise BundleError(f"Cannot read bundle {path}: {e}")
+
+    if data[:len(MAGIC)] != MAGIC or len(data) < len(MAGIC) + 8:
+        raise BundleError(f"{path} is not an eye model bundle")
+    (header_size,) = struct.unpack_from('<Q', data, len(MAGIC))
+    start = len(MAGIC) + 8 + header_size
+    try:
+        manifest = json.loads(data[len(MAGIC) + 8:start])
+    except ValueError as e:
+        raise BundleError(f"Bundle manifest is unreadable: {e}")
+    if manifest.get('format') != FORMAT_VERSION:
+        raise BundleError(f"Bundle format {manifest.get('format')} is not supported (expected {FORMAT_VERSION})")
+
+    payload = memoryview(data)[start:]
+    if len(payload) != manifest['payload_bytes']:
+        raise BundleError(f"Bundle is truncated: {len(payload)} of {manifest['payload_bytes']} payload bytes")
+    if verify and content_hash(manifest, payload) != manifest['sha256']:
+        raise BundleError("Bundle content hash does not match its manifest")
+
+    arrays = {}
+    for name, spec in manifest['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        arrays[name] = np.frombuffer(payload, dtype=dtype, count=count,
+                                     offset=spec['offset']).reshape(spec['shape'])
+    return manifest, arrays
+
+
+def source_matches(path, digest, built_stat=None):
+    """
+    Whether the file at path still has the sha256 digest it was built from
+    A file whose [size, mtime_ns] equals built_stat is not read; one that was
+    touched is hashed once per size and mtime
+    """
+    stat = file_stat(path)
+    if stat == built_stat:
+        return True
+    cached = _source_hashes.get(path)
+    if cached is None or cached[0] != stat:
+        cached = _source_hashes[path] = (stat, file_sha256(path))
+    return cached[1] == digest
+
+
+def check_sources(manifest, models_dir=MODELS_DIR):
+    """
+    Raise BundleError when a source pickle changed since the bundle was built,
+    so new .pkl files are never shadowed by an older bundle
+    """
+    built_stats = manifest.get('source_stats', {})
+    for filename, digest in manifest['sources'].items():
+        path = os.path.join(models_dir, filename)
+        if not os.path.isfile(path):
+            continue
+        if not source_matches(path, digest, built_stats.get(filename)):
+            raise BundleError(f"Bundle is stale: {filename} changed since it was built "
+                              f"(run eye_health_bundle.py --build)")
+
+
+def build_model_sets(manifest, arrays, set_names):
+    """Model set dicts in the loaders' layout (TreeEnsemble model, compiled encoders)"""
+    from eye_health_trees import TreeEnsemble, ARRAY_NAMES
+    from eye_health_encoding import CompiledEncoder
+
+    model_sets = {}
+    for set_name in set_names:
+        layout = manifest['sets'][set_name]
+        tree_arrays = {name: arrays[f"{set_name}/trees/{name}"] for name in ARRAY_NAMES}
+        encoders = {key: CompiledEncoder(arrays[f"{set_name}/encoders/{key}"].tolist())
+                    for key in layout['encoders']}
+        model_set = {'model': TreeEnsemble(tree_arrays, layout['tree_meta'])}
+        if layout['encoders_as_dict']:
+            model_set['encoders'] = encoders
+        else:
+            model_set.update(encoders)
+        if f"{set_name}/contrib" in arrays:
+            model_set['contrib'] = arrays[f"{set_name}/contrib"]
+        model_set['bundle_version'] = manifest['sha256'][:12]
+        model_sets[set_name] = model_set
+    return model_sets
+
+
+def load_bundle_models(set_names, path=BUNDLE_PATH):
+    """
+    Model sets from the bundle, or None when the loaders should fall back to
+    the pickles (no bundle, or one that fails verification)
+    """
+    if not bundle_enabled(path):
+        return None
+    try:
+        with timed_phase('load:bundle'):
+            manifest, arrays = read_bundle(path)
+            check_sources(manifest)
+            return build_model_sets(manifest, arrays, set_names)
+    except (BundleError, KeyError, ValueError) as e:
+        increment('bundle.fallback')
+        log_event(log, logging.WARNING, 'bundle_rejected', path=path, error=str(e))
+        return None
+
+
+def verify_bundle(path=BUNDLE_PATH):
+    """
+    Check the bundle against the pickles: source hashes, encoder classes and
+    predict_proba over every encoded input
+    """
+    from eye_health_trees import encoded_input_space
+
+    manifest, arrays = read_bundle(path)
+    model_sets = build_model_sets(manifest, arrays, BUNDLE_SETS)
+    mismatches = []
+
+    for filename, digest in manifest['sources'].items():
+        current = file_sha256(os.path.join(MODELS_DIR, filename))
+        if current != digest:
+            mismatches.append({'source': filename, 'bundle': digest, 'current': current})
+
+    for set_name, (model_file, encoder_files) in BUNDLE_SETS.items():
+        if isinstance(encoder_files, dict):
+            encoders = {key: load_artifact(os.path.join(MODELS_DIR, filename))
+                        for key, filename in encoder_files.items()}
+            bundled = {key: model_sets[set_name][key] for key in encoders}
+        else:
+            encoders = load_artifact(os.path.join(MODELS_DIR, encoder_files))
+            bundled = model_sets[set_name]['encoders']
+        for key, encoder in encoders.items():
+            if list(encoder.classes_) != bundled[key].classes_.tolist():
+                mismatches.append({'set': set_name, 'encoder': key})
+
+        if 'contrib' in model_sets[set_name]:
+            expected = bundle_contributions(set_name, load_artifact(os.path.join(MODELS_DIR, model_file)), encoders)
+            if not np.array_equal(expected, model_sets[set_name]['contrib']):
+                mismatches.append({'set': set_name, 'contrib': 'differs from pred_contrib'})
+
+        X = encoded_input_space(list(encoders.values()))
+        expected = load_artifact(os.path.join(MODELS_DIR, model_file)).predict_proba(X)
+        actual = model_sets[set_name]['model'].predict_proba(X)
+        for row in np.flatnonzero(np.any(expected != actual, axis=1)):
+            mismatches.append({'set': set_name, 'input': X[row].tolist(),
+                               'bundle': actual[row].tolist(), 'expected': expected[row].tolist()})
+    return manifest, mismatches
+
+
+def main():
+    """Build the bundle (--build) or check it against the pickles (--check)"""
+    if '--build' in sys.argv:
+        manifest = write_bundle()
+        print(json.dumps({
+            "path": BUNDLE_PATH,
+            "version": manifest['sha256'][:12],
+            "bytes": os.path.getsize(BUNDLE_PATH),
+            "sources": manifest['sources'],
+        }))
+        return
+
+    if '--check' in sys.argv:
+        try:
+            manifest, mismatches = verify_bundle()
+        except BundleError as e:
+            print(json.dumps({"parity": False, "error": str(e)}))
+            sys.exit(1)
+        print(json.dumps({
+            "version": manifest['sha256'][:12],
+            "parity": not mismatches,
+            "mismatches": len(mismatches),
+            "examples": mismatches[:5]
+        }))
+        if mismatches:
+            sys.exit(1)
+        return
+
+    print("Usage: python eye_health_bundle.py --build | --check", file=sys.stderr)
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
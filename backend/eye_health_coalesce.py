@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Adaptive micro-batching of concurrent single-record predictions
+Threads that call Coalescer.predict at about the same time are scored with
+one batch call (one encoding pass and one predict_proba over an n x 3
+matrix) instead of one call each, and every caller gets its own result back
+
+There is no fixed timer: the first caller scores at once, and requests that
+arrive while a batch is being scored form the next batch. Only when the
+previous batch held more than one record (the predictor is under concurrent
+load) does the next one wait for more callers, for at most the recent batch
+scoring time and never longer than --batch-window-ms, or until --max-batch
+records are queued. A lone request is therefore never delayed, and a batch
+of one is scored with the per-record function it would have used anyway
+
+Enabled with --coalesce on --worker and on eye_health_server.py
+"""
+import sys
+import json
+import time
+import threading
+import warnings
+
+from eye_health_metrics import increment, register_section
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_BATCH_WINDOW_MS = 2.0
+# Weight of the newest batch in the moving average of scoring time
+SCORING_TIME_ALPHA = 0.2
+
+
+class PendingPrediction:
+    """One caller's record, waiting to be scored in some batch"""
+    __slots__ = ('record', 'models', 'result', 'error', 'done')
+
+    def __init__(self, record, models):
+        self.record = record
+        self.models = models
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+class Coalescer:
+    """
+    Collects concurrent predict() calls into batches for predict_batch
+    predict_batch: function(records, models) -> one result per record, in order
+    (the eye_health_batch functions)
+    predict_one: function(record, models) -> result, used for batches of one
+    """
+
+    def __init__(self, predict_batch, predict_one, max_batch=DEFAULT_MAX_BATCH,
+                 batch_window_ms=DEFAULT_BATCH_WINDOW_MS, name='coalesce'):
+        self.predict_batch = predict_batch
+        self.predict_one = predict_one
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(batch_window_ms)) / 1000
+        self.name = name
+        self.queue = []
+        self.scoring = False
+        self.condition = threading.Condition()
+        self.last_batch_size = 0
+        self.scoring_time = 0.0
+        self.state = {'batches': 0, 'records': 0, 'largest_batch': 0, 'waited_batches': 0}
+        register_section(name, self.stats)
+
+    def predict(self, record, models):
+        """Score one record, sharing the batch call with concurrent callers"""
+        pending = PendingPrediction(record, models)
+        with self.condition:
+            self.queue.append(pending)
+            if len(self.queue) >= self.max_batch:
+                # Wake a leader waiting out the batch window
+                self.condition.notify_all()
+            while not pending.done:
+                if self.scoring:
+                    self.condition.wait()
+                    continue
+                # Nothing being scored: this caller scores the next batch
+                self.scoring = True
+                batch = self.take_batch()
+                self.condition.release()
+                try:
+                    self.score(batch)
+                finally:
+                    self.condition.acquire()
+                    self.scoring = False
+                    self.condition.notify_all()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def batch_window(self):
+        """Seconds the next batch waits for more callers; 0 unless under concurrent load"""
+        if self.last_batch_size <= 1 or not self.max_wait:
+            return 0.0
+        return min(self.max_wait, self.scoring_time)
+
+    def take_batch(self):
+        """Wait out the adaptive window, then dequeue up to max_batch records (lock held)"""
+        window = self.batch_window()
+        if window and len(self.queue) < self.max_batch:
+            self.state['waited_batches'] += 1
+            deadline = time.perf_counter() + window
+            while len(self.queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+        # A reload can leave records for two model sets queued; score them separately
+        models = self.queue[0].models
+        batch, rest = [], []
+        for pending in self.queue:
+            if pending.models is models and len(batch) < self.max_batch:
+                batch.append(pending)
+            else:
+                rest.append(pending)
+        self.queue = rest
+        return batch
+
+    def score(self, batch):
+        """One predict_batch call for the whole batch; results go back to each caller"""
+        started = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                results = [self.predict_one(batch[0].record, batch[0].models)]
+            else:
+                results = self.predict_batch([pending.record for pending in batch], batch[0].models)
+            for pending, result in zip(batch, results):
+                pending.result = result
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        elapsed = time.perf_counter() - started
+
+        for pending in batch:
+            pending.done = True
+        self.last_batch_size = len(batch)
+        self.scoring_time += SCORING_TIME_ALPHA * (elapsed - self.scoring_time)
+        self.state['batches'] += 1
+        self.state['records'] += len(batch)
+        self.state['largest_batch'] = max(self.state['largest_batch'], len(batch))
+        increment(f'{self.name}.batches')
+        increment(f'{self.name}.records', len(batch))
+
+    def stats(self):
+        """Batching state for the metrics snapshot"""
+        batches = self.state['batches']
+        return {
+            **self.state,
+            'mean_batch': round(self.state['records'] / batches, 2) if batches else 0.0,
+            'scoring_ms': round(self.scoring_time * 1000, 4),
+            'window_ms': round(self.batch_window() * 1000, 4)
+        }
+
+
+def coalesce_options(argv):
+    """(max_batch, batch_window_ms) from --max-batch and --batch-window-ms"""
+    from eye_health_stream import get_option
+
+    return (int(get_option(argv, '--max-batch', DEFAULT_MAX_BATCH)),
+            float(get_option(argv, '--batch-window-ms', DEFAULT_BATCH_WINDOW_MS)))
+
+
+def with_coalescing(load_models, predict_batch, predict_one, argv, name='coalesce'):
+    """
+    Wrap a script's model loader so the loaded models carry a Coalescer
+    Lookup-table and shadow model sets are left alone: they have their own paths
+    """
+    max_batch, batch_window_ms = coalesce_options(argv)
+
+    def load():
+        models = load_models()
+        if "error" in models or 'risk_table' in models or 'shadow' in models:
+            return models
+        models['coalescer'] = Coalescer(predict_batch, predict_one, max_batch, batch_window_ms, name)
+        return models
+    return load
+
+
+def verify_coalesce_parity(threads=16, rounds=20):
+    """Score a grid of inputs from concurrent threads and compare with the per-record path"""
+    from concurrent.futures import ThreadPoolExecutor
+    import eye_health_predictor_final as final
+    import eye_health_predictor_screentime as screentime
+    from eye_health_batch import (
+        predict_eye_health_risk_final_batch, predict_eye_health_with_screentime_batch
+    )
+
+    age_groups = ['0–14', '15–24', '25–34', '45–54', '65–74', '85+', 'unknown']
+    records = [{'ageGroup': age_group, 'sex': sex, 'screenTime': screen_time}
+               for age_group in age_groups
+               for sex in ('Male', 'Female', 'Persons', '')
+               for screen_time in (0, 3, 7.5, 12)]
+
+    cases = [
+        (final, final.load_eye_models(), predict_eye_health_risk_final_batch,
+         final.predict_eye_health_risk_final),
+        (screentime, screentime.load_eye_models_with_screentime(include_screentime_model=False),
+         predict_eye_health_with_screentime_batch, screentime.predict_eye_health_with_screentime),
+    ]
+    mismatches, examples, largest_batch = 0, [], 0
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for module, models, predict_batch, predict_one in cases:
+            expected = [module.build_eye_health_result(dict(record), models) for record in records]
+            coalesced = dict(models, coalescer=Coalescer(predict_batch, predict_one, name='coalesce.check'))
+            for _ in range(rounds):
+                results = list(executor.map(
+                    lambda record: module.build_eye_health_result(dict(record), coalesced), records))
+                for record, want, got in zip(records, expected, results):
+                    if json.dumps(want) != json.dumps(got):
+                        mismatches += 1
+                        if len(examples) < 5:
+                            examples.append({"script": module.__name__, "input": record,
+                                             "expected": want, "coalesced": got})
+            largest_batch = max(largest_batch, coalesced['coalescer'].state['largest_batch'])
+    return {"parity": mismatches == 0, "mismatches": mismatches,
+            "largest_batch": largest_batch, "examples": examples}
+
+
+def main():
+    """--check: concurrent coalesced results match the per-record path"""
+    if '--check' in sys.argv[1:]:
+        report = verify_coalesce_parity()
+        print(json.dumps(report, ensure_ascii=False))
+        sys.exit(0 if report["parity"] else 1)
+    print(json.dumps({"error": "Usage: python eye_health_coalesce.py --check"}))
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
@@ -0,0 +1,118 @@
+"""
+Compiled category encoders for the eye health predictors
+Turns each fitted LabelEncoder into a plain dict lookup at load time, folds
+constant feature codes in once, and encodes batches without sklearn's
+per-call input validation
+"""
+from eye_health_startup import lazy_import
+
+np = lazy_import('numpy')
+
+# Code returned for categories the encoder was not fitted on
+UNKNOWN_CODE = -1
+
+# Constant inputs of the original eye model
+EYE_TYPE = 'Age'
+EYE_DIMENSION = 'Unnamed: 2'
+
+
+def unseen_label_message(value):
+    """Error text for a category an encoder was not fitted on (every predictor path)"""
+    return f"Unknown category: {value!r}"
+
+
+def invalid_screen_time_message(screen_time):
+    """Error text for a screen time that is not a number (every predictor path)"""
+    return f"screenTime must be a number, got {type(screen_time).__name__}"
+
+
+def check_screen_time(screen_time):
+    """Raise TypeError with invalid_screen_time_message unless screen_time is an int or float"""
+    if not isinstance(screen_time, (int, float)):
+        raise TypeError(invalid_screen_time_message(screen_time))
+    return screen_time
+
+
+class CompiledEncoder:
+    """Dict-backed stand-in for a fitted LabelEncoder"""
+
+    def __init__(self, classes):
+        self.classes_ = np.asarray(classes)
+        self.index = {value: code for code, value in enumerate(self.classes_.tolist())}
+
+    def encode(self, value):
+        """Code for one value, UNKNOWN_CODE when unseen or unhashable"""
+        try:
+            return self.index.get(value, UNKNOWN_CODE)
+        except TypeError:
+            return UNKNOWN_CODE
+
+    def encode_many(self, values):
+        """Codes for a sequence of values, looking each distinct value up once"""
+        cache = {}
+        codes = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            try:
+                code = cache.get(value)
+                if code is None:
+                    code = cache[value] = self.index.get(value, UNKNOWN_CODE)
+            except TypeError:
+                code = UNKNOWN_CODE
+            codes[i] = code
+        return codes
+
+    def transform(self, values):
+        """LabelEncoder.transform semantics: raise ValueError on unseen labels"""
+        codes = self.encode_many(values)
+        if (codes == UNKNOWN_CODE).any():
+            unseen = [value for value, code in zip(values, codes) if code == UNKNOWN_CODE]
+            raise ValueError(unseen_label_message(unseen[0]))
+        return codes
+
+    def inverse_transform(self, codes):
+        """Categories for codes"""
+        return self.classes_[np.asarray(codes)]
+
+
+def compile_encoder(encoder):
+    """Compile a fitted LabelEncoder (or an already compiled one)"""
+    if isinstance(encoder, CompiledEncoder):
+        return encoder
+    return CompiledEncoder(encoder.classes_.tolist())
+
+
+def compile_eye_encoders(eye_models):
+    """
+    Compile the original eye model's encoders and fold in its constant codes
+    eye_models: models['eye'] or models['eye_original']
+    """
+    le_type = compile_encoder(eye_models['le_type'])
+    le_dim = compile_encoder(eye_models['le_dim'])
+    return {
+        'type_code': int(le_type.transform([EYE_TYPE])[0]),
+        'dim_code': int(le_dim.transform([EYE_DIMENSION])[0]),
+        'value': compile_encoder(eye_models['le_value'])
+    }
+
+
+def attach_compiled_encoders(models):
+    """Add compiled encoders to every model set a loader returned"""
+    if "error" in models:
+        return models
+    for key in ('eye', 'eye_original'):
+        if key in models:
+            models[key]['compiled'] = compile_eye_encoders(models[key])
+    if 'eye_screentime' in models and isinstance(models['eye_screentime'].get('encoders'), dict):
+        models['eye_screentime']['compiled'] = {
+            name: compile_encoder(encoder)
+            for name, encoder in models['eye_screentime']['encoders'].items()
+        }
+    return models
+
+
+def get_compiled_eye_encoders(eye_models):
+    """Compiled encoders for a model set, compiling on first use if the loader did not"""
+    compiled = eye_models.get('compiled')
+    if compiled is None:
+        compiled = eye_models['compiled'] = compile_eye_encoders(eye_models)
+    return compiled
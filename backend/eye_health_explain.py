@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Per-feature risk explanations for the eye health predictors
+LightGBM's pred_contrib (SHAP values in log-odds) is computed once for every
+encoded input cell of each eye model at load time and kept with the models,
+next to the cell's predict_proba; an explanation is then an index into those
+tables plus the script's sex or screen time adjustment. The model bundle
+carries the tables precomputed, so bundle-loaded workers never import lightgbm
+
+Request: the analyze payload, e.g. {"ageGroup": "25–34", "sex": "Female", "screenTime": 9}
+"""
+import sys
+import json
+import math
+import os
+import logging
+import warnings
+
+import numpy as np
+
+from eye_health_startup import load_artifact, timed_phase
+from eye_health_encoding import get_compiled_eye_encoders, compile_encoder
+from eye_health_metrics import get_logger, log_event, increment
+from eye_health_validation import get_validator, invalid_result
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+
+# Model set -> pickle holding the LightGBM model the contributions come from
+MODEL_FILES = {'eye': 'eye_model_final.pkl', 'eye_screentime': 'eye_model_screentime.pkl'}
+
+# Request field behind each encoded feature of the original eye model
+# (type and dimension are fixed by the service)
+EYE_FEATURE_INPUTS = ('type', 'ageGroup', 'dimension')
+SCREENTIME_ROLE_INPUTS = {'age': 'ageGroup', 'gender': 'sex', 'screen': 'screenTime'}
+
+log = get_logger('explain')
+
+
+def encoded_grid(feature_codes):
+    """Every combination of the given codes per feature, one row each, C order"""
+    grids = np.meshgrid(*feature_codes, indexing='ij')
+    return np.column_stack([grid.ravel() for grid in grids])
+
+
+def reachable_codes(model_set, set_name):
+    """
+    (compiled encoders, sorted code array per feature) in the model's feature
+    order; the original eye model only ever sees its constant type and
+    dimension codes, so only its age codes vary
+    """
+    if set_name == 'eye':
+        compiled = get_compiled_eye_encoders(model_set)
+        encoders = [compile_encoder(model_set[key]) for key in ('le_type', 'le_value', 'le_dim')]
+        codes = [np.array([compiled['type_code']]), np.arange(len(encoders[1].classes_)),
+                 np.array([compiled['dim_code']])]
+        return encoders, codes
+
+    from eye_health_shadow import resolve_screentime_pipeline
+    encoders = model_set.get('compiled') or model_set['encoders']
+    encoders = [compile_encoder(encoders[key]) for key in resolve_screentime_pipeline(model_set)['encoder_keys']]
+    return encoders, [np.arange(len(encoder.classes_)) for encoder in encoders]
+
+
+def compute_contributions(model, feature_codes, set_name):
+    """
+    pred_contrib over the grid of feature_codes, shaped (*grid, n_features + 1)
+    with the bias last; models without a LightGBM booster (the NumPy
+    evaluator) are explained from their pickle
+    """
+    if not hasattr(model, 'booster_'):
+        log_event(log, logging.WARNING, 'contributions_from_pickle', model=MODEL_FILES[set_name])
+        model = load_artifact(os.path.join(MODELS_DIR, MODEL_FILES[set_name]))
+    contrib = model.predict(encoded_grid(feature_codes), pred_contrib=True)
+    return np.asarray(contrib, dtype=np.float64).reshape(*[len(codes) for codes in feature_codes], -1)
+
+
+def build_contribution_table(model_set, set_name):
+    """Contributions and predict_proba for every reachable encoded cell of one model set"""
+    model = model_set['model']
+    encoders, feature_codes = reachable_codes(model_set, set_name)
+    shape = tuple(len(codes) for codes in feature_codes)
+
+    # The bundle ships the contributions; use them when they fit the encoders
+    contrib = model_set.get('contrib')
+    if contrib is None or contrib.shape[:-1] != shape:
+        contrib = compute_contributions(model, feature_codes, set_name)
+    prob = model.predict_proba(encoded_grid(feature_codes))[:, 1].reshape(shape)
+
+    names = getattr(model, 'feature_name_', None) or model.meta['feature_names']
+    return {
+        'features': list(names),
+        'classes': [encoder.classes_.tolist() for encoder in encoders],
+        'codes': feature_codes,
+        'contrib': contrib,
+        'prob': prob,
+    }
+
+
+def cell_index(table, codes):
+    """Table index for encoded codes per feature (scalars or arrays)"""
+    return tuple(np.searchsorted(table['codes'][column], code) for column, code in enumerate(codes))
+
+
+def attach_contributions(models):
+    """Precompute the contribution tables of every eye model set a loader returned"""
+    if "error" in models:
+        return models
+    with timed_phase('load:contributions'):
+        for key, set_name in (('eye', 'eye'), ('eye_original', 'eye'), ('eye_screentime', 'eye_screentime')):
+            if key in models and 'contributions' not in models[key]:
+                models[key]['contributions'] = build_contribution_table(models[key], set_name)
+    return models
+
+
+def with_explanations(load_models):
+    """Wrap a script's model loader so the loaded models carry contribution tables"""
+    def load():
+        return attach_contributions(load_models())
+    return load
+
+
+def sigmoid(raw_score):
+    """Probability for a raw log-odds score"""
+    return 1.0 / (1.0 + math.exp(-raw_score))
+
+
+def explain_cell(model_name, table, codes, inputs, weights=None):
+    """
+    Explanation of one model for encoded codes (index arrays allowed)
+    weights: averaging weights over the rows codes select, e.g. every gender
+    """
+    index = cell_index(table, codes)
+    contrib = table['contrib'][index]
+    prob = table['prob'][index]
+    if weights is not None:
+        contrib = np.tensordot(weights, contrib, axes=1)
+        prob = float(np.dot(weights, prob))
+    contributions = []
+    for column, name in enumerate(table['features']):
+        code = np.unique(codes[column])
+        contributions.append({
+            "feature": name,
+            "input": inputs[column],
+            # None for a feature that was averaged over
+            "value": table['classes'][column][code[0]] if len(code) == 1 else None,
+            "log_odds": round(float(contrib[column]), 6),
+        })
+    contributions.sort(key=lambda item: -abs(item['log_odds']))
+    return {
+        "model": model_name,
+        "baseline_log_odds": round(float(contrib[-1]), 6),
+        "baseline_risk": round(sigmoid(float(contrib[-1])) * 100, 2),
+        "model_risk": round(float(prob) * 100, 2),
+        "contributions": contributions,
+    }
+
+
+def explain_original_model(data, eye_models):
+    """(base probability, explanation) of the original eye model for a record"""
+    compiled = get_compiled_eye_encoders(eye_models)
+    age_group = data.get('ageGroup', '25–34')
+    codes = (compiled['type_code'], compiled['value'].encode(age_group), compiled['dim_code'])
+    table = eye_models['contributions']
+    explanation = explain_cell('eye_model_final', table, codes, EYE_FEATURE_INPUTS)
+    return float(table['prob'][cell_index(table, codes)]), explanation
+
+
+def explain_screentime_model(data, screentime_models):
+    """Explanation of eye_model_screentime.pkl for a record (Persons averages the genders)"""
+    from eye_health_shadow import resolve_screentime_pipeline, encode_pipeline_columns, ALL_GENDERS
+
+    pipeline = screentime_models.get('pipeline')
+    if pipeline is None:
+        pipeline = screentime_models['pipeline'] = resolve_screentime_pipeline(screentime_models)
+    age, gender, screen, valid = encode_pipeline_columns(
+        pipeline, [data.get('ageGroup', '25–34')], [data.get('sex', 'Male')], [data.get('screenTime', 8)])
+    if not valid[0]:
+        return None
+
+    columns = pipeline['columns']
+    codes = [0, 0, 0]
+    codes[columns['age']] = int(age[0])
+    codes[columns['screen']] = int(screen[0])
+    inputs = [None] * 3
+    for role, column in columns.items():
+        inputs[column] = SCREENTIME_ROLE_INPUTS[role]
+
+    weights = None
+    if gender[0] == ALL_GENDERS:
+        classes = pipeline['gender_classes']
+        codes[columns['gender']] = classes
+        codes = tuple(np.broadcast_to(code, classes.shape) for code in codes)
+        weights = np.full(len(classes), 1.0 / len(classes))
+    else:
+        codes[columns['gender']] = int(gender[0])
+        codes = tuple(codes)
+    return explain_cell('eye_model_screentime', screentime_models['contributions'], codes, inputs, weights)
+
+
+def explain_final(payload, models):
+    """Worker op for the final script: prediction plus its explanation"""
+    import eye_health_predictor_final as final
+
+    data, errors = get_validator(models, final.VALIDATED_FIELDS).validate(payload or dict(final.DEFAULT_INPUT))
+    if errors:
+        return invalid_result(errors)
+    increment('explain.requests')
+
+    base_prob, explanation = explain_original_model(data, models['eye'])
+    base_risk = base_prob * 100
+    adjusted_risk = final.apply_demographic_adjustments(base_risk, data)
+    explanation['adjustments'] = [
+        {"input": field, **adjustment, "risk_change": round(adjusted_risk - base_risk, 2)}
+        for field, adjustment in final.get_demographic_adjustments(data).items()
+    ]
+    return {
+        "eye_risk": round(adjusted_risk, 2),
+        "risk_level": final.get_risk_level(adjusted_risk / 100),
+        "confidence": final.get_confidence_score(adjusted_risk / 100),
+        "base_age_risk": base_risk,
+        "demographic_adjustments": final.get_demographic_adjustments(data),
+        "explanation": explanation,
+    }
+
+
+def explain_screentime(payload, models):
+    """Worker op for the screen time script: prediction plus its explanation"""
+    import eye_health_predictor_screentime as screentime
+
+    data, errors = get_validator(models, screentime.VALIDATED_FIELDS).validate(payload or dict(screentime.DEFAULT_INPUT))
+    if errors:
+        return invalid_result(errors)
+    increment('explain.requests')
+
+    screen_time = data.get('screenTime', 8)
+    base_prob, explanation = explain_original_model(data, models['eye_original'])
+    adjusted_prob = screentime.apply_screen_time_adjustment(base_prob, screen_time)
+    explanation['adjustments'] = [{
+        "input": 'screenTime',
+        "value": screen_time,
+        "impact": screentime.calculate_screen_time_impact(screen_time),
+        "risk_change": round((adjusted_prob - base_prob) * 100, 2),
+    }]
+    if 'eye_screentime' in models:
+        explanation['screentime_model'] = explain_screentime_model(data, models['eye_screentime'])
+    return {
+        "eye_risk": round(adjusted_prob * 100, 2),
+        "risk_level": screentime.get_risk_level(adjusted_prob),
+        "confidence": screentime.get_confidence_score(adjusted_prob),
+        "model_used": "original_with_screentime_adjustment",
+        "base_risk": round(base_prob * 100, 2),
+        "explanation": explanation,
+    }
+
+
+def verify_explain_parity():
+    """
+    Explanations against the live predictors: the prediction fields must match
+    and each model's contributions must add up to its raw score
+    """
+    import eye_health_predictor_final as final
+    import eye_health_predictor_screentime as screentime
+
+    models = attach_contributions(screentime.load_eye_models_with_screentime())
+    final_models = {'eye': models['eye_original'], 'validators': {}}
+    age_groups = models['eye_original']['contributions']['classes'][1]
+    mismatches = []
+
+    def check_additivity(explanation, data):
+        raw = explanation['baseline_log_odds'] + sum(item['log_odds'] for item in explanation['contributions'])
+        model_risk = sigmoid(raw) * 100
+        # Contributions are rounded for display
+        if abs(model_risk - explanation['model_risk']) > 0.01:
+            mismatches.append({'input': data, 'model': explanation['model'],
+                               'model_risk': explanation['model_risk'], 'from_contributions': model_risk})
+
+    for age_group in age_groups:
+        for sex in ('Male', 'Female', 'Persons', ''):
+            data = {'ageGroup': age_group, 'sex': sex}
+            explained = explain_final(data, final_models)
+            expected = final.predict_eye_health_risk_final(data, final_models)
+            fields = {key: explained[key] for key in expected}
+            if fields != expected:
+                mismatches.append({'input': data, 'explain': fields, 'expected': expected})
+            check_additivity(explained['explanation'], data)
+
+            for screen_time in (1, 5, 8, 11, 16):
+                data = {'ageGroup': age_group, 'sex': sex or 'Male', 'screenTime': screen_time}
+                explained = explain_screentime(data, models)
+                expected = screentime.predict_with_original_model_and_screentime_adjustment(
+                    data, models['eye_original'])
+                fields = {key: explained[key] for key in expected if key != 'screen_time_impact'}
+                if fields != {key: value for key, value in expected.items() if key != 'screen_time_impact'}:
+                    mismatches.append({'input': data, 'explain': fields, 'expected': expected})
+                check_additivity(explained['explanation'], data)
+                if explained['explanation'].get('screentime_model'):
+                    check_additivity(explained['explanation']['screentime_model'], data)
+    return mismatches
+
+
+def main():
+    """Explain a JSON record with the screen time script's models, or check parity with --check"""
+    if '--check' in sys.argv:
+        mismatches = verify_explain_parity()
+        print(json.dumps({
+            "parity": not mismatches,
+            "mismatches": len(mismatches),
+            "examples": mismatches[:5]
+        }, default=str))
+        if mismatches:
+            sys.exit(1)
+        return
+
+    from eye_health_predictor_screentime import load_eye_models_with_screentime
+    positional = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    models = with_explanations(load_eye_models_with_screentime)()
+    if "error" in models:
+        print(json.dumps({"error": models["error"]}))
+        return
+    print(json.dumps(explain_screentime(json.loads(positional[0]) if positional else {}, models),
+                     ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
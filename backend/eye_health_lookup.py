@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Precomputed Eye Health Risk Lookup Table
+Scores every (age group, sex, screen-time band) cell once with predict_proba
+so per-request prediction becomes an array lookup
+"""
+import sys
+import json
+import hashlib
+import os
+import logging
+import warnings
+
+import numpy as np
+
+from eye_health_predictor_final import (
+    MODELS_DIR,
+    load_eye_models,
+    predict_eye_health_risk_final,
+    apply_demographic_adjustments,
+    get_demographic_adjustments,
+    get_risk_level,
+    get_confidence_score,
+)
+from eye_health_encoding import get_compiled_eye_encoders, unseen_label_message, check_screen_time
+from eye_health_metrics import get_logger, log_event
+from eye_health_predictor_screentime import (
+    predict_with_original_model_and_screentime_adjustment,
+    apply_screen_time_adjustment,
+    calculate_screen_time_impact,
+)
+
+log = get_logger('lookup')
+
+TABLE_PATH = os.path.join(MODELS_DIR, 'eye_risk_table.npz')
+
+# Sex axis: index 2 covers every other value (no adjustment)
+SEX_VALUES = ('Male', 'Female', '')
+
+# One representative screen time per band of apply_screen_time_adjustment
+SCREEN_TIME_BAND_VALUES = (2, 4, 6, 8, 10, 12, 24)
+
+
+def get_sex_index(sex):
+    """Map a sex value to its table axis index"""
+    if sex == 'Male':
+        return 0
+    elif sex == 'Female':
+        return 1
+    else:
+        return 2
+
+
+def get_screen_time_band(screen_time):
+    """Map a screen time to its band index (same thresholds as the adjustment)"""
+    if screen_time <= 2:
+        return 0
+    elif screen_time <= 4:
+        return 1
+    elif screen_time <= 6:
+        return 2
+    elif screen_time <= 8:
+        return 3
+    elif screen_time <= 10:
+        return 4
+    elif screen_time <= 12:
+        return 5
+    else:
+        return 6
+
+
+def model_fingerprint(path=None):
+    """SHA-256 of the model file the table was built from"""
+    path = path or os.path.join(MODELS_DIR, 'eye_model_final.pkl')
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_risk_table(eye_models):
+    """
+    Score every age group code once and derive all adjusted cells
+    eye_models: models['eye'] from load_eye_models() (or models['eye_original'])
+    """
+    value_classes = np.asarray(eye_models['le_value'].classes_)
+    n_values = len(value_classes)
+
+    compiled = get_compiled_eye_encoders(eye_models)
+    type_enc = compiled['type_code']
+    dim_enc = compiled['dim_code']
+
+    X_all = np.empty((n_values, 3), dtype=np.int64)
+    X_all[:, 0] = type_enc
+    X_all[:, 1] = np.arange(n_values)
+    X_all[:, 2] = dim_enc
+    base_prob = eye_models['model'].predict_proba(X_all)[:, 1].astype(np.float64)
+
+    # Derive adjusted cells with the live scalar functions so every cell
+    # goes through exactly the same floating point operations
+    final_risk = np.empty((n_values, len(SEX_VALUES)), dtype=np.float64)
+    screentime_prob = np.empty((n_values, len(SCREEN_TIME_BAND_VALUES)), dtype=np.float64)
+    for i in range(n_values):
+        base_risk = base_prob[i] * 100
+        for j, sex in enumerate(SEX_VALUES):
+            final_risk[i, j] = apply_demographic_adjustments(base_risk, {'sex': sex})
+        for k, screen_time in enumerate(SCREEN_TIME_BAND_VALUES):
+            screentime_prob[i, k] = apply_screen_time_adjustment(base_prob[i], screen_time)
+
+    return {
+        'value_classes': value_classes,
+        'value_index': {value: i for i, value in enumerate(value_classes.tolist())},
+        'base_prob': base_prob,
+        'final_risk': final_risk,
+        'screentime_prob': screentime_prob,
+    }
+
+
+def save_risk_table(table, path=TABLE_PATH):
+    """Write the table as a build artifact, stamped with the model fingerprint"""
+    np.savez(
+        path,
+        value_classes=table['value_classes'].astype(str),
+        base_prob=table['base_prob'],
+        final_risk=table['final_risk'],
+        screentime_prob=table['screentime_prob'],
+        fingerprint=np.array(model_fingerprint()),
+    )
+
+
+def load_risk_table(eye_models, path=TABLE_PATH):
+    """Load the prebuilt table if it matches the current model, else build it"""
+    if os.path.isfile(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                value_classes = data['value_classes']
+                if (str(data['fingerprint']) == model_fingerprint()
+                        and value_classes.tolist() == list(eye_models['le_value'].classes_)):
+                    return {
+                        'value_classes': value_classes,
+                        'value_index': {value: i for i, value in enumerate(value_classes.tolist())},
+                        'base_prob': data['base_prob'],
+                        'final_risk': data['final_risk'],
+                        'screentime_prob': data['screentime_prob'],
+                    }
+        except Exception as e:
+            log_event(log, logging.WARNING, 'risk_table_load_failed', error=str(e), hint='rebuilding')
+    return build_risk_table(eye_models)
+
+
+def with_risk_table(load_models):
+    """Wrap a script's model loader so the loaded models carry a risk table"""
+    def load():
+        models = load_models()
+        if "error" in models:
+            return models
+        eye_models = models['eye'] if 'eye' in models else models['eye_original']
+        models['risk_table'] = load_risk_table(eye_models)
+        return models
+    return load
+
+
+def predict_final_from_table(data, table):
+    """Table-backed equivalent of predict_eye_health_risk_final"""
+    try:
+        age_group = data.get('ageGroup', '25–34')
+        sex = data.get('sex', '')
+        index = table['value_index'].get(age_group)
+        if index is None:
+            # Same fallback as predict_age_based_risk for unknown age groups
+            base_risk = 50.0
+            adjusted_risk = apply_demographic_adjustments(base_risk, data)
+        else:
+            base_risk = table['base_prob'][index] * 100
+            adjusted_risk = table['final_risk'][index, get_sex_index(sex)]
+
+        adjusted_risk = float(adjusted_risk)
+        return {
+            "eye_risk": round(adjusted_risk, 2),
+            "risk_level": get_risk_level(adjusted_risk / 100),
+            "confidence": get_confidence_score(adjusted_risk / 100),
+            "base_age_risk": float(base_risk),
+            "demographic_adjustments": get_demographic_adjustments(data)
+        }
+
+    except Exception as e:
+        return {
+            "eye_risk": 50.0,
+            "risk_level": "Medium",
+            "confidence": "Low",
+            "error": str(e)
+        }
+
+
+def predict_screentime_from_table(data, table):
+    """Table-backed equivalent of predict_with_original_model_and_screentime_adjustment"""
+    try:
+        age_group = data.get('ageGroup', '25–34')
+        screen_time = data.get('screenTime', 8)
+
+        index = table['value_index'].get(age_group)
+        if index is None:
+            raise ValueError(unseen_label_message(age_group))
+
+        base_prob = float(table['base_prob'][index])
+        adjusted_prob = float(table['screentime_prob'][index, get_screen_time_band(check_screen_time(screen_time))])
+
+        return {
+            "eye_risk": round(adjusted_prob * 100, 2),
+            "risk_level": get_risk_level(adjusted_prob),
+            "confidence": get_confidence_score(adjusted_prob),
+            "model_used": "original_with_screentime_adjustment",
+            "screen_time_impact": calculate_screen_time_impact(screen_time),
+            "base_risk": round(base_prob * 100, 2)
+        }
+
+    except Exception as e:
+        return {
+            "eye_risk": 50.0,
+            "risk_level": "Medium",
+            "confidence": "Low",
+            "error": str(e)
+        }
+
+
+def verify_table_parity(table, models):
+    """
+    Compare every table cell against the live model path
+    Returns a list of mismatches (empty when the table is bit-for-bit identical)
+    """
+    mismatches = []
+    original_model = models['eye']
+    screen_times = (0, 1.5, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 12.5, 16, 24)
+
+    for age_group in table['value_classes'].tolist():
+        for sex in ('Male', 'Female', 'Persons', ''):
+            data = {'ageGroup': age_group, 'sex': sex}
+            live = predict_eye_health_risk_final(data, models)
+            cached = predict_final_from_table(data, table)
+            if live != cached:
+                mismatches.append({'path': 'final', 'input': data, 'live': live, 'table': cached})
+
+        for screen_time in screen_times:
+            data = {'ageGroup': age_group, 'screenTime': screen_time}
+            live = predict_with_original_model_and_screentime_adjustment(data, original_model)
+            cached = predict_screentime_from_table(data, table)
+            if live != cached:
+                mismatches.append({'path': 'screentime', 'input': data, 'live': live, 'table': cached})
+
+    return mismatches
+
+
+def main():
+    """Build the table artifact (--build) or check it against the live model (--check)"""
+    models = load_eye_models()
+    if "error" in models:
+        print(json.dumps({"error": models["error"]}))
+        sys.exit(1)
+
+    if '--build' in sys.argv:
+        table = build_risk_table(models['eye'])
+        save_risk_table(table)
+        print(json.dumps({
+            "table": TABLE_PATH,
+            "age_groups": len(table['value_classes']),
+            "cells": int(table['final_risk'].size + table['screentime_prob'].size)
+        }))
+        return
+
+    table = load_risk_table(models['eye'])
+    mismatches = verify_table_parity(table, models)
+    print(json.dumps({
+        "parity": not mismatches,
+        "mismatches": len(mismatches),
+        "examples": mismatches[:5]
+    }, default=str))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
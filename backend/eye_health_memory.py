@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Memory footprint of the eye health predictors and the slim serving profile
+--profile loads a script's models in this process and reports the retained
+size of every artifact and the process RSS at start, after load and after
+--requests N predictions; --compare runs the default and slim profiles in
+fresh processes side by side. Workers and eye_health_server.py report the
+same under "memory" in the metrics snapshot
+
+--slim keeps only what predict_proba needs: the flattened tree arrays and
+dict encoders of the bundle, without the screen time model set that only
+--shadow uses. When there is no usable bundle, a child process compiles one
+into a temporary file, so lightgbm, sklearn and scipy are never imported by
+the serving process. --check compares slim results with the LightGBM pickles
+"""
+import sys
+import os
+import gc
+import json
+import types
+import logging
+import tempfile
+import subprocess
+import warnings
+
+from eye_health_startup import lazy_import, load_artifact, timed_phase
+from eye_health_bundle import load_bundle_models, BUNDLE_SETS, MODELS_DIR
+from eye_health_encoding import attach_compiled_encoders, compile_encoder
+from eye_health_metrics import register_section, get_logger, log_event
+
+np = lazy_import('numpy')
+
+log = get_logger('memory')
+
+BUNDLE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eye_health_bundle.py')
+
+# Imports that dominate a predictor's RSS, reported when present
+REPORTED_MODULES = ('numpy', 'joblib', 'sklearn', 'scipy', 'lightgbm', 'pandas')
+
+# Not counted towards an artifact: shared by the whole process
+SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                types.MethodType)
+
+DEFAULT_PROFILE_REQUESTS = 1000
+
+
+def windows_memory_counters():
+    """GetProcessMemoryInfo counters of this process, None when unavailable"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                    'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                    'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters
+    except (ImportError, AttributeError, OSError):
+        return None
+
+
+def max_rss_from_rusage():
+    """ru_maxrss in bytes, None where the resource module does not exist (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """Resident set size of this process (working set on Windows); None when unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if sys.platform == 'win32':
+        counters = windows_memory_counters()
+        return counters.WorkingSetSize if counters is not None else None
+    # Peak rather than current RSS where /proc is unavailable
+    return max_rss_from_rusage()
+
+
+def peak_rss_bytes():
+    """Highest RSS this process has reached; None when unknown"""
+    if sys.platform == 'win32':
+        counters = windows_memory_counters()
+        return counters.PeakWorkingSetSize if counters is not None else None
+    return max_rss_from_rusage()
+
+
+def megabytes(size):
+    """Bytes as MB, one decimal (None stays None)"""
+    return round(size / 1048576, 1) if size is not None else None
+
+
+def native_model_bytes(obj):
+    """
+    Size of the C++ model a LightGBM Booster holds outside the Python heap,
+    estimated from its text dump (0 for anything else)
+    """
+    if type(obj).__name__ != 'Booster' or not hasattr(obj, 'model_to_string'):
+        return 0
+    try:
+        return len(obj.model_to_string())
+    except Exception:
+        return 0
+
+
+def retained_bytes(obj):
+    """
+    Bytes reachable from obj: Python objects, NumPy buffers (only the viewed
+    slice of a shared buffer) and LightGBM's native model; classes, modules
+    and functions belong to the process and are not counted
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, np.ndarray):
+            # An owning array's getsizeof includes its data; a view counts its slice
+            if item.base is not None:
+                total += item.nbytes
+            continue
+        total += native_model_bytes(item)
+        stack.extend(gc.get_referents(item))
+    return total
+
+
+def artifact_sizes(models):
+    """Retained KB per artifact: {model set: {key: KB}}, other entries {key: KB}"""
+    sizes = {}
+    for name, value in models.items():
+        if isinstance(value, dict):
+            sizes[name] = {str(key): round(retained_bytes(item) / 1024, 1) for key, item in value.items()}
+        else:
+            sizes[name] = round(retained_bytes(value) / 1024, 1)
+    return sizes
+
+
+def imported_modules():
+    """Which of the heavy libraries this process has imported"""
+    # A lazy_import module is a ModuleType subclass until its first use executes it
+    return [name for name in REPORTED_MODULES if type(sys.modules.get(name)) is types.ModuleType]
+
+
+def release_memory():
+    """Collect load-time garbage and hand freed heap pages back to the OS (glibc)"""
+    gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def track_memory(get_models):
+    """
+    Report memory under "memory" in the metrics snapshot
+    get_models: function returning the serving model set (it can be swapped)
+    """
+    rss_after_load = current_rss_bytes()
+    sizes = {}
+
+    def report():
+        models = get_models()
+        if id(models) not in sizes:
+            sizes.clear()
+            sizes[id(models)] = artifact_sizes(models)
+        return {
+            "rss_after_load_mb": megabytes(rss_after_load),
+            "rss_mb": megabytes(current_rss_bytes()),
+            "peak_rss_mb": megabytes(peak_rss_bytes()),
+            "modules": imported_modules(),
+            "artifacts_kb": sizes[id(models)]
+        }
+    register_section('memory', report)
+
+
+def compile_bundle_in_child(set_names):
+    """
+    Model sets compiled by a child `eye_health_bundle.py --build` into a
+    temporary file and read back here, so the pickles (and lightgbm, sklearn)
+    are only ever loaded by the child; None when the child fails
+    """
+    handle, path = tempfile.mkstemp(prefix='eye_models.', suffix='.bundle')
+    os.close(handle)
+    try:
+        with timed_phase('load:bundle_compile'):
+            completed = subprocess.run([sys.executable, BUNDLE_SCRIPT, '--build'],
+                                       env={**os.environ, 'EYE_HEALTH_BUNDLE': path},
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=300)
+        if completed.returncode != 0:
+            log_event(log, logging.WARNING, 'bundle_compile_failed',
+                      returncode=completed.returncode,
+                      stderr=completed.stderr.decode(errors='replace')[-500:])
+            return None
+        return load_bundle_models(set_names, path=path)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log_event(log, logging.WARNING, 'bundle_compile_failed', error=str(e))
+        return None
+    finally:
+        os.unlink(path)
+
+
+def compile_set_encoders(models):
+    """Replace fitted LabelEncoders with compiled ones, so no sklearn objects are retained"""
+    for model_set in models.values():
+        for key in ('le_type', 'le_value', 'le_dim'):
+            if key in model_set:
+                model_set[key] = compile_encoder(model_set[key])
+        if isinstance(model_set.get('encoders'), dict):
+            model_set['encoders'] = {name: compile_encoder(encoder)
+                                     for name, encoder in model_set['encoders'].items()}
+    return attach_compiled_encoders(models)
+
+
+def load_slim_sets(set_names):
+    """Bundle model sets: the built bundle when usable, else one compiled by a child process"""
+    bundle = load_bundle_models(set_names)
+    if bundle is None:
+        bundle = compile_bundle_in_child(set_names)
+    return bundle
+
+
+def load_eye_models_slim():
+    """load_eye_models() with only the bundle's tree arrays and dict encoders"""
+    from eye_health_render import get_final_table
+
+    bundle = load_slim_sets(['eye'])
+    if bundle is None:
+        # No child could compile the bundle: flatten the pickle in this process
+        from eye_health_trees import load_eye_models_trees
+        models = load_eye_models_trees(mmap=False)
+        if "error" not in models:
+            models = compile_set_encoders(models)
+    else:
+        models = attach_compiled_encoders({'eye': bundle['eye']})
+    if "error" not in models:
+        get_final_table()
+        release_memory()
+    return models
+
+
+def load_eye_models_with_screentime_slim(include_screentime_model=False):
+    """
+    load_eye_models_with_screentime() with only the bundle's tree arrays and
+    dict encoders; the screen time model set is released unless requested
+    """
+    from eye_health_render import get_screentime_table
+
+    set_names = ['eye', 'eye_screentime'] if include_screentime_model else ['eye']
+    bundle = load_slim_sets(set_names)
+    if bundle is None:
+        from eye_health_trees import load_eye_models_with_screentime_trees
+        models = load_eye_models_with_screentime_trees(include_screentime_model, mmap=False)
+        if "error" not in models:
+            models = compile_set_encoders(models)
+    else:
+        bundle['eye_original'] = bundle.pop('eye')
+        models = attach_compiled_encoders(bundle)
+    if "error" not in models:
+        get_screentime_table()
+        release_memory()
+    return models
+
+
+def load_pickled_sets():
+    """Every bundle model set straight from the LightGBM/sklearn pickles"""
+    model_sets = {}
+    for set_name, (model_file, encoder_files) in BUNDLE_SETS.items():
+        model_set = {'model': load_artifact(os.path.join(MODELS_DIR, model_file))}
+        if isinstance(encoder_files, dict):
+            for key, filename in encoder_files.items():
+                model_set[key] = load_artifact(os.path.join(MODELS_DIR, filename))
+        else:
+            model_set['encoders'] = load_artifact(os.path.join(MODELS_DIR, encoder_files))
+        model_sets[set_name] = model_set
+    return model_sets
+
+
+def script_loaders(script, slim):
+    """(module, load) for a predictor script: final or screentime"""
+    if script == 'final':
+        import eye_health_predictor_final as module
+        return module, load_eye_models_slim if slim else module.load_eye_models
+    import eye_health_predictor_screentime as module
+    if slim:
+        return module, load_eye_models_with_screentime_slim
+    return module, module.load_eye_models_with_screentime
+
+
+def profile_records(count):
+    """Request records cycling through every age group, sex and screen time band"""
+    from eye_health_reload import EYE_GOLDEN_INPUTS
+    return [EYE_GOLDEN_INPUTS[i % len(EYE_GOLDEN_INPUTS)] for i in range(count)]
+
+
+def profile_memory(script='screentime', slim=False, requests=DEFAULT_PROFILE_REQUESTS, rss_at_start=None):
+    """
+    RSS at start, after load and after `requests` predictions, plus artifact sizes
+    rss_at_start: RSS measured by the caller when the process started
+    """
+    module, load = script_loaders(script, slim)
+    rss_before_load = current_rss_bytes()
+    models = load()
+    if "error" in models:
+        return {"error": models["error"]}
+    rss_after_load = current_rss_bytes()
+    for record in profile_records(requests):
+        module.render_eye_health_result(dict(record), models)
+    return {
+        "script": script,
+        "profile": 'slim' if slim else 'default',
+        "rss_mb": {
+            "start": megabytes(rss_at_start),
+            "before_load": megabytes(rss_before_load),
+            "after_load": megabytes(rss_after_load),
+            f"after_{requests}_requests": megabytes(current_rss_bytes()),
+            "peak": megabytes(peak_rss_bytes()),
+        },
+        "modules": imported_modules(),
+        "artifacts_kb": artifact_sizes(models)
+    }
+
+
+def compare_profiles(requests=DEFAULT_PROFILE_REQUESTS):
+    """profile_memory for each script and profile, with and without the bundle, in fresh processes"""
+    results = []
+    for bundle in ('on', 'off'):
+        for script in ('final', 'screentime'):
+            for slim in (False, True):
+                env = dict(os.environ)
+                if bundle == 'off':
+                    env['EYE_HEALTH_BUNDLE'] = 'off'
+                argv = [sys.executable, os.path.abspath(__file__), '--profile', '--script', script,
+                        '--requests', str(requests)] + (['--slim'] if slim else [])
+                completed = subprocess.run(argv, env=env, capture_output=True, text=True)
+                report = json.loads(completed.stdout) if completed.stdout.strip() else {
+                    "error": completed.stderr[-500:]}
+                results.append({"bundle": bundle, **report})
+    return results
+
+
+def verify_slim_parity():
+    """Compare slim results (analyze, render, explain) with models loaded from the pickles"""
+    import eye_health_predictor_final as final
+    import eye_health_predictor_screentime as screentime
+    from eye_health_explain import attach_contributions, explain_final, explain_screentime
+    from eye_health_reload import EYE_GOLDEN_INPUTS
+
+    pickled = load_pickled_sets()
+    reference = {
+        'final': attach_contributions(attach_compiled_encoders({'eye': pickled['eye']})),
+        'screentime': attach_contributions(attach_compiled_encoders({'eye_original': dict(pickled['eye'])})),
+    }
+    slim = {
+        'final': attach_contributions(load_eye_models_slim()),
+        'screentime': attach_contributions(load_eye_models_with_screentime_slim()),
+    }
+    records = EYE_GOLDEN_INPUTS + [{}, {'ageGroup': 'unknown', 'sex': 'Male', 'screenTime': 4},
+                                   {'ageGroup': '45–54', 'screenTime': 0.5}]
+    cases = [
+        ('final', final.build_eye_health_result), ('final', final.render_eye_health_result),
+        ('final', explain_final), ('screentime', screentime.build_eye_health_result),
+        ('screentime', screentime.render_eye_health_result), ('screentime', explain_screentime),
+    ]
+    mismatches, examples = 0, []
+    for script, function in cases:
+        for record in records:
+            expected = function(dict(record), reference[script])
+            actual = function(dict(record), slim[script])
+            if json.dumps(expected) != json.dumps(actual):
+                mismatches += 1
+                if len(examples) < 5:
+                    examples.append({"function": f"{script}.{function.__name__}", "input": record,
+                                     "expected": expected, "slim": actual})
+    return {"parity": mismatches == 0, "mismatches": mismatches, "examples": examples}
+
+
+def main():
+    """--profile [--script final|screentime] [--slim] [--requests N], --compare or --check"""
+    from eye_health_stream import get_option
+
+    rss_at_start = current_rss_bytes()
+    argv = sys.argv[1:]
+    requests = int(get_option(argv, '--requests', DEFAULT_PROFILE_REQUESTS))
+    if '--check' in argv:
+        report = verify_slim_parity()
+        print(json.dumps(report, ensure_ascii=False))
+        sys.exit(0 if report["parity"] else 1)
+    if '--compare' in argv:
+        print(json.dumps(compare_profiles(requests), ensure_ascii=False))
+        return
+    if '--profile' in argv:
+        report = profile_memory(get_option(argv, '--script', 'screentime'), '--slim' in argv, requests,
+                                rss_at_start)
+        print(json.dumps(report, ensure_ascii=False))
+        sys.exit(1 if "error" in report else 0)
+    print("Usage: python eye_health_memory.py --profile [--script final|screentime] [--slim] "
+          "[--requests N] | --compare | --check", file=sys.stderr)
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
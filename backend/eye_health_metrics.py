@@ -0,0 +1,184 @@
+"""
+Instrumentation for the eye health predictor scripts
+Level-gated structured logging, timing spans and counters that can be
+exported as a JSON metrics snapshot
+
+Log level: EYE_HEALTH_LOG_LEVEL (DEBUG, INFO, WARNING, ERROR; default WARNING)
+Log lines go to stderr as one JSON object each, so stdout stays pure JSON
+"""
+import sys
+import json
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+LOG_LEVEL_ENV = 'EYE_HEALTH_LOG_LEVEL'
+DEFAULT_LOG_LEVEL = 'WARNING'
+
+# Stages timed on the request path
+SPAN_NAMES = ('load', 'encode', 'predict_proba', 'adjustment', 'recommendations', 'serialization')
+
+_spans = {}
+_counters = {}
+_sections = {}
+_started = time.time()
+# Guards _counters and _spans: server threads record concurrently
+_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    # Never fork while another thread holds the lock (prefork workers would inherit it held)
+    os.register_at_fork(before=_lock.acquire, after_in_parent=_lock.release,
+                        after_in_child=_lock.release)
+
+
+class StderrHandler(logging.StreamHandler):
+    """Writes to whatever sys.stderr is at emit time, so redirections apply"""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per log record"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None):
+    """Attach the JSON stderr handler to the 'eye_health' logger (once)"""
+    logger = logging.getLogger('eye_health')
+    if not logger.handlers:
+        handler = StderrHandler()
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    level = level or os.environ.get(LOG_LEVEL_ENV, DEFAULT_LOG_LEVEL)
+    logger.setLevel(getattr(logging, str(level).upper(), logging.WARNING))
+    return logger
+
+
+def get_logger(name):
+    """Child logger of the configured 'eye_health' logger"""
+    configure_logging()
+    return logging.getLogger(f"eye_health.{name}")
+
+
+def log_event(logger, level, event, exc_info=False, **fields):
+    """
+    Emit a structured event if the level is enabled
+    Callers pass raw values; nothing is formatted when the level is off
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+
+def increment(name, amount=1):
+    """Add to a named counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_fallback(reason, amount=1):
+    """Count eye_risk 50.0 fallback results by reason"""
+    increment('fallback.total', amount)
+    increment(f"fallback.{reason}", amount)
+
+
+def add_span(name, count, total, longest):
+    """Add timings to a named span (lock held)"""
+    stats = _spans.get(name)
+    if stats is None:
+        stats = _spans[name] = [0, 0.0, 0.0]
+    stats[0] += count
+    stats[1] += total
+    if longest > stats[2]:
+        stats[2] = longest
+
+
+def record_span(name, seconds):
+    """Add one timing to a named span"""
+    with _lock:
+        add_span(name, 1, seconds, seconds)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block under a named span"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def metrics_snapshot():
+    """Counters and per-span timings (milliseconds) as a JSON-serializable dict"""
+    with _lock:
+        counters = dict(_counters)
+        recorded = [(name, tuple(stats)) for name, stats in _spans.items()]
+    spans = {}
+    for name, (count, total, longest) in recorded:
+        spans[name] = {
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total * 1000 / count, 4) if count else 0.0,
+            "max_ms": round(longest * 1000, 3),
+        }
+    return {
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - _started, 1),
+        "counters": counters,
+        "spans": spans,
+        **{name: provider() for name, provider in _sections.items()},
+    }
+
+
+def register_section(name, provider):
+    """Include provider() under name in every metrics snapshot"""
+    _sections[name] = provider
+
+
+def take_metrics():
+    """
+    Counters and raw span totals recorded since the last call, then clear them
+    Forked workers send these to the parent with every reply
+    """
+    with _lock:
+        delta = (dict(_counters), {name: list(stats) for name, stats in _spans.items()})
+        _spans.clear()
+        _counters.clear()
+    return delta
+
+
+def merge_metrics(delta):
+    """Add counters and spans taken with take_metrics in another process"""
+    counters, spans = delta
+    with _lock:
+        for name, amount in counters.items():
+            _counters[name] = _counters.get(name, 0) + amount
+        for name, (count, total, longest) in spans.items():
+            add_span(name, count, total, longest)
+
+
+def reset_metrics():
+    """Clear counters and spans"""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
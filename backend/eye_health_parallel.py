@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Multi-process Sharded Eye Health Scoring
+Splits a large NDJSON/CSV file into line-aligned byte ranges, scores them in a
+ProcessPoolExecutor whose workers load the models once, and merges the shard
+outputs in input order
+
+Usage: python eye_health_parallel.py INPUT --output PATH [--predictor screentime|final]
+       [--workers N] [--shards N] [--format ndjson|csv] [--chunk-size N] [--trees]
+"""
+import sys
+import json
+import os
+import warnings
+import time
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from eye_health_stream import get_option, read_ndjson, read_csv, score_stream, DEFAULT_CHUNK_SIZE
+from eye_health_render import render_final_response, render_screentime_response
+
+# Per-process state set by the pool initializer
+_worker = {}
+
+# Error results carry shard-relative line numbers until the merge step
+ERROR_LINE_PATTERN = re.compile(rb'^\{"error": "Line (\d+):')
+
+
+def get_predictor(name, use_trees=False):
+    """Loader, batch function, result renderer, default input and batch validator for a predictor"""
+    if name == 'final':
+        import eye_health_predictor_final as predictor
+        from eye_health_batch import predict_eye_health_risk_final_batch as predict_batch
+        load = predictor.load_eye_models
+        if use_trees:
+            from eye_health_trees import load_eye_models_trees as load
+        return load, predict_batch, render_final_response, predictor.DEFAULT_INPUT, predictor.validate_batch
+
+    if name == 'screentime':
+        import eye_health_predictor_screentime as predictor
+        from eye_health_batch import predict_eye_health_with_screentime_batch as predict_batch
+        load = predictor.load_eye_models_with_screentime
+        if use_trees:
+            from eye_health_trees import load_eye_models_with_screentime_trees as load
+        return (lambda: load(include_screentime_model=False), predict_batch,
+                render_screentime_response, predictor.DEFAULT_INPUT, predictor.validate_batch)
+
+    raise ValueError(f"Unknown predictor: {name}")
+
+
+def plan_shards(path, n_shards, skip_header=False):
+    """
+    Split a file into at most n_shards byte ranges that start and end on line boundaries
+    Returns (header_line, [(start, end), ...])
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline() if skip_header else b''
+        data_start = len(header)
+
+        boundaries = [data_start]
+        for i in range(1, n_shards):
+            target = data_start + (size - data_start) * i // n_shards
+            if target <= boundaries[-1]:
+                continue
+            f.seek(target - 1)
+            # Finish the line containing target - 1 so the next shard starts cleanly
+            f.readline()
+            position = f.tell()
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+        boundaries.append(size)
+
+    shards = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return header.decode('utf-8'), shards
+
+
+def iter_range_lines(path, start, end, counter=None):
+    """Yield decoded lines whose first byte lies in [start, end), counting them in counter"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                return
+            position += len(line)
+            if counter is not None:
+                counter['lines'] += 1
+            yield line.decode('utf-8')
+
+
+def init_worker(predictor_name, use_trees):
+    """Pool initializer: load the models once per worker process"""
+    load, predict_batch, render_result, default_input, validate = get_predictor(predictor_name, use_trees)
+    models = load()
+    if "error" in models:
+        raise RuntimeError(models["error"])
+    _worker.update({
+        'models': models,
+        'predict_batch': predict_batch,
+        'render_result': render_result,
+        'default_input': default_input,
+        'validate': validate,
+    })
+
+
+def score_shard(shard_index, path, start, end, header, input_format, chunk_size, output_dir):
+    """Score one byte range into its own output file and report throughput"""
+    started = time.perf_counter()
+    counter = {'lines': 0}
+    lines = iter_range_lines(path, start, end, counter)
+    if input_format == 'csv':
+        entries = read_csv(iter_with_header(header, lines))
+    else:
+        entries = read_ndjson(lines)
+
+    output_path = os.path.join(output_dir, f"shard-{shard_index:05d}.ndjson")
+    with open(output_path, 'w', encoding='utf-8') as out:
+        counts = score_stream(entries, _worker['models'], _worker['predict_batch'],
+                              _worker['render_result'], _worker['default_input'],
+                              out, chunk_size, _worker['validate'])
+
+    seconds = time.perf_counter() - started
+    records = counts['scored'] + counts['rejected']
+    return {
+        "shard": shard_index,
+        "pid": os.getpid(),
+        "output": output_path,
+        "records": records,
+        "rejected": counts['rejected'],
+        "lines": counter['lines'],
+        "seconds": round(seconds, 4),
+        "records_per_second": round(records / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def copy_shard_output(report, line_offset, out):
+    """Append a shard's output, shifting error line numbers to file positions"""
+    with open(report['output'], 'rb') as shard_file:
+        if not report['rejected'] or not line_offset:
+            shutil.copyfileobj(shard_file, out)
+            return
+        for line in shard_file:
+            match = ERROR_LINE_PATTERN.match(line)
+            if match:
+                line_number = int(match.group(1)) + line_offset
+                line = b'{"error": "Line %d:' % line_number + line[match.end():]
+            out.write(line)
+
+
+def iter_with_header(header, lines):
+    """Prefix a shard's lines with the CSV header"""
+    if header:
+        yield header
+    yield from lines
+
+
+def score_file_parallel(path, output_path, predictor_name='screentime', workers=None,
+                        shards=None, input_format=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                        use_trees=False):
+    """Score a file across worker processes and merge the results in order"""
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
+    if input_format is None:
+        input_format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+    started = time.perf_counter()
+    header, ranges = plan_shards(path, shards, skip_header=(input_format == 'csv'))
+
+    output_dir = tempfile.mkdtemp(prefix='eye_health_shards_',
+                                  dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(predictor_name, use_trees)) as executor:
+            futures = [
+                executor.submit(score_shard, i, path, start, end, header,
+                                input_format, chunk_size, output_dir)
+                for i, (start, end) in enumerate(ranges)
+            ]
+            shard_reports = [future.result() for future in futures]
+
+        # Shards were planned in file order, so concatenating keeps input order
+        with open(output_path, 'wb') as out:
+            line_offset = 0
+            for report in shard_reports:
+                copy_shard_output(report, line_offset, out)
+                line_offset += report['lines']
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    seconds = time.perf_counter() - started
+    per_worker = {}
+    for report in shard_reports:
+        stats = per_worker.setdefault(report['pid'], {"shards": 0, "records": 0, "seconds": 0.0})
+        stats['shards'] += 1
+        stats['records'] += report['records']
+        stats['seconds'] += report['seconds']
+    for stats in per_worker.values():
+        stats['seconds'] = round(stats['seconds'], 4)
+        stats['records_per_second'] = (round(stats['records'] / stats['seconds'], 1)
+                                       if stats['seconds'] > 0 else None)
+
+    records = sum(report['records'] for report in shard_reports)
+    return {
+        "records": records,
+        "rejected": sum(report['rejected'] for report in shard_reports),
+        "shards": len(shard_reports),
+        "workers": workers,
+        "seconds": round(seconds, 4),
+        "records_per_second": round(records / seconds, 1) if seconds > 0 else None,
+        "per_worker": {str(pid): stats for pid, stats in per_worker.items()},
+    }
+
+
+def main():
+    """Command line driver"""
+    argv = sys.argv[1:]
+    output_path = get_option(argv, '--output')
+    if not argv or argv[0].startswith('--') or not output_path:
+        print("Usage: python eye_health_parallel.py INPUT --output PATH [--predictor screentime|final] "
+              "[--workers N] [--shards N] [--format ndjson|csv] [--chunk-size N] [--trees]",
+              file=sys.stderr)
+        sys.exit(2)
+
+    try:
+        workers = get_option(argv, '--workers')
+        workers = int(workers) if workers is not None else None
+        shards = get_option(argv, '--shards')
+        shards = int(shards) if shards is not None else None
+        chunk_size = int(get_option(argv, '--chunk-size', DEFAULT_CHUNK_SIZE))
+    except ValueError:
+        print(json.dumps({"error": "--workers, --shards and --chunk-size must be integers"}))
+        sys.exit(2)
+    if chunk_size < 1 or (workers is not None and workers < 1) or (shards is not None and shards < 1):
+        print(json.dumps({"error": "--workers, --shards and --chunk-size must be positive integers"}))
+        sys.exit(2)
+
+    summary = score_file_parallel(
+        argv[0], output_path,
+        predictor_name=get_option(argv, '--predictor', 'screentime'),
+        workers=workers,
+        shards=shards,
+        input_format=get_option(argv, '--format'),
+        chunk_size=chunk_size,
+        use_trees='--trees' in argv,
+    )
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
@@ -5,28 +5,44 @@ Uses age-based analysis with demographic adjustments
 """
 import sys
 import json
-import joblib
-import numpy as np
 import os
 import warnings
+import logging
 
-# Suppress sklearn warnings
-warnings.filterwarnings('ignore')
+from eye_health_startup import lazy_import, load_artifact, timed_phase, startup_report
+from eye_health_bundle import load_bundle_models, bundle_enabled
+from eye_health_encoding import attach_compiled_encoders, get_compiled_eye_encoders, UNKNOWN_CODE
+from eye_health_metrics import get_logger, log_event, record_fallback, span, metrics_snapshot
+from eye_health_validation import get_validator, invalid_result
+from eye_health_render import get_final_recommendations, render_final_response, get_final_table
+
+# Heavy imports are deferred until first use (see --startup-report)
+np = lazy_import('numpy')
 
 # Get model file paths
 MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
 
+# Structured stderr logging, gated by EYE_HEALTH_LOG_LEVEL
+log = get_logger('final')
+
 def load_eye_models():
     """Load eye health model and encoders"""
     models = {}
     try:
-        models['eye'] = {
-            'model': joblib.load(os.path.join(MODELS_DIR, 'eye_model_final.pkl')),
-            'le_type': joblib.load(os.path.join(MODELS_DIR, 'le_type_eye_final.pkl')),
-            'le_value': joblib.load(os.path.join(MODELS_DIR, 'le_value_eye_final.pkl')),
-            'le_dim': joblib.load(os.path.join(MODELS_DIR, 'le_dim.pkl'))
-        }
-        return models
+        # One read of the compiled bundle when it is built and intact
+        bundle = load_bundle_models(['eye'])
+        if bundle is not None:
+            models['eye'] = bundle['eye']
+        else:
+            models['eye'] = {
+                'model': load_artifact(os.path.join(MODELS_DIR, 'eye_model_final.pkl')),
+                'le_type': load_artifact(os.path.join(MODELS_DIR, 'le_type_eye_final.pkl')),
+                'le_value': load_artifact(os.path.join(MODELS_DIR, 'le_value_eye_final.pkl')),
+                'le_dim': load_artifact(os.path.join(MODELS_DIR, 'le_dim.pkl'))
+            }
+        # Recommendation lists and their JSON are compiled once per process
+        get_final_table(generate_eye_health_recommendations)
+        return attach_compiled_encoders(models)
     except Exception as e:
         return {"error": f"Eye model loading failed: {str(e)}"}
 
@@ -40,18 +56,20 @@ def predict_eye_health_risk_final(data, models):
         base_risk = predict_age_based_risk(age_group, models)
         
         # Apply demographic adjustments
-        adjusted_risk = apply_demographic_adjustments(base_risk, data)
-        
-        return {
-            "eye_risk": round(adjusted_risk, 2),
-            "risk_level": get_risk_level(adjusted_risk / 100),
-            "confidence": get_confidence_score(adjusted_risk / 100),
-            "base_age_risk": base_risk,
-            "demographic_adjustments": get_demographic_adjustments(data)
-        }
+        with span('adjustment'):
+            adjusted_risk = apply_demographic_adjustments(base_risk, data)
+            return {
+                "eye_risk": round(adjusted_risk, 2),
+                "risk_level": get_risk_level(adjusted_risk / 100),
+                "confidence": get_confidence_score(adjusted_risk / 100),
+                "base_age_risk": base_risk,
+                "demographic_adjustments": get_demographic_adjustments(data)
+            }
 
     except Exception as e:
-        print(f"Final prediction error: {e}", file=sys.stderr)
+        record_fallback('prediction_error')
+        log_event(log, logging.ERROR, 'prediction_error', error=str(e),
+                  exc_info=log.isEnabledFor(logging.DEBUG))
         return {
             "eye_risk": 50.0,
             "risk_level": "Medium",
@@ -62,25 +80,29 @@ def predict_eye_health_risk_final(data, models):
 def predict_age_based_risk(age_group, models):
     """Predict risk based on age group (most reliable method)"""
     try:
-        # Use Age as type
-        type_enc = models['eye']['le_type'].transform(['Age'])[0]
+        # Age type and default dimension codes are folded in at load time
+        with span('encode'):
+            compiled = get_compiled_eye_encoders(models['eye'])
+            
+            # Use age group as value
+            value_enc = compiled['value'].encode(age_group)
+        if value_enc == UNKNOWN_CODE:
+            # Unknown age groups take the 50% fallback without raising
+            record_fallback('unknown_age_group')
+            log_event(log, logging.WARNING, 'unknown_age_group', age_group=age_group)
+            return 50.0
         
-        # Use age group as value
-        value_enc = models['eye']['le_value'].transform([age_group])[0]
-        
-        # Use default dimension
-        dim_enc = models['eye']['le_dim'].transform(['Unnamed: 2'])[0]
-        
-        # Create input array
-        X_input = np.array([[type_enc, value_enc, dim_enc]])
-        
-        # Predict probability
-        prob = models['eye']['model'].predict_proba(X_input)[:, 1][0]
+        # Create input array and predict probability
+        with span('predict_proba'):
+            X_input = np.array([[compiled['type_code'], value_enc, compiled['dim_code']]])
+            prob = models['eye']['model'].predict_proba(X_input)[:, 1][0]
         
         return prob * 100
         
     except Exception as e:
-        print(f"Age-based prediction error: {e}", file=sys.stderr)
+        record_fallback('age_prediction_error')
+        log_event(log, logging.ERROR, 'age_prediction_error', error=str(e),
+                  exc_info=log.isEnabledFor(logging.DEBUG))
         return 50.0
 
 def apply_demographic_adjustments(base_risk, data):
@@ -169,14 +191,118 @@ def generate_eye_health_recommendations(input_data, prediction_result):
     
     return recommendations
 
+# Request fields normalized and validated before scoring
+VALIDATED_FIELDS = ('ageGroup', 'sex')
+
+DEFAULT_INPUT = {
+    "ageGroup": "25–34",
+    "sex": "Male"
+}
+
+def predict_for_request(input_data, models):
+    """Apply the default input and score one record"""
+    if not input_data:
+        input_data = dict(DEFAULT_INPUT)
+
+    # Variant spellings are normalized; malformed fields are rejected without scoring
+    input_data, errors = get_validator(models, VALIDATED_FIELDS).validate(input_data)
+    if errors:
+        return input_data, invalid_result(errors)
+
+    if 'risk_table' in models:
+        from eye_health_lookup import predict_final_from_table
+        prediction_result = predict_final_from_table(input_data, models['risk_table'])
+    elif 'coalescer' in models:
+        # Shares one predict_proba call with concurrent requests (eye_health_coalesce.py)
+        prediction_result = models['coalescer'].predict(input_data, models)
+    else:
+        prediction_result = predict_eye_health_risk_final(input_data, models)
+    return input_data, prediction_result
+
+def validate_batch(records, models):
+    """Normalize and validate a batch of records; returns (records, errors per record)"""
+    return get_validator(models, VALIDATED_FIELDS).validate_many(records)
+
+def build_eye_health_result(input_data, models):
+    """Score one record and attach recommendations"""
+    input_data, prediction_result = predict_for_request(input_data, models)
+    if "errors" in prediction_result:
+        return prediction_result
+    # Precompiled lists, identical to generate_eye_health_recommendations
+    with span('recommendations'):
+        recommendations = get_final_recommendations(input_data, prediction_result)
+
+    return {
+        **prediction_result,
+        "recommendations": recommendations,
+        "input_data": input_data
+    }
+
+def render_eye_health_result(input_data, models):
+    """Score one record and return json.dumps(build_eye_health_result(...)) using the compiled recommendations"""
+    input_data, prediction_result = predict_for_request(input_data, models)
+    with span('serialization'):
+        if "errors" in prediction_result:
+            return json.dumps(prediction_result)
+        return render_final_response(input_data, prediction_result)
+
 def main():
     """Main function to run final prediction"""
     try:
+        flags = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+        positional = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+
+        load = load_eye_models
+        # --trees: NumPy evaluator over compiled tree arrays, no lightgbm import
+        if '--trees' in flags:
+            from eye_health_trees import load_eye_models_trees
+            load = load_eye_models_trees
+        # --slim: only the tree arrays and dict encoders; lightgbm and sklearn
+        # are never imported (see eye_health_memory.py)
+        if '--slim' in flags:
+            from eye_health_memory import load_eye_models_slim
+            load = load_eye_models_slim
+        # Long-running worker mode: load models once, serve NDJSON requests
+        if '--worker' in flags:
+            from eye_health_worker import run_worker
+            if '--lookup' in flags:
+                # Serve from the precomputed risk table instead of predict_proba
+                from eye_health_lookup import with_risk_table
+                load = with_risk_table(load)
+            if '--coalesce' in flags:
+                # Concurrent requests share one batch predict_proba call
+                from eye_health_coalesce import with_coalescing
+                from eye_health_batch import predict_eye_health_risk_final_batch
+                load = with_coalescing(load, predict_eye_health_risk_final_batch, predict_eye_health_risk_final, sys.argv[1:])
+            from eye_health_aggregate import aggregate_final
+            from eye_health_reload import EYE_GOLDEN_INPUTS
+            from eye_health_explain import with_explanations, explain_final
+            run_worker(sys.argv[1:], with_explanations(load), build_eye_health_result, render_eye_health_result,
+                       ops={'aggregate': aggregate_final, 'explain': explain_final},
+                       golden_inputs=EYE_GOLDEN_INPUTS)
+            return
+
+        # Streaming mode: score NDJSON/CSV records in fixed-size chunks
+        if '--stream' in flags:
+            from eye_health_stream import run_stream
+            from eye_health_batch import predict_eye_health_risk_final_batch
+            run_stream(sys.argv[1:], load, predict_eye_health_risk_final_batch,
+                       render_final_response, DEFAULT_INPUT, validate_batch)
+            return
+
+        # --startup-report: import eagerly so imports are timed as one phase
+        if '--startup-report' in flags:
+            from eye_health_startup import import_heavy_modules, HEAVY_MODULES
+            # The bundle needs numpy only; --trees still unpickles the encoders
+            skipped = (HEAVY_MODULES[1:] if bundle_enabled() or '--slim' in flags
+                       else ('lightgbm',) if '--trees' in flags else ())
+            import_heavy_modules([name for name in HEAVY_MODULES if name not in skipped])
+
         # Read input data
-        if len(sys.argv) < 2:
+        if not positional:
             input_data = {}
         else:
-            input_source = sys.argv[1]
+            input_source = positional[0]
             if os.path.isfile(input_source):
                 with open(input_source, 'r', encoding='utf-8') as f:
                     input_data = json.load(f)
@@ -186,32 +312,29 @@ def main():
                 except json.JSONDecodeError:
                     input_data = {}
         
-        if not input_data:
-            input_data = {
-                "ageGroup": "25–34",
-                "sex": "Male"
-            }
-        
-        models = load_eye_models()
+        with span('load'):
+            models = load()
         if "error" in models:
             print(json.dumps({"error": models["error"]}))
             return
         
-        prediction_result = predict_eye_health_risk_final(input_data, models)
-        recommendations = generate_eye_health_recommendations(input_data, prediction_result)
-        
-        result = {
-            **prediction_result,
-            "recommendations": recommendations,
-            "input_data": input_data
-        }
+        with timed_phase('first_prediction'):
+            output = render_eye_health_result(input_data, models)
         
         # Return results (only JSON to stdout)
-        print(json.dumps(result))
+        print(output)
+
+        if '--startup-report' in flags:
+            print(json.dumps({"startup_profile": startup_report()}), file=sys.stderr)
+        # --metrics: per-stage timings and fallback counters on stderr
+        if '--metrics' in flags:
+            print(json.dumps({"metrics": metrics_snapshot()}), file=sys.stderr)
         
     except Exception as e:
         error_result = {"error": f"Final eye health prediction failed: {str(e)}"}
         print(json.dumps(error_result))
 
 if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
     main()
@@ -5,36 +5,63 @@ Uses the new screen time model to provide more accurate predictions
 """
 import sys
 import json
-import joblib
-import numpy as np
 import os
 import warnings
+import functools
+import logging
 
-# Suppress sklearn warnings
-warnings.filterwarnings('ignore')
+from eye_health_startup import lazy_import, load_artifact, timed_phase, startup_report
+from eye_health_bundle import load_bundle_models, bundle_enabled
+from eye_health_encoding import (
+    attach_compiled_encoders, get_compiled_eye_encoders, unseen_label_message, check_screen_time,
+    UNKNOWN_CODE
+)
+from eye_health_metrics import get_logger, log_event, record_fallback, span, metrics_snapshot
+from eye_health_validation import get_validator, invalid_result
+from eye_health_render import get_screentime_recommendations, render_screentime_response, get_screentime_table
+
+# Heavy imports are deferred until first use (see --startup-report)
+np = lazy_import('numpy')
 
 # Get model file paths
 MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
 
-def load_eye_models_with_screentime():
-    """Load eye health models with screen time support"""
+# Structured stderr logging, gated by EYE_HEALTH_LOG_LEVEL
+log = get_logger('screentime')
+
+def load_eye_models_with_screentime(include_screentime_model=True):
+    """
+    Load eye health models with screen time support
+    include_screentime_model: set False to skip the screen time model and its
+    encoders, which predict_eye_health_with_screentime does not currently use
+    """
     models = {}
     try:
-        # Load screen time model and encoders
-        models['eye_screentime'] = {
-            'model': joblib.load(os.path.join(MODELS_DIR, 'eye_model_screentime.pkl')),
-            'encoders': joblib.load(os.path.join(MODELS_DIR, 'eye_encoders_screentime.pkl'))
-        }
-        
-        # Also load the original model for fallback
-        models['eye_original'] = {
-            'model': joblib.load(os.path.join(MODELS_DIR, 'eye_model_final.pkl')),
-            'le_type': joblib.load(os.path.join(MODELS_DIR, 'le_type_eye_final.pkl')),
-            'le_value': joblib.load(os.path.join(MODELS_DIR, 'le_value_eye_final.pkl')),
-            'le_dim': joblib.load(os.path.join(MODELS_DIR, 'le_dim.pkl'))
-        }
+        # One read of the compiled bundle when it is built and intact
+        bundle = load_bundle_models(['eye', 'eye_screentime'] if include_screentime_model else ['eye'])
+        if bundle is not None:
+            models['eye_original'] = bundle['eye']
+            if include_screentime_model:
+                models['eye_screentime'] = bundle['eye_screentime']
+        else:
+            # Load screen time model and encoders
+            if include_screentime_model:
+                models['eye_screentime'] = {
+                    'model': load_artifact(os.path.join(MODELS_DIR, 'eye_model_screentime.pkl')),
+                    'encoders': load_artifact(os.path.join(MODELS_DIR, 'eye_encoders_screentime.pkl'))
+                }
+            
+            # Also load the original model for fallback
+            models['eye_original'] = {
+                'model': load_artifact(os.path.join(MODELS_DIR, 'eye_model_final.pkl')),
+                'le_type': load_artifact(os.path.join(MODELS_DIR, 'le_type_eye_final.pkl')),
+                'le_value': load_artifact(os.path.join(MODELS_DIR, 'le_value_eye_final.pkl')),
+                'le_dim': load_artifact(os.path.join(MODELS_DIR, 'le_dim.pkl'))
+            }
         
-        return models
+        # Recommendation lists and their JSON are compiled once per process
+        get_screentime_table(generate_eye_health_recommendations_with_screentime)
+        return attach_compiled_encoders(models)
     except Exception as e:
         return {"error": f"Eye model loading failed: {str(e)}"}
 
@@ -45,11 +72,10 @@ def predict_eye_health_with_screentime(data, models):
     """
     try:
         screen_time = data.get('screenTime', 8)
-        print(f"🔍 Starting prediction with screen_time: {screen_time}", file=sys.stderr)
+        log_event(log, logging.DEBUG, 'prediction_start', screen_time=screen_time)
         
         # For now, always use original model with screen time adjustment
         # TODO: Fix screen time model later
-        print(f"🔄 Using original model with screen time adjustment (screen time model disabled)", file=sys.stderr)
         return predict_with_original_model_and_screentime_adjustment(data, models['eye_original'])
         
         # Try to use screen time model first (disabled for debugging)
@@ -59,15 +85,15 @@ def predict_eye_health_with_screentime(data, models):
         #         if screentime_result:
         #             return screentime_result
         #     except Exception as e:
-        #         print(f"Screen time model failed, falling back to original: {e}", file=sys.stderr)
+        #         log_event(log, logging.WARNING, 'screentime_model_failed', error=str(e))
         
         # Fallback to original model with screen time adjustment
         # return predict_with_original_model_and_screentime_adjustment(data, models['eye_original'])
         
     except Exception as e:
-        print(f"❌ Eye health prediction error: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        record_fallback('prediction_error')
+        log_event(log, logging.ERROR, 'prediction_error', error=str(e),
+                  exc_info=log.isEnabledFor(logging.DEBUG))
         return {
             "eye_risk": 50.0,
             "risk_level": "Medium", 
@@ -78,27 +104,32 @@ def predict_eye_health_with_screentime(data, models):
 def predict_with_screentime_model(data, screentime_model):
     """Use the dedicated screen time model"""
     try:
-        print(f"🔍 Screen time model prediction with data: {data}", file=sys.stderr)
-        
         # Extract screen time and other features (removed state and remoteness)
         screen_time = data.get('screenTime', 8)
         age_group = data.get('ageGroup', '25–34')
         sex = data.get('sex', 'Male')
         
-        print(f"📊 Extracted features - screen_time: {screen_time}, age_group: {age_group}, sex: {sex}", file=sys.stderr)
+        log_event(log, logging.DEBUG, 'screentime_model_input',
+                  screen_time=screen_time, age_group=age_group, sex=sex)
         
         # Check if model and encoders exist
         if not screentime_model or 'model' not in screentime_model or 'encoders' not in screentime_model:
-            print("❌ Screen time model or encoders missing", file=sys.stderr)
+            log_event(log, logging.WARNING, 'screentime_model_missing')
             return None
         
-        # Prepare features for the screen time model (only age, sex, and screen time)
-        features = prepare_screentime_features(screen_time, age_group, sex, screentime_model['encoders'])
-        print(f"🎯 Prepared features: {features}", file=sys.stderr)
+        # Encode with the pipeline resolved from the model's own feature names
+        from eye_health_shadow import predict_pipeline_probabilities
+        pipeline, columns = prepare_screentime_features(screen_time, age_group, sex, screentime_model)
+        if not columns[3][0]:
+            log_event(log, logging.WARNING, 'screentime_model_unencodable',
+                      screen_time=screen_time, age_group=age_group, sex=sex)
+            return None
         
         # Predict using the screen time model
-        prob = screentime_model['model'].predict_proba([features])[:, 1][0]
-        print(f"📈 Prediction probability: {prob}", file=sys.stderr)
+        with span('predict_proba'):
+            prob = float(predict_pipeline_probabilities(pipeline, *columns)[0])
+        log_event(log, logging.DEBUG, 'screentime_model_probability',
+                  features=[int(column[0]) for column in columns[:3]], probability=prob)
         
         return {
             "eye_risk": round(prob * 100, 2),
@@ -109,95 +140,75 @@ def predict_with_screentime_model(data, screentime_model):
         }
         
     except Exception as e:
-        print(f"❌ Screen time model prediction error: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        log_event(log, logging.ERROR, 'screentime_model_error', error=str(e),
+                  exc_info=log.isEnabledFor(logging.DEBUG))
         return None
 
-def prepare_screentime_features(screen_time, age_group, sex, encoders):
-    """Prepare features for the screen time model (only age, sex, and screen time)"""
-    try:
-        # Create a feature vector with only essential features
-        features = []
-        
-        # Add screen time as a feature
-        features.append(screen_time)
-        
-        # Try different encoder structures
-        age_encoded = 0
-        sex_encoded = 0
-        
-        # Check if encoders is a dictionary
-        if isinstance(encoders, dict):
-            if 'age_encoder' in encoders:
-                age_encoded = encoders['age_encoder'].transform([age_group])[0]
-            if 'sex_encoder' in encoders:
-                sex_encoded = encoders['sex_encoder'].transform([sex])[0]
-        # Check if encoders has attributes
-        elif hasattr(encoders, 'age_encoder'):
-            age_encoded = encoders.age_encoder.transform([age_group])[0]
-        elif hasattr(encoders, 'sex_encoder'):
-            sex_encoded = encoders.sex_encoder.transform([sex])[0]
-        # Check if encoders is a list or tuple
-        elif isinstance(encoders, (list, tuple)) and len(encoders) >= 2:
-            try:
-                age_encoded = encoders[0].transform([age_group])[0]
-                sex_encoded = encoders[1].transform([sex])[0]
-            except:
-                pass
-        
-        features.extend([age_encoded, sex_encoded])
-        
-        print(f"Prepared features: {features}", file=sys.stderr)
-        return features
-        
-    except Exception as e:
-        print(f"Feature preparation error: {e}", file=sys.stderr)
-        # Return a default feature vector (only 3 features now)
-        return [screen_time, 0, 0]
+def prepare_screentime_features(screen_time, age_group, sex, screentime_model):
+    """
+    Encode age, sex and screen time for the screen time model
+    The feature order and category mapping are resolved once from the model's
+    feature names and encoders (see eye_health_shadow.resolve_screentime_pipeline)
+    Returns (pipeline, (age, gender, screen, valid) arrays of length 1)
+    """
+    from eye_health_shadow import resolve_screentime_pipeline, encode_pipeline_columns
+    pipeline = screentime_model.get('pipeline')
+    if pipeline is None:
+        pipeline = screentime_model['pipeline'] = resolve_screentime_pipeline(screentime_model)
+    return pipeline, encode_pipeline_columns(pipeline, [age_group], [sex], [screen_time])
 
 def predict_with_original_model_and_screentime_adjustment(data, original_model):
     """Use original model with screen time adjustment"""
     try:
-        print(f"🔄 Using original model with screen time adjustment", file=sys.stderr)
-        
         # Use the original prediction method
         age_group = data.get('ageGroup', '25–34')
         sex = data.get('sex', 'Male')
         screen_time = data.get('screenTime', 8)
 
-        print(f"📊 Original model features - age_group: {age_group}, sex: {sex}, screen_time: {screen_time}", file=sys.stderr)
+        log_event(log, logging.DEBUG, 'original_model_input',
+                  age_group=age_group, sex=sex, screen_time=screen_time)
 
-        # Use age group as-is (same as original model)
-        type_enc = original_model['le_type'].transform(['Age'])[0]
-        value_enc = original_model['le_value'].transform([age_group])[0]
-        dim_enc = original_model['le_dim'].transform(['Unnamed: 2'])[0]
-        
-        print(f"🎯 Encoded features - type: {type_enc}, value: {value_enc}, dim: {dim_enc}", file=sys.stderr)
-        
-        X_input = np.array([[type_enc, value_enc, dim_enc]])
-        base_prob = original_model['model'].predict_proba(X_input)[:, 1][0]
+        # Use age group as-is (same as original model); constant codes are folded in at load time
+        with span('encode'):
+            compiled = get_compiled_eye_encoders(original_model)
+            type_enc = compiled['type_code']
+            value_enc = compiled['value'].encode(age_group)
+            dim_enc = compiled['dim_code']
+        if value_enc == UNKNOWN_CODE:
+            # Unknown age groups get the fallback result without raising
+            record_fallback('unknown_age_group')
+            log_event(log, logging.WARNING, 'unknown_age_group', age_group=age_group)
+            return {
+                "eye_risk": 50.0,
+                "risk_level": "Medium",
+                "confidence": "Low",
+                "error": unseen_label_message(age_group)
+            }
         
-        print(f"📈 Base probability: {base_prob}", file=sys.stderr)
+        with span('predict_proba'):
+            X_input = np.array([[type_enc, value_enc, dim_enc]])
+            base_prob = original_model['model'].predict_proba(X_input)[:, 1][0]
         
         # Apply screen time adjustment
-        adjusted_prob = apply_screen_time_adjustment(base_prob, screen_time)
-        
-        print(f"📊 Adjusted probability: {adjusted_prob}", file=sys.stderr)
+        with span('adjustment'):
+            adjusted_prob = apply_screen_time_adjustment(base_prob, check_screen_time(screen_time))
+            result = {
+                "eye_risk": round(adjusted_prob * 100, 2),
+                "risk_level": get_risk_level(adjusted_prob),
+                "confidence": get_confidence_score(adjusted_prob),
+                "model_used": "original_with_screentime_adjustment",
+                "screen_time_impact": calculate_screen_time_impact(screen_time),
+                "base_risk": round(base_prob * 100, 2)
+            }
         
-        return {
-            "eye_risk": round(adjusted_prob * 100, 2),
-            "risk_level": get_risk_level(adjusted_prob),
-            "confidence": get_confidence_score(adjusted_prob),
-            "model_used": "original_with_screentime_adjustment",
-            "screen_time_impact": calculate_screen_time_impact(screen_time),
-            "base_risk": round(base_prob * 100, 2)
-        }
+        log_event(log, logging.DEBUG, 'original_model_prediction', value_code=value_enc,
+                  base_probability=base_prob, adjusted_probability=adjusted_prob)
+        return result
         
     except Exception as e:
-        print(f"❌ Original model with screen time adjustment error: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        record_fallback('original_model_error')
+        log_event(log, logging.ERROR, 'original_model_error', error=str(e),
+                  exc_info=log.isEnabledFor(logging.DEBUG))
         return {
             "eye_risk": 50.0,
             "risk_level": "Medium",
@@ -309,14 +320,146 @@ def generate_eye_health_recommendations_with_screentime(input_data, prediction_r
     
     return recommendations
 
+# Command-line options followed by a value
+VALUE_OPTIONS = ('--primary',)
+
+# Request fields normalized and validated before scoring
+VALIDATED_FIELDS = ('ageGroup', 'sex', 'screenTime')
+
+DEFAULT_INPUT = {
+    "ageGroup": "25–34",
+    "sex": "Male",
+    "screenTime": 8
+}
+
+def predict_for_request(input_data, models):
+    """Apply the default input and score one record"""
+    if not input_data:
+        input_data = dict(DEFAULT_INPUT)
+
+    # Variant spellings are normalized; malformed fields are rejected without scoring
+    input_data, errors = get_validator(models, VALIDATED_FIELDS).validate(input_data)
+    if errors:
+        return input_data, invalid_result(errors)
+
+    if 'shadow' in models:
+        # Both models in one pass; the configured primary is served
+        from eye_health_shadow import predict_shadow
+        prediction_result = predict_shadow(input_data, models)
+    elif 'risk_table' in models:
+        from eye_health_lookup import predict_screentime_from_table
+        prediction_result = predict_screentime_from_table(input_data, models['risk_table'])
+    elif 'coalescer' in models:
+        # Shares one predict_proba call with concurrent requests (eye_health_coalesce.py)
+        prediction_result = models['coalescer'].predict(input_data, models)
+    else:
+        prediction_result = predict_eye_health_with_screentime(input_data, models)
+    return input_data, prediction_result
+
+def validate_batch(records, models):
+    """Normalize and validate a batch of records; returns (records, errors per record)"""
+    return get_validator(models, VALIDATED_FIELDS).validate_many(records)
+
+def build_eye_health_result(input_data, models):
+    """Score one record and attach recommendations"""
+    input_data, prediction_result = predict_for_request(input_data, models)
+    if "errors" in prediction_result:
+        return prediction_result
+    # Precompiled lists, identical to generate_eye_health_recommendations_with_screentime
+    with span('recommendations'):
+        recommendations = get_screentime_recommendations(input_data, prediction_result)
+
+    return {
+        **prediction_result,
+        "recommendations": recommendations,
+        "input_data": input_data
+    }
+
+def render_eye_health_result(input_data, models):
+    """Score one record and return json.dumps(build_eye_health_result(...)) using the compiled recommendations"""
+    input_data, prediction_result = predict_for_request(input_data, models)
+    with span('serialization'):
+        if "errors" in prediction_result:
+            return json.dumps(prediction_result)
+        return render_screentime_response(input_data, prediction_result)
+
 def main():
     """Main function to run screen time prediction"""
     try:
+        flags = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+        # Values of options that take one (e.g. --primary screentime) are not input
+        positional = [arg for i, arg in enumerate(sys.argv[1:], 1)
+                      if not arg.startswith('--') and sys.argv[i - 1] not in VALUE_OPTIONS]
+
+        load = load_eye_models_with_screentime
+        # --trees: NumPy evaluator over compiled tree arrays, no lightgbm import
+        if '--trees' in flags:
+            from eye_health_trees import load_eye_models_with_screentime_trees
+            load = load_eye_models_with_screentime_trees
+
+        # --slim: only the tree arrays and dict encoders, and the screen time
+        # model set only for --shadow; lightgbm and sklearn are never imported
+        if '--slim' in flags:
+            from eye_health_memory import load_eye_models_with_screentime_slim
+            load = functools.partial(load_eye_models_with_screentime_slim,
+                                     include_screentime_model='--shadow' in flags)
+
+        # --lazy: skip the screen time model, which the active path never uses
+        if '--lazy' in flags:
+            load = functools.partial(load, include_screentime_model=False)
+
+        # --shadow: score with both models, serve --primary (default original)
+        if '--shadow' in flags:
+            from eye_health_shadow import with_shadow, get_primary_model
+            load = with_shadow(load, get_primary_model(sys.argv[1:]))
+
+        # Long-running worker mode: load models once, serve NDJSON requests
+        if '--worker' in flags:
+            from eye_health_worker import run_worker
+            if '--lookup' in flags:
+                # Serve from the precomputed risk table instead of predict_proba
+                from eye_health_lookup import with_risk_table
+                load = with_risk_table(load)
+            if '--coalesce' in flags:
+                # Concurrent requests share one batch predict_proba call
+                from eye_health_coalesce import with_coalescing
+                from eye_health_batch import predict_eye_health_with_screentime_batch
+                load = with_coalescing(load, predict_eye_health_with_screentime_batch, predict_eye_health_with_screentime, sys.argv[1:])
+            from eye_health_sweep import sweep_screen_time
+            from eye_health_aggregate import aggregate_screentime
+            from eye_health_reload import EYE_GOLDEN_INPUTS
+            from eye_health_explain import with_explanations, explain_screentime
+            run_worker(sys.argv[1:], with_explanations(load), build_eye_health_result, render_eye_health_result,
+                       ops={'sweep': sweep_screen_time, 'aggregate': aggregate_screentime,
+                            'explain': explain_screentime},
+                       golden_inputs=EYE_GOLDEN_INPUTS)
+            return
+
+        # Streaming mode: score NDJSON/CSV records in fixed-size chunks
+        if '--stream' in flags:
+            from eye_health_stream import run_stream
+            from eye_health_batch import predict_eye_health_with_screentime_batch
+            predict_batch = predict_eye_health_with_screentime_batch
+            if '--shadow' in flags:
+                from eye_health_shadow import predict_shadow_batch
+                predict_batch = predict_shadow_batch
+            run_stream(sys.argv[1:], load, predict_batch,
+                       render_screentime_response, DEFAULT_INPUT, validate_batch)
+            return
+
+        # --startup-report: import eagerly so imports are timed as one phase
+        if '--startup-report' in flags:
+            from eye_health_startup import import_heavy_modules, HEAVY_MODULES
+            # The bundle needs numpy only; --trees still unpickles the encoders
+            skipped = (HEAVY_MODULES[1:] if bundle_enabled() or '--slim' in flags
+                       else ('lightgbm',) if '--trees' in flags else ())
+            import_heavy_modules([name for name in HEAVY_MODULES if name not in skipped])
+
         # Read input data
-        if len(sys.argv) < 2:
+        if not positional:
             input_data = {}
         else:
-            input_source = sys.argv[1]
+            input_source = positional[0]
             if os.path.isfile(input_source):
                 with open(input_source, 'r', encoding='utf-8') as f:
                     input_data = json.load(f)
@@ -326,33 +469,29 @@ def main():
                 except json.JSONDecodeError:
                     input_data = {}
         
-        if not input_data:
-            input_data = {
-                "ageGroup": "25–34",
-                "sex": "Male",
-                "screenTime": 8
-            }
-        
-        models = load_eye_models_with_screentime()
+        with span('load'):
+            models = load()
         if "error" in models:
             print(json.dumps({"error": models["error"]}))
             return
         
-        prediction_result = predict_eye_health_with_screentime(input_data, models)
-        recommendations = generate_eye_health_recommendations_with_screentime(input_data, prediction_result)
-        
-        result = {
-            **prediction_result,
-            "recommendations": recommendations,
-            "input_data": input_data
-        }
+        with timed_phase('first_prediction'):
+            output = render_eye_health_result(input_data, models)
         
         # Return results (only JSON to stdout)
-        print(json.dumps(result))
+        print(output)
+
+        if '--startup-report' in flags:
+            print(json.dumps({"startup_profile": startup_report()}), file=sys.stderr)
+        # --metrics: per-stage timings and fallback counters on stderr
+        if '--metrics' in flags:
+            print(json.dumps({"metrics": metrics_snapshot()}), file=sys.stderr)
         
     except Exception as e:
         error_result = {"error": f"Screen time eye health prediction failed: {str(e)}"}
         print(json.dumps(error_result))
 
 if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
     main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Prefork worker pool for the eye health prediction server
+The parent process preloads numpy, joblib and the models once
+(load_eye_models_with_screentime / load_eye_models via load_server_models)
+and forks worker processes that share those pages copy-on-write. Requests
+are dispatched to idle workers over pipes. Workers are recycled after
+--max-requests requests or when their RSS passes --max-rss-mb, and crashed
+or hung workers are replaced, so a fault costs one request, not the server.
+After a model reload every worker is replaced by one forked from the new set,
+idle workers at once and busy ones when their request is answered. Each
+reply carries the counters and spans the worker recorded, merged into the
+parent's metrics, and forks wait for any model swap in progress
+
+Usage: python eye_health_server.py --prefork 4 [--max-requests 1000]
+       [--max-rss-mb 512] [server options]
+"""
+import sys
+import os
+import gc
+import stat
+import signal
+import asyncio
+import logging
+import collections
+import contextlib
+from multiprocessing import Pipe
+
+from eye_health_metrics import (
+    get_logger, log_event, increment, register_section, reset_metrics, take_metrics, merge_metrics
+)
+from eye_health_memory import current_rss_bytes
+from eye_health_server import PredictionServer, HttpError, build_prediction
+
+DEFAULT_MAX_REQUESTS = 1000
+DEFAULT_MAX_RSS_MB = 512
+# Seconds between checks for a stopped worker that has not exited yet
+REAP_INTERVAL = 0.05
+
+log = get_logger('prefork')
+
+
+class WorkerCrashed(Exception):
+    """A worker exited or was killed while serving a request"""
+
+
+def close_inherited_sockets(keep_fd):
+    """
+    Close the parent's sockets (listener, client connections, other workers'
+    pipes) in a freshly forked worker, so closing a connection in the parent
+    really closes it
+    """
+    try:
+        fds = [int(name) for name in os.listdir('/proc/self/fd')]
+    except OSError:
+        fds = range(3, os.sysconf('SC_OPEN_MAX') if hasattr(os, 'sysconf') else 1024)
+    for fd in fds:
+        if fd <= 2 or fd == keep_fd:
+            continue
+        try:
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.close(fd)
+        except OSError:
+            pass
+
+
+def worker_main(conn, models):
+    """
+    Worker loop: receive (fn, args), reply ((ok, value), rss, metrics) until
+    told to stop. Task functions are called as fn(*args, models); metrics are
+    the counters and spans the task recorded, merged into the parent's
+    """
+    # Counts inherited from the parent are already in the parent's snapshot
+    reset_metrics()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        fn, args = message
+        try:
+            reply = (True, fn(*args, models))
+        except Exception as e:
+            reply = (False, f"{type(e).__name__}: {str(e)}")
+        conn.send((reply, current_rss_bytes(), take_metrics()))
+
+
+class WorkerProcess:
+    """Parent-side handle of one forked worker"""
+
+    def __init__(self, pid, conn):
+        self.pid = pid
+        self.conn = conn
+        self.requests = 0
+        self.rss = 0
+        self.future = None
+        self.timer = None
+        # Serving a model set that has since been reloaded
+        self.stale = False
+
+
+class PreforkPool:
+    """Fixed-size pool of forked workers, driven from the parent's event loop"""
+
+    def __init__(self, models, workers=None, max_requests=DEFAULT_MAX_REQUESTS,
+                 max_rss_mb=DEFAULT_MAX_RSS_MB, hard_timeout=None, fork_guard=None):
+        self.models = models
+        self.size = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.hard_timeout = hard_timeout
+        # Context manager entered around os.fork (ModelManager.swap_guard)
+        self.fork_guard = fork_guard or contextlib.nullcontext
+        self.workers = {}
+        self.idle = collections.deque()
+        self.queue = collections.deque()
+        self.loop = None
+        self.closing = False
+        self.counts = {'spawned': 0, 'recycled': 0, 'crashed': 0, 'killed': 0}
+
+    def start(self, loop):
+        """Fork the initial workers"""
+        self.loop = loop
+        # Objects from the preload never change; keep the collector from
+        # touching (and so un-sharing) their pages in every worker
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.size):
+            self.spawn()
+
+    def spawn(self):
+        """Fork one worker with its own pipe"""
+        parent_conn, child_conn = Pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        with self.fork_guard():
+            pid = os.fork()
+            if pid == 0:
+                # Never leaves the block: the guard's exit belongs to the parent
+                self.run_child(child_conn)
+
+        child_conn.close()
+        worker = WorkerProcess(pid, parent_conn)
+        self.workers[pid] = worker
+        self.counts['spawned'] += 1
+        self.loop.add_reader(parent_conn.fileno(), self.on_reply, worker)
+        self.idle.append(worker)
+        log_event(log, logging.INFO, 'worker_started', pid=pid)
+        self.dispatch()
+
+    def run_child(self, child_conn):
+        """Body of a freshly forked worker; exits the process when done"""
+        status = 0
+        try:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # Ctrl-C reaches the whole process group; the parent decides when workers stop
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            close_inherited_sockets(child_conn.fileno())
+            worker_main(child_conn, self.models)
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args, models) for the next idle worker; returns an asyncio future"""
+        future = self.loop.create_future()
+        self.queue.append((future, fn, args))
+        self.dispatch()
+        return future
+
+    def dispatch(self):
+        """Hand queued tasks to idle workers"""
+        while self.queue and self.idle:
+            future, fn, args = self.queue.popleft()
+            if future.done():
+                continue
+            worker = self.idle.popleft()
+            worker.future = future
+            try:
+                worker.conn.send((fn, args))
+            except (OSError, ValueError) as e:
+                self.retire(worker, crashed=True, reason=str(e))
+                continue
+            if self.hard_timeout:
+                worker.timer = self.loop.call_later(self.hard_timeout, self.kill, worker)
+
+    def on_reply(self, worker):
+        """A worker finished its task (or its pipe closed)"""
+        try:
+            (ok, value), rss, metrics = worker.conn.recv()
+        except (EOFError, OSError):
+            self.retire(worker, crashed=True, reason='worker exited')
+            return
+        merge_metrics(metrics)
+
+        if worker.timer is not None:
+            worker.timer.cancel()
+            worker.timer = None
+        worker.requests += 1
+        # None where RSS cannot be measured; the RSS cap then never triggers
+        worker.rss = rss or 0
+        future, worker.future = worker.future, None
+        if future is not None and not future.done():
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+        if worker.stale:
+            self.recycle(worker, 'reload')
+        elif worker.requests >= self.max_requests:
+            self.recycle(worker, 'max_requests')
+        elif self.max_rss and worker.rss > self.max_rss:
+            self.recycle(worker, 'max_rss')
+        else:
+            self.idle.append(worker)
+            self.dispatch()
+
+    def kill(self, worker):
+        """Hard timeout: kill a worker stuck on one request"""
+        worker.timer = None
+        self.counts['killed'] += 1
+        log_event(log, logging.WARNING, 'worker_killed', pid=worker.pid, timeout=self.hard_timeout)
+        try:
+            os.kill(worker.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def recycle(self, worker, reason):
+        """Stop a worker that served enough requests or grew too large, and replace it"""
+        self.counts['recycled'] += 1
+        increment(f"prefork.recycled.{reason}")
+        log_event(log, logging.INFO, 'worker_recycled', pid=worker.pid, reason=reason,
+                  requests=worker.requests, rss_mb=round(worker.rss / 1048576, 1))
+        try:
+            worker.conn.send(None)
+        except OSError:
+            pass
+        self.retire(worker, crashed=False)
+
+    def retire(self, worker, crashed, reason=None):
+        """Forget a worker, reap it, fail its task if it had one and fork a replacement"""
+        self.loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        self.workers.pop(worker.pid, None)
+        if worker in self.idle:
+            self.idle.remove(worker)
+        if worker.timer is not None:
+            worker.timer.cancel()
+        self.reap(worker.pid)
+
+        if crashed:
+            self.counts['crashed'] += 1
+            log_event(log, logging.ERROR, 'worker_crashed', pid=worker.pid, reason=reason)
+        if worker.future is not None and not worker.future.done():
+            worker.future.set_exception(WorkerCrashed(f"Prediction worker {worker.pid} {reason}"))
+        if not self.closing:
+            self.spawn()
+
+    def reap(self, pid):
+        """Collect an exited worker without blocking the event loop; retry until it has exited"""
+        try:
+            exited, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if not exited and self.loop.is_running():
+            self.loop.call_later(REAP_INTERVAL, self.reap, pid)
+
+    def replace_models(self, models):
+        """Fork every worker again from a reloaded model set"""
+        self.models = models
+        gc.collect()
+        gc.freeze()
+        busy = [worker for worker in self.workers.values() if worker not in self.idle]
+        for worker in busy:
+            worker.stale = True
+        for worker in list(self.idle):
+            self.recycle(worker, 'reload')
+
+    def stats(self):
+        """Pool state for the metrics snapshot"""
+        return {
+            "workers": len(self.workers),
+            "idle": len(self.idle),
+            "queued": len(self.queue),
+            **self.counts,
+            "per_worker": {
+                str(pid): {"requests": worker.requests, "rss_mb": round(worker.rss / 1048576, 1)}
+                for pid, worker in self.workers.items()
+            },
+        }
+
+    def close(self):
+        """Stop every worker (after in-flight requests have been answered)"""
+        self.closing = True
+        for worker in list(self.workers.values()):
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            self.retire(worker, crashed=False)
+
+
+class PreforkPredictionServer(PredictionServer):
+    """PredictionServer whose predictions run in forked workers instead of threads"""
+
+    def __init__(self, models, pool, **kwargs):
+        super().__init__(models, threads=1, **kwargs)
+        self.pool = pool
+
+    def submit_prediction(self, handler, data):
+        return self.pool.submit(build_prediction, handler, data)
+
+    def swap_models(self, models):
+        super().swap_models(models)
+        # Called from the reload thread; the pool belongs to the event loop
+        if self.pool.loop is not None:
+            self.pool.loop.call_soon_threadsafe(self.pool.replace_models, models)
+        else:
+            self.pool.models = models
+
+    async def run_route(self, method, path, body):
+        try:
+            return await super().run_route(method, path, body)
+        except WorkerCrashed as e:
+            raise HttpError(502, str(e))
+
+    async def serve(self, host, port):
+        self.pool.start(asyncio.get_running_loop())
+        register_section('prefork', self.pool.stats)
+        await super().serve(host, port)
+
+    async def shutdown(self):
+        await super().shutdown()
+        self.pool.close()
+
+
+def create_prefork_server(models, argv, fork_guard=None, **kwargs):
+    """
+    PreforkPredictionServer configured from --prefork, --max-requests and --max-rss-mb
+    fork_guard: context manager entered around every fork (ModelManager.swap_guard)
+    """
+    from eye_health_stream import get_option
+
+    pool = PreforkPool(
+        models,
+        workers=int(get_option(argv, '--prefork', 0)) or None,
+        max_requests=int(get_option(argv, '--max-requests', DEFAULT_MAX_REQUESTS)),
+        max_rss_mb=float(get_option(argv, '--max-rss-mb', DEFAULT_MAX_RSS_MB)),
+        hard_timeout=kwargs.get('timeout'),
+        fork_guard=fork_guard
+    )
+    return PreforkPredictionServer(models, pool, **kwargs)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Zero-downtime model reload for long-running predictors
+ModelManager polls MODELS_DIR for changed .pkl/.bundle files, waits until a
+change has stopped being written, then loads and warms the new model set in
+a background thread, checks it against a golden set of inputs and swaps it
+in with one reference assignment. Requests hold the model set they started
+with, so in-flight requests finish on the old version; every model set
+carries the content hash of the files it was loaded from as model_version
+
+Workers and eye_health_server.py reload by default; --reload-interval SECONDS
+sets the poll interval (0 disables), --golden-set PATH replaces the golden
+inputs with a JSON list of records, and --max-drift POINTS rejects a model
+set whose golden-set risks move further than that from the serving one
+"""
+import os
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+import warnings
+
+from eye_health_metrics import get_logger, log_event, increment, register_section
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+WATCHED_SUFFIXES = ('.pkl', '.bundle')
+DEFAULT_RELOAD_INTERVAL = 5.0
+
+# Golden inputs for the eye health scripts: every age group of the original
+# model for each sex at three screen time bands
+GOLDEN_AGE_GROUPS = ('0–14', '15–24', '25–34', '35–44', '45–54', '55–64', '65–74', '75–84', '85+')
+EYE_GOLDEN_INPUTS = [
+    {'ageGroup': age_group, 'sex': sex, 'screenTime': screen_time}
+    for age_group in GOLDEN_AGE_GROUPS
+    for sex in ('Male', 'Female', 'Persons')
+    for screen_time in (1, 7, 13)
+]
+
+RISK_LEVELS = ('Low', 'Medium', 'High')
+
+log = get_logger('reload')
+
+
+def models_signature(models_dir=MODELS_DIR):
+    """(name, size, mtime) of every watched file; changes whenever one is written"""
+    signature = []
+    try:
+        names = sorted(os.listdir(models_dir))
+    except OSError:
+        return ()
+    for name in names:
+        if name.endswith(WATCHED_SUFFIXES):
+            try:
+                stat = os.stat(os.path.join(models_dir, name))
+            except OSError:
+                continue
+            signature.append((name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def models_version(signature, models_dir=MODELS_DIR):
+    """Content hash of the files in a signature (first 12 hex digits)"""
+    digest = hashlib.sha256()
+    for name, _, _ in signature:
+        digest.update(name.encode('utf-8'))
+        try:
+            with open(os.path.join(models_dir, name), 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            pass
+    return digest.hexdigest()[:12]
+
+
+def load_golden_inputs(path):
+    """Golden input records from a JSON file holding a list of objects"""
+    with open(path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise ValueError(f"{path} must hold a list of input objects")
+    return records
+
+
+def check_golden_result(result):
+    """Problem with one golden-set result, or None when it looks like a valid prediction"""
+    if isinstance(result, str):
+        result = json.loads(result)
+    if not isinstance(result, dict):
+        return f"expected an object, got {type(result).__name__}"
+    if result.get('errors') or result.get('error'):
+        return result.get('error') or str(result['errors'])
+    for key, value in result.items():
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"{key} is {value}"
+        if key.endswith('risk') and isinstance(value, (int, float)) and not 0 <= value <= 100:
+            return f"{key} {value} is outside 0-100"
+    if 'risk_level' in result and result['risk_level'] not in RISK_LEVELS:
+        return f"unknown risk_level {result['risk_level']!r}"
+    return None
+
+
+def risk_values(result):
+    """Top-level *risk numbers of a result, for drift between model versions"""
+    if isinstance(result, str):
+        result = json.loads(result)
+    return {key: value for key, value in result.items()
+            if key.endswith('risk') and isinstance(value, (int, float))}
+
+
+class ModelManager:
+    """
+    Owns the serving model set of a long-running predictor
+    Read manager.models once per request and use that dict throughout
+    """
+
+    def __init__(self, load, predict, golden_inputs=None, interval=DEFAULT_RELOAD_INTERVAL,
+                 max_drift=None, models_dir=MODELS_DIR):
+        self.load = load
+        self.predict = predict
+        self.golden_inputs = golden_inputs if golden_inputs is not None else [{}]
+        self.interval = interval
+        self.max_drift = max_drift
+        self.models_dir = models_dir
+        self.models = None
+        self.signature = None
+        self.pending_signature = None
+        self.golden_results = None
+        self.listeners = []
+        self.thread = None
+        self.stopped = threading.Event()
+        # Held while a new model set is swapped in; prefork workers fork under it
+        self.swap_lock = threading.Lock()
+        self.state = {'version': None, 'loaded_at': None, 'reloads': 0, 'rejected': 0,
+                      'last_error': None, 'last_drift': None}
+
+    def start(self):
+        """Load the initial model set (synchronously) and start watching"""
+        signature = models_signature(self.models_dir)
+        models = self.load()
+        if "error" not in models:
+            models['model_version'] = models_version(signature, self.models_dir)
+            self.golden_results, problems = self.run_golden_set(models)
+            if problems:
+                # Serve anyway: there is no older set to fall back to
+                first = next(iter(problems))
+                log_event(log, logging.WARNING, 'golden_set_failed', version=models['model_version'],
+                          failed=len(problems), example=problems[first])
+        self.install(models, signature)
+        register_section('models', self.stats)
+        if self.interval:
+            self.thread = threading.Thread(target=self.watch, name='model-reload', daemon=True)
+            self.thread.start()
+        return models
+
+    def swap_guard(self):
+        """
+        The lock held while a reloaded set is swapped in, as a context manager
+        Prefork pools fork under it, so no child sees a half-installed swap;
+        loading and the golden set run outside it and never block a fork
+        """
+        return self.swap_lock
+
+    def add_listener(self, callback):
+        """Call callback(models) after every swap (from the reload thread)"""
+        self.listeners.append(callback)
+
+    def install(self, models, signature):
+        """Make a model set the serving one"""
+        # One reference assignment: readers see the old or the new set, never a mix
+        self.models = models
+        self.signature = signature
+        self.pending_signature = None
+        self.state['version'] = models.get('model_version')
+        self.state['loaded_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    def run_golden_set(self, models):
+        """(results, problems): predict every golden input, which also warms the new set"""
+        results, problems = [], {}
+        for i, record in enumerate(self.golden_inputs):
+            try:
+                result = self.predict(dict(record), models)
+                problem = check_golden_result(result)
+            except Exception as e:
+                result, problem = None, f"{type(e).__name__}: {str(e)}"
+            results.append(result)
+            if problem is not None:
+                problems[i] = problem
+        return results, problems
+
+    def golden_drift(self, results):
+        """Largest change of any *risk value over the golden set, in points"""
+        if not self.golden_results:
+            return None
+        drift = 0.0
+        for old, new in zip(self.golden_results, results):
+            if old is None or new is None:
+                continue
+            old_risks, new_risks = risk_values(old), risk_values(new)
+            for key in old_risks.keys() & new_risks.keys():
+                drift = max(drift, abs(new_risks[key] - old_risks[key]))
+        return round(drift, 4)
+
+    def watch(self):
+        """Poll loop of the reload thread"""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                log_event(log, logging.ERROR, 'reload_error', error=str(e),
+                          exc_info=log.isEnabledFor(logging.DEBUG))
+
+    def poll(self):
+        """Reload once a change to the watched files has been stable for one interval"""
+        signature = models_signature(self.models_dir)
+        if signature == self.signature:
+            self.pending_signature = None
+            return
+        if signature != self.pending_signature:
+            # Still being written (or just noticed): look again next interval
+            self.pending_signature = signature
+            return
+        self.reload(signature)
+
+    def reload(self, signature):
+        """Load, warm and validate a new model set, then swap it in"""
+        version = models_version(signature, self.models_dir)
+        log_event(log, logging.INFO, 'reload_started', version=version, previous=self.state['version'])
+        started = time.perf_counter()
+
+        models = self.load()
+        if "error" in models:
+            return self.reject(signature, version, models['error'])
+        results, problems = self.run_golden_set(models)
+        if problems:
+            first = next(iter(problems))
+            return self.reject(signature, version, f"{len(problems)} golden inputs failed, e.g. "
+                                                   f"{self.golden_inputs[first]}: {problems[first]}")
+        drift = self.golden_drift(results)
+        if self.max_drift is not None and drift is not None and drift > self.max_drift:
+            return self.reject(signature, version, f"golden set drift {drift} exceeds {self.max_drift}")
+
+        if models_signature(self.models_dir) != signature:
+            # Files changed again while loading; the next poll picks the change up
+            self.pending_signature = None
+            log_event(log, logging.INFO, 'reload_deferred', version=version)
+            return False
+
+        models['model_version'] = version
+        previous = self.state['version']
+        with self.swap_lock:
+            self.install(models, signature)
+            self.golden_results = results
+            self.state['reloads'] += 1
+            self.state['last_drift'] = drift
+            self.state['last_error'] = None
+        increment('models.reloaded')
+        log_event(log, logging.WARNING, 'models_reloaded', version=version, previous=previous,
+                  drift=drift, seconds=round(time.perf_counter() - started, 3))
+        for callback in self.listeners:
+            callback(models)
+        return True
+
+    def reject(self, signature, version, error):
+        """Keep serving the current set; the rejected files are not retried until they change"""
+        self.signature = signature
+        self.pending_signature = None
+        self.state['rejected'] += 1
+        self.state['last_error'] = f"{version}: {error}"
+        increment('models.rejected')
+        log_event(log, logging.ERROR, 'reload_rejected', version=version, error=error)
+        return False
+
+    def stats(self):
+        """Reload state for the metrics snapshot"""
+        return dict(self.state)
+
+    def stop(self):
+        """Stop watching"""
+        self.stopped.set()
+
+
+def create_model_manager(argv, load, predict, golden_inputs=None):
+    """
+    ModelManager configured from --reload-interval, --golden-set and
+    --max-drift, loaded and watching
+    """
+    from eye_health_stream import get_option
+
+    golden_path = get_option(argv, '--golden-set')
+    max_drift = get_option(argv, '--max-drift')
+    manager = ModelManager(
+        load, predict,
+        golden_inputs=load_golden_inputs(golden_path) if golden_path else golden_inputs,
+        interval=float(get_option(argv, '--reload-interval', DEFAULT_RELOAD_INTERVAL)),
+        max_drift=float(max_drift) if max_drift is not None else None
+    )
+    manager.start()
+    return manager
+
+
+def main():
+    """Print the model version and signature of MODELS_DIR"""
+    signature = models_signature()
+    print(json.dumps({
+        "model_version": models_version(signature),
+        "files": {name: {"bytes": size, "mtime_ns": mtime} for name, size, mtime in signature}
+    }))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
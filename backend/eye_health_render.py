@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Precompiled recommendation lists
+The recommendation generators only depend on the age bucket, the risk level
+and (for the screen time script) the screen time band, so every distinct
+list is built once and looked up per response
+
+Output is byte-identical to json.dumps of build_eye_health_result
+"""
+import sys
+import json
+import warnings
+
+# Representative ageGroup per bucket of the generators' substring tests
+AGE_BUCKET_VALUES = ('65+', '45+', '')
+
+# Risk levels the generators branch on (anything else takes the last branch)
+RISK_LEVEL_VALUES = ('High', 'Medium', 'Low')
+
+# Representative screenTime per band of the screen time generator
+SCREEN_BAND_VALUES = (11, 9, 7, 0)
+
+_tables = {}
+
+
+def get_age_bucket(input_data):
+    """Age bucket index, evaluated with the generators' own tests"""
+    age_group = input_data.get('ageGroup', '')
+    if '65+' in age_group or '75+' in age_group or '85+' in age_group:
+        return 0
+    elif '45+' in age_group or '55+' in age_group:
+        return 1
+    else:
+        return 2
+
+
+def get_risk_bucket(prediction_result):
+    """Risk level index"""
+    risk_level = prediction_result.get("risk_level", "Medium")
+    if risk_level == "High":
+        return 0
+    elif risk_level == "Medium":
+        return 1
+    else:
+        return 2
+
+
+def get_screen_band(input_data):
+    """Screen time band index, same comparisons as the screen time generator"""
+    screen_time = input_data.get('screenTime', 8)
+    if screen_time > 10:
+        return 0
+    elif screen_time > 8:
+        return 1
+    elif screen_time > 6:
+        return 2
+    else:
+        return 3
+
+
+def compile_recommendation_table(generator, with_screen_band):
+    """
+    Run the generator once per distinct key
+    Returns key -> recommendations list
+    """
+    table = {}
+    bands = SCREEN_BAND_VALUES if with_screen_band else (None,)
+    for a, age_group in enumerate(AGE_BUCKET_VALUES):
+        for r, risk_level in enumerate(RISK_LEVEL_VALUES):
+            for b, screen_time in enumerate(bands):
+                input_data = {'ageGroup': age_group}
+                if with_screen_band:
+                    input_data['screenTime'] = screen_time
+                recommendations = generator(input_data, {'risk_level': risk_level})
+                key = (a, r, b) if with_screen_band else (a, r)
+                table[key] = recommendations
+    return table
+
+
+def get_final_table(generator=None):
+    """
+    Compiled table for generate_eye_health_recommendations
+    generator: the function to compile (the loaders pass their own module's)
+    """
+    table = _tables.get('final')
+    if table is None:
+        if generator is None:
+            from eye_health_predictor_final import generate_eye_health_recommendations as generator
+        table = _tables['final'] = compile_recommendation_table(generator, False)
+    return table
+
+
+def get_screentime_table(generator=None):
+    """
+    Compiled table for generate_eye_health_recommendations_with_screentime
+    generator: the function to compile (the loaders pass their own module's)
+    """
+    table = _tables.get('screentime')
+    if table is None:
+        if generator is None:
+            from eye_health_predictor_screentime import (
+                generate_eye_health_recommendations_with_screentime as generator)
+        table = _tables['screentime'] = compile_recommendation_table(generator, True)
+    return table
+
+
+def lookup_final(input_data, prediction_result):
+    """Shared recommendations list for the final script; raises where the generator would"""
+    return get_final_table()[(get_age_bucket(input_data), get_risk_bucket(prediction_result))]
+
+
+def lookup_screentime(input_data, prediction_result):
+    """Shared recommendations list for the screen time script; screen time is tested first, as in the generator"""
+    band = get_screen_band(input_data)
+    return get_screentime_table()[(get_age_bucket(input_data), get_risk_bucket(prediction_result), band)]
+
+
+def get_final_recommendations(input_data, prediction_result):
+    """Cached equivalent of generate_eye_health_recommendations (a fresh list)"""
+    return list(lookup_final(input_data, prediction_result))
+
+
+def get_screentime_recommendations(input_data, prediction_result):
+    """Cached equivalent of generate_eye_health_recommendations_with_screentime (a fresh list)"""
+    return list(lookup_screentime(input_data, prediction_result))
+
+
+def render_result_json(prediction_result, recommendations, input_data):
+    """json.dumps of the full result, with the recommendations list from the compiled table"""
+    return json.dumps({**prediction_result, "recommendations": recommendations, "input_data": input_data})
+
+
+def render_final_response(input_data, prediction_result):
+    """Response JSON for the final script"""
+    return render_result_json(prediction_result, lookup_final(input_data, prediction_result), input_data)
+
+
+def render_screentime_response(input_data, prediction_result):
+    """Response JSON for the screen time script"""
+    return render_result_json(prediction_result, lookup_screentime(input_data, prediction_result), input_data)
+
+
+def verify_render_parity():
+    """Compare cached rendering with the generators and json.dumps over a grid of inputs"""
+    import eye_health_predictor_final as final
+    import eye_health_predictor_screentime as screentime
+
+    age_groups = ['0–14', '25–34', '45–54', '65–74', '85+', '65+', '75+ years', '45+', '55+', '', 'bogus']
+    screen_times = [0, 0.0, -0.0, 2, 6, 6.5, 8, 8.01, 10, 10.5, 24, -1, True, float('nan')]
+    predictions = [
+        {"eye_risk": 12.5, "risk_level": "Low", "confidence": "High"},
+        {"eye_risk": 50.0, "risk_level": "Medium", "confidence": "Low", "error": "x"},
+        {"eye_risk": 95.0, "risk_level": "High", "confidence": "High", "base_risk": 99.1},
+        {"eye_risk": 40.0, "risk_level": "Unknown"},
+        {"eye_risk": 40.0},
+    ]
+
+    mismatches = []
+    for age_group in age_groups:
+        for prediction in predictions:
+            data = {'ageGroup': age_group, 'sex': 'Female'}
+            live = json.dumps({**prediction,
+                               "recommendations": final.generate_eye_health_recommendations(data, prediction),
+                               "input_data": data})
+            cached = render_final_response(data, prediction)
+            if live != cached:
+                mismatches.append({'path': 'final', 'input': data, 'prediction': prediction})
+
+            for screen_time in screen_times:
+                data = {'ageGroup': age_group, 'screenTime': screen_time}
+                live = json.dumps({
+                    **prediction,
+                    "recommendations": screentime.generate_eye_health_recommendations_with_screentime(
+                        data, prediction),
+                    "input_data": data})
+                cached = render_screentime_response(data, prediction)
+                if live != cached:
+                    mismatches.append({'path': 'screentime', 'input': data, 'prediction': prediction})
+
+    # Whole responses from the scripts' entry points
+    final_models = final.load_eye_models()
+    screentime_models = screentime.load_eye_models_with_screentime(include_screentime_model=False)
+    for age_group in final_models['eye']['le_value'].classes_.tolist():
+        for screen_time in (1, 7, 9, 12):
+            data = {'ageGroup': age_group, 'sex': 'Male', 'screenTime': screen_time}
+            if (json.dumps(final.build_eye_health_result(dict(data), final_models))
+                    != final.render_eye_health_result(dict(data), final_models)):
+                mismatches.append({'path': 'final_response', 'input': data})
+            if (json.dumps(screentime.build_eye_health_result(dict(data), screentime_models))
+                    != screentime.render_eye_health_result(dict(data), screentime_models)):
+                mismatches.append({'path': 'screentime_response', 'input': data})
+
+    return mismatches
+
+
+def main():
+    """Check cached rendering against the live generators (--check)"""
+    if '--check' not in sys.argv:
+        print("Usage: python eye_health_render.py --check", file=sys.stderr)
+        sys.exit(2)
+
+    mismatches = verify_render_parity()
+    print(json.dumps({
+        "parity": not mismatches,
+        "mismatches": len(mismatches),
+        "examples": mismatches[:5]
+    }, default=str))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Asyncio HTTP prediction server (stdlib only)
+Holds the eye health and wellness models in memory and serves the same
+routes and payloads as server.js, without spawning Python per request
+
+Model calls run in a bounded thread pool. When more than --max-pending
+requests are waiting, new ones get 503. A request that runs longer than
+--timeout gets 504. SIGTERM/SIGINT stop accepting connections and let
+in-flight requests finish. Changed model files are loaded, checked and
+swapped in while serving (eye_health_reload.py); responses report the
+model_version that served them. With --coalesce, concurrent eye health
+predictions in the thread pool share batch calls (eye_health_coalesce.py);
+--slim serves the eye models without lightgbm or sklearn (eye_health_memory.py)
+
+Usage: python eye_health_server.py [--host 127.0.0.1] [--port 8001]
+       [--threads N] [--max-pending 1024] [--timeout 30] [--trees | --slim] [--no-wellness]
+       [--prefork N [--max-requests 1000] [--max-rss-mb 512]]
+       [--reload-interval 5] [--golden-set PATH] [--max-drift POINTS]
+       [--coalesce [--max-batch 64] [--batch-window-ms 2]]
+"""
+import sys
+import json
+import os
+import warnings
+import asyncio
+import signal
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import eye_health_predictor_final as final
+import eye_health_predictor_screentime as screentime
+from eye_health_metrics import get_logger, log_event, increment, span, metrics_snapshot
+from eye_health_stream import get_option
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8001
+DEFAULT_MAX_PENDING = 1024
+# Same limit as PREDICTION_REQUEST_TIMEOUT_MS in server.js
+DEFAULT_TIMEOUT_SECONDS = 30.0
+# Idle keep-alive connections are closed after this long
+KEEP_ALIVE_SECONDS = 15.0
+SHUTDOWN_GRACE_SECONDS = 30.0
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_REASONS = {
+    200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 408: 'Request Timeout', 411: 'Length Required',
+    413: 'Payload Too Large', 500: 'Internal Server Error', 502: 'Bad Gateway',
+    503: 'Service Unavailable', 504: 'Gateway Timeout'
+}
+
+log = get_logger('server')
+
+
+class HttpError(Exception):
+    """Request that cannot be served; becomes a JSON error response"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def load_server_models(use_trees=False, include_wellness=True, coalesce=None, slim=False):
+    """
+    Load every model set once
+    The final script's model set is the screen time script's original model,
+    so the eye model and its encoders are held in memory only once
+    coalesce: optional (max_batch, batch_window_ms) for batching concurrent
+    eye health predictions
+    slim: serve the eye models from the slim profile (no lightgbm, sklearn)
+    """
+    if slim:
+        from eye_health_memory import load_eye_models_with_screentime_slim
+        screentime_models = load_eye_models_with_screentime_slim(include_screentime_model=False)
+    elif use_trees:
+        from eye_health_trees import load_eye_models_with_screentime_trees
+        screentime_models = load_eye_models_with_screentime_trees(include_screentime_model=False)
+    else:
+        screentime_models = screentime.load_eye_models_with_screentime(include_screentime_model=False)
+    if "error" in screentime_models:
+        return screentime_models
+    # Explanations are served from contribution tables built here, once
+    from eye_health_explain import attach_contributions
+    attach_contributions(screentime_models)
+
+    models = {
+        'final': {'eye': screentime_models['eye_original']},
+        'screentime': screentime_models
+    }
+    if coalesce is not None:
+        from eye_health_coalesce import Coalescer
+        from eye_health_batch import (
+            predict_eye_health_risk_final_batch, predict_eye_health_with_screentime_batch
+        )
+        models['final']['coalescer'] = Coalescer(
+            predict_eye_health_risk_final_batch, final.predict_eye_health_risk_final, *coalesce,
+            name='coalesce.final')
+        screentime_models['coalescer'] = Coalescer(
+            predict_eye_health_with_screentime_batch, screentime.predict_eye_health_with_screentime, *coalesce,
+            name='coalesce.screentime')
+    if include_wellness:
+        from wellness_predictor import load_wellness_models
+        wellness_models = load_wellness_models()
+        if "error" in wellness_models:
+            return wellness_models
+        models['wellness'] = wellness_models
+    return models
+
+
+def timestamp():
+    """ISO 8601 timestamp in the format of JavaScript's Date.toISOString()"""
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def encode_json(payload):
+    """
+    Compact UTF-8 JSON, as Express's res.json() writes it
+    NaN and Infinity raise ValueError (a 500) instead of going out as invalid JSON
+    """
+    with span('serialization'):
+        return json.dumps(payload, ensure_ascii=False, allow_nan=False,
+                          separators=(',', ':')).encode('utf-8')
+
+
+def success_response(result):
+    """Wrap a prediction in the server.js response envelope"""
+    if result.get('error'):
+        if result.get('errors'):
+            # Rejected by input validation (invalid_result sets both keys)
+            return 400, {"error": result['error'], "errors": result['errors']}
+        return 500, {"error": result['error']}
+    # Per-family "errors" without "error" (wellness fallbacks) are a normal result
+    return 200, {"success": True, "data": result, "timestamp": timestamp()}
+
+
+def analyze_eye_health(data, models):
+    """POST /api/eye-health/analyze: screen time script when screenTime is given"""
+    if data.get('screenTime') is not None:
+        result = screentime.build_eye_health_result(data, models['screentime'])
+    else:
+        result = final.build_eye_health_result(data, models['final'])
+    return success_response(result)
+
+
+def sweep_eye_health(data, models):
+    """POST /api/eye-health/sweep: risk curves across screen time"""
+    from eye_health_sweep import sweep_screen_time
+    return success_response(sweep_screen_time(data, models['screentime']))
+
+
+def aggregate_eye_health(data, models):
+    """POST /api/eye-health/aggregate: weighted risk distribution over population cells"""
+    from eye_health_aggregate import aggregate_population
+    return success_response(aggregate_population(data, models['screentime']))
+
+
+def explain_eye_health(data, models):
+    """POST /api/eye-health/explain: prediction plus per-feature risk contributions"""
+    from eye_health_explain import explain_final, explain_screentime
+    if isinstance(data, dict) and data.get('predictor') == 'final':
+        return success_response(explain_final(data, models['final']))
+    return success_response(explain_screentime(data, models['screentime']))
+
+
+def predict_wellness(data, models):
+    """POST /api/wellness/predict"""
+    from wellness_predictor import build_wellness_result
+    return success_response(build_wellness_result(data, models['wellness']))
+
+
+# Same lists as GET /api/wellness/options in server.js
+WELLNESS_OPTIONS = {
+    "age_groups": ['18–24', '25–34', '35–44', '45–54', '55–64', '65+'],
+    "genders": ['Male', 'Female', 'Persons'],
+    "states": ['NSW', 'VIC', 'QLD', 'SA', 'WA', 'TAS', 'NT', 'ACT'],
+    "activity_levels": ['Zero activity', 'Low activity', 'Moderate activity', 'High activity'],
+    "health_conditions": ['Obese', 'Overweight', 'Normal weight', 'Underweight'],
+    "guidelines": ['Meeting guidelines', 'Not meeting guidelines']
+}
+
+# (method, path) -> (handler, runs in the thread pool)
+ROUTES = {
+    ('POST', '/api/eye-health/analyze'): (analyze_eye_health, True),
+    ('POST', '/api/eye-health/sweep'): (sweep_eye_health, True),
+    ('POST', '/api/eye-health/aggregate'): (aggregate_eye_health, True),
+    ('POST', '/api/eye-health/explain'): (explain_eye_health, True),
+    ('POST', '/api/wellness/predict'): (predict_wellness, True),
+    ('GET', '/api/health'): (lambda data, models: (200, {
+        "status": "OK",
+        "message": "Wellness API is running",
+        "timestamp": timestamp()
+    }), False),
+    ('GET', '/api/wellness/options'): (lambda data, models: (200, WELLNESS_OPTIONS), False),
+    ('GET', '/api/eye-health/metrics'): (lambda data, models: (200, {
+        "success": True,
+        "data": metrics_snapshot(),
+        "timestamp": timestamp()
+    }), False),
+}
+
+
+def predict_golden(data, models):
+    """Golden-set prediction a reloaded model set must pass: the analyze route's result"""
+    return screentime.build_eye_health_result(data, models['screentime'])
+
+
+def build_prediction(handler, data, models):
+    """Run a handler and serialize its response (in the thread pool)"""
+    status, payload = handler(data, models)
+    if status == 200 and models.get('model_version'):
+        payload['model_version'] = models['model_version']
+    return status, encode_json(payload)
+
+
+class PredictionServer:
+    """HTTP/1.1 front end with a bounded prediction executor"""
+
+    def __init__(self, models, threads=None, max_pending=DEFAULT_MAX_PENDING,
+                 timeout=DEFAULT_TIMEOUT_SECONDS):
+        self.models = models
+        self.executor = ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1,
+                                           thread_name_prefix='predict')
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.connections = set()
+        self.in_flight = set()
+        self.shutting_down = False
+        self.server = None
+
+    async def run_route(self, method, path, body):
+        """Dispatch one request; returns (status, body bytes)"""
+        route = ROUTES.get((method, path))
+        if route is None:
+            if any(route_path == path for _, route_path in ROUTES):
+                raise HttpError(405, f"Method {method} not allowed for {path}")
+            raise HttpError(404, f"Route {path} not found")
+        handler, in_pool = route
+
+        data = {}
+        if method == 'POST':
+            try:
+                data = json.loads(body) if body else {}
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                raise HttpError(400, f"Invalid JSON: {str(e)}")
+            if not isinstance(data, dict):
+                raise HttpError(400, "Request body must be a JSON object")
+
+        if not in_pool:
+            status, payload = handler(data, self.models)
+            return status, encode_json(payload)
+
+        # Backpressure: reject instead of queueing without bound
+        if self.pending >= self.max_pending:
+            increment('http.rejected')
+            raise HttpError(503, "Server busy, retry later")
+
+        self.pending += 1
+        future = self.submit_prediction(handler, data)
+        try:
+            # shield: a timed-out call still finishes in its thread and
+            # keeps its pending slot until it does
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            increment('http.timeouts')
+            raise HttpError(504, f"Prediction timed out after {self.timeout:g}s")
+        finally:
+            if future.done():
+                self.pending -= 1
+            else:
+                future.add_done_callback(self.release_slot)
+
+    def swap_models(self, models):
+        """Serve a reloaded model set; requests already submitted keep the old one"""
+        self.models = models
+
+    def submit_prediction(self, handler, data):
+        """Run build_prediction off the event loop; returns a future of (status, body)"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, build_prediction, handler, data, self.models)
+
+    def release_slot(self, future):
+        """Free a pending slot once a timed-out prediction finally returns"""
+        self.pending -= 1
+
+    async def read_request(self, reader):
+        """Parse one HTTP/1.1 request; None when the client closed the connection"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_SECONDS)
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(413, "Request headers too large")
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise HttpError(411, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+
+        body = await asyncio.wait_for(reader.readexactly(length), self.timeout) if length else b''
+        keep_alive = (headers.get('connection', '').lower() != 'close'
+                      and version.upper() == 'HTTP/1.1')
+        return method.upper(), target.split('?', 1)[0], body, keep_alive
+
+    def write_response(self, writer, status, body, keep_alive):
+        """Write status line, headers and body"""
+        headers = [
+            f"HTTP/1.1 {status} {STATUS_REASONS.get(status, 'Unknown')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            "Access-Control-Allow-Origin: *",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until it closes or goes idle"""
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            keep_alive = True
+            while keep_alive and not self.shutting_down:
+                try:
+                    request = await self.read_request(reader)
+                except asyncio.TimeoutError:
+                    break
+                except HttpError as e:
+                    self.write_response(writer, e.status, encode_json({"error": str(e)}), False)
+                    break
+                if request is None:
+                    break
+
+                method, path, body, keep_alive = request
+                increment('http.requests')
+                self.in_flight.add(task)
+                try:
+                    if method == 'OPTIONS':
+                        # CORS preflight, as the cors() middleware answers it
+                        status, response_body = 204, b''
+                    else:
+                        status, response_body = await self.run_route(method, path, body)
+                except HttpError as e:
+                    status, response_body = e.status, encode_json({"error": str(e)})
+                except Exception as e:
+                    log_event(log, logging.ERROR, 'request_error', path=path, error=str(e),
+                              exc_info=log.isEnabledFor(logging.DEBUG))
+                    status, response_body = 500, encode_json({
+                        "error": "Internal server error",
+                        "details": str(e)
+                    })
+                finally:
+                    self.in_flight.discard(task)
+
+                keep_alive = keep_alive and not self.shutting_down
+                self.write_response(writer, status, response_body, keep_alive)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def serve(self, host, port):
+        """Serve until SIGTERM/SIGINT, then drain in-flight requests"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+
+        self.server = await asyncio.start_server(self.handle_connection, host, port,
+                                                 limit=MAX_HEADER_BYTES, backlog=4096)
+        print(f"Eye health prediction server listening on http://{host}:{port}", file=sys.stderr)
+        await stop.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Stop accepting, let in-flight requests finish, close idle connections"""
+        self.shutting_down = True
+        self.server.close()
+        await self.server.wait_closed()
+
+        deadline = asyncio.get_running_loop().time() + SHUTDOWN_GRACE_SECONDS
+        while self.in_flight and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+        for task in list(self.connections):
+            task.cancel()
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    """Load the models and run the server"""
+    from eye_health_reload import create_model_manager, EYE_GOLDEN_INPUTS
+    from eye_health_memory import track_memory
+
+    argv = sys.argv[1:]
+    coalesce = None
+    if '--coalesce' in argv and '--prefork' not in argv:
+        # Prefork workers take one request at a time, so there is nothing to coalesce
+        from eye_health_coalesce import coalesce_options
+        coalesce = coalesce_options(argv)
+    manager = create_model_manager(
+        argv,
+        lambda: load_server_models(use_trees='--trees' in argv, include_wellness='--no-wellness' not in argv,
+                                   coalesce=coalesce, slim='--slim' in argv),
+        predict_golden, EYE_GOLDEN_INPUTS
+    )
+    track_memory(lambda: manager.models)
+    models = manager.models
+    if "error" in models:
+        print(json.dumps({"error": models["error"]}))
+        sys.exit(1)
+
+    options = {
+        'max_pending': int(get_option(argv, '--max-pending', DEFAULT_MAX_PENDING)),
+        'timeout': float(get_option(argv, '--timeout', DEFAULT_TIMEOUT_SECONDS))
+    }
+    if '--prefork' in argv:
+        # Forked worker processes instead of threads (see eye_health_prefork.py)
+        from eye_health_prefork import create_prefork_server
+        server = create_prefork_server(models, argv, fork_guard=manager.swap_guard, **options)
+    else:
+        threads = get_option(argv, '--threads')
+        if threads is None and coalesce is not None:
+            # Coalesced callers mostly wait on their batch; the pool bounds the batch size
+            threads = max(os.cpu_count() or 1, coalesce[0])
+        server = PredictionServer(models, threads=int(threads) if threads else None, **options)
+    manager.add_listener(server.swap_models)
+    host = get_option(argv, '--host', os.environ.get('HOST', DEFAULT_HOST))
+    port = int(get_option(argv, '--port', os.environ.get('EYE_HEALTH_PORT', DEFAULT_PORT)))
+    asyncio.run(server.serve(host, port))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Shadow-mode dual-model scoring for the screen time eye health predictor
+Resolves the screen time model's feature pipeline once at load time, scores
+every batch with both the original model (plus screen time adjustment) and
+eye_model_screentime.pkl, serves the configured primary model and records
+divergence statistics and per-model latency
+
+Primary model: --primary original|screentime or EYE_HEALTH_PRIMARY_MODEL
+(default original)
+"""
+import sys
+import json
+import os
+import re
+import threading
+import warnings
+
+import numpy as np
+
+from eye_health_encoding import compile_encoder, UNKNOWN_CODE
+from eye_health_metrics import span, register_section
+from eye_health_stream import get_option
+
+PRIMARY_MODELS = ('original', 'screentime')
+PRIMARY_MODEL_ENV = 'EYE_HEALTH_PRIMARY_MODEL'
+
+# Gender code meaning "average the prediction over every gender class"
+ALL_GENDERS = -2
+
+# Feature roles, matched against the model's feature names in this order
+# ('average' contains 'age', so screen time is matched first)
+FEATURE_ROLES = (('screen', ('screen',)), ('gender', ('gender', 'sex')), ('age', ('age',)))
+
+
+def parse_range(label):
+    """
+    Numeric range of a category label such as '25–34', '8-10', 'Below 18',
+    '45 and above', 'More than 10' or '85+'
+    Returns (low, high) with open ends as -inf/inf, or None when not a range
+    """
+    if not isinstance(label, str):
+        return None
+    text = label.strip().lower().replace('–', '-').replace('—', '-')
+    numbers = [float(n) for n in re.findall(r'\d+(?:\.\d+)?', text)]
+    if not numbers:
+        return None
+    if any(word in text for word in ('below', 'under', 'less than')):
+        return float('-inf'), numbers[0]
+    if any(word in text for word in ('above', 'more than', 'over')) or text.endswith('+'):
+        return numbers[0], float('inf')
+    if len(numbers) == 2 and '-' in text:
+        return numbers[0], numbers[1]
+    return None
+
+
+def get_feature_names(model):
+    """Feature names of an LGBMClassifier or a TreeEnsemble"""
+    names = getattr(model, 'feature_name_', None)
+    if names is None and hasattr(model, 'meta'):
+        names = model.meta.get('feature_names')
+    if not names:
+        raise ValueError("Screen time model has no feature names")
+    return list(names)
+
+
+def resolve_screentime_pipeline(screentime_models):
+    """
+    Work out how requests map onto the screen time model's features
+    screentime_models: models['eye_screentime'] ({'model', 'encoders'})
+    Raises ValueError when the model and encoders do not line up, instead of
+    falling back to zero features at request time
+    """
+    model = screentime_models['model']
+    encoders = screentime_models.get('compiled') or screentime_models.get('encoders')
+    if not isinstance(encoders, dict):
+        raise ValueError(f"Expected a dict of screen time encoders, got {type(encoders).__name__}")
+
+    feature_names = get_feature_names(model)
+    by_normalized_name = {key.replace('_', ' ').strip().lower(): key for key in encoders}
+    encoder_keys = []
+    for name in feature_names:
+        key = by_normalized_name.get(name.replace('_', ' ').strip().lower())
+        if key is None:
+            raise ValueError(f"No encoder for screen time feature {name!r}")
+        encoder_keys.append(key)
+
+    columns = {}
+    for role, words in FEATURE_ROLES:
+        for column, key in enumerate(encoder_keys):
+            if column not in columns.values() and any(word in key.lower() for word in words):
+                columns[role] = column
+                break
+        else:
+            raise ValueError(f"Screen time model has no {role} feature: {feature_names}")
+
+    compiled = [compile_encoder(encoders[key]) for key in encoder_keys]
+    age_encoder = compiled[columns['age']]
+    gender_encoder = compiled[columns['gender']]
+    screen_encoder = compiled[columns['screen']]
+
+    # Age classes as [low, high) in years; closed ranges cover whole years
+    age_ranges = []
+    for code, label in enumerate(age_encoder.classes_.tolist()):
+        bounds = parse_range(label)
+        if bounds is None:
+            raise ValueError(f"Cannot parse screen time model age class {label!r}")
+        low, high = bounds
+        age_ranges.append((low, high if high == float('inf') or low == float('-inf') else high + 1, code))
+
+    # Screen time classes ordered by upper bound; hours map to the first
+    # class whose upper bound is >= the value (same <= rule as the adjustment)
+    screen_bounds = []
+    for code, label in enumerate(screen_encoder.classes_.tolist()):
+        bounds = parse_range(label)
+        if bounds is None:
+            raise ValueError(f"Cannot parse screen time model screen time class {label!r}")
+        screen_bounds.append((bounds[1], code))
+    screen_bounds.sort()
+
+    return {
+        'model': model,
+        'feature_names': feature_names,
+        'encoder_keys': encoder_keys,
+        'columns': columns,
+        'age_ranges': age_ranges,
+        'age_codes': {},
+        'gender_codes': dict(gender_encoder.index),
+        'gender_classes': np.arange(len(gender_encoder.classes_)),
+        'screen_upper': np.array([upper for upper, _ in screen_bounds], dtype=np.float64),
+        'screen_codes': np.array([code for _, code in screen_bounds], dtype=np.int64),
+    }
+
+
+def map_age_group(pipeline, age_group):
+    """Screen time model age code for a request age group (cached per distinct value)"""
+    try:
+        return pipeline['age_codes'][age_group]
+    except KeyError:
+        pass
+    except TypeError:
+        return UNKNOWN_CODE
+
+    code = UNKNOWN_CODE
+    bounds = parse_range(age_group)
+    if bounds is not None:
+        low, high = bounds
+        # Representative age: the midpoint, or the closed end of an open range
+        age = low if high == float('inf') else high if low == float('-inf') else (low + high) / 2
+        for range_low, range_high, range_code in pipeline['age_ranges']:
+            if range_low <= age < range_high:
+                code = range_code
+                break
+    pipeline['age_codes'][age_group] = code
+    return code
+
+
+def encode_pipeline_columns(pipeline, age_groups, sexes, screen_times):
+    """
+    Encode request columns for the screen time model
+    Returns (age, gender, screen) code arrays and a valid mask; gender is
+    ALL_GENDERS for sexes the model was not trained on (e.g. 'Persons')
+    """
+    n = len(age_groups)
+    age = np.fromiter((map_age_group(pipeline, value) for value in age_groups), dtype=np.int64, count=n)
+
+    gender_codes = pipeline['gender_codes']
+    gender = np.empty(n, dtype=np.int64)
+    for i, sex in enumerate(sexes):
+        try:
+            gender[i] = gender_codes.get(sex, ALL_GENDERS)
+        except TypeError:
+            gender[i] = ALL_GENDERS
+
+    hours = np.full(n, np.nan, dtype=np.float64)
+    for i, screen_time in enumerate(screen_times):
+        if isinstance(screen_time, (int, float)):
+            hours[i] = screen_time
+    valid_hours = ~np.isnan(hours)
+    rank = np.searchsorted(pipeline['screen_upper'], np.where(valid_hours, hours, 0.0), side='left')
+    screen = pipeline['screen_codes'][np.minimum(rank, len(pipeline['screen_codes']) - 1)]
+
+    valid = (age != UNKNOWN_CODE) & valid_hours
+    return age, gender, screen, valid
+
+
+def predict_pipeline_probabilities(pipeline, age, gender, screen, valid):
+    """
+    One predict_proba call over the distinct encoded rows; NaN where invalid
+    Rows with ALL_GENDERS get the mean over every gender class
+    """
+    prob = np.full(len(age), np.nan, dtype=np.float64)
+    if not valid.any():
+        return prob
+
+    known = valid & (gender != ALL_GENDERS)
+    averaged = valid & (gender == ALL_GENDERS)
+    gender_classes = pipeline['gender_classes']
+
+    parts = [np.column_stack([age[known], gender[known], screen[known]])]
+    for code in gender_classes:
+        parts.append(np.column_stack([age[averaged], np.full(int(averaged.sum()), code), screen[averaged]]))
+    rows = np.concatenate(parts)
+
+    unique_rows, inverse = np.unique(rows, axis=0, return_inverse=True)
+    columns = pipeline['columns']
+    X_input = np.empty((len(unique_rows), 3), dtype=np.int64)
+    X_input[:, columns['age']] = unique_rows[:, 0]
+    X_input[:, columns['gender']] = unique_rows[:, 1]
+    X_input[:, columns['screen']] = unique_rows[:, 2]
+    row_prob = pipeline['model'].predict_proba(X_input)[:, 1][inverse.ravel()]
+
+    n_known = int(known.sum())
+    prob[known] = row_prob[:n_known]
+    if averaged.any():
+        prob[averaged] = row_prob[n_known:].reshape(len(gender_classes), -1).mean(axis=0)
+    return prob
+
+
+class DivergenceStats:
+    """Running comparison of the two models' risks (percent) and risk levels"""
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.lock = threading.Lock()
+        self.compared = 0
+        self.only_original = 0
+        self.only_screentime = 0
+        self.abs_diff_sum = 0.0
+        self.diff_sum = 0.0
+        self.max_abs_diff = 0.0
+        self.level_agreement = 0
+        self.level_pairs = {}
+
+    def record(self, original_risk, screentime_risk, original_levels, screentime_levels,
+               only_original=0, only_screentime=0):
+        """Add one batch of paired risks (arrays over rows both models scored)"""
+        diff = np.asarray(screentime_risk, dtype=np.float64) - np.asarray(original_risk, dtype=np.float64)
+        pairs = {}
+        for original_level, screentime_level in zip(original_levels, screentime_levels):
+            pair = f"{original_level}->{screentime_level}"
+            pairs[pair] = pairs.get(pair, 0) + 1
+        with self.lock:
+            self.compared += len(diff)
+            self.only_original += only_original
+            self.only_screentime += only_screentime
+            if len(diff):
+                self.abs_diff_sum += float(np.abs(diff).sum())
+                self.diff_sum += float(diff.sum())
+                self.max_abs_diff = max(self.max_abs_diff, float(np.abs(diff).max()))
+            for pair, count in pairs.items():
+                self.level_pairs[pair] = self.level_pairs.get(pair, 0) + count
+                if pair.split('->')[0] == pair.split('->')[1]:
+                    self.level_agreement += count
+
+    def snapshot(self):
+        """JSON-serializable summary"""
+        with self.lock:
+            compared = self.compared
+            return {
+                "primary": self.primary,
+                "compared": compared,
+                "only_original": self.only_original,
+                "only_screentime": self.only_screentime,
+                "mean_abs_diff": round(self.abs_diff_sum / compared, 4) if compared else None,
+                "mean_diff_screentime_minus_original": round(self.diff_sum / compared, 4) if compared else None,
+                "max_abs_diff": round(self.max_abs_diff, 4),
+                "risk_level_agreement": round(self.level_agreement / compared, 4) if compared else None,
+                "risk_level_pairs": dict(sorted(self.level_pairs.items())),
+            }
+
+
+def get_primary_model(argv):
+    """Primary model from --primary, EYE_HEALTH_PRIMARY_MODEL or the default"""
+    primary = get_option(argv, '--primary') or os.environ.get(PRIMARY_MODEL_ENV) or 'original'
+    if primary not in PRIMARY_MODELS:
+        raise ValueError(f"Unknown primary model {primary!r}, expected one of {PRIMARY_MODELS}")
+    return primary
+
+
+def with_shadow(load_models, primary='original'):
+    """Wrap the screen time script's loader so the models carry a shadow setup"""
+    def load():
+        models = load_models()
+        if "error" in models:
+            return models
+        if 'eye_screentime' not in models:
+            return {"error": "Shadow mode needs the screen time model (do not combine with --lazy)"}
+        try:
+            pipeline = resolve_screentime_pipeline(models['eye_screentime'])
+        except ValueError as e:
+            return {"error": f"Screen time model pipeline could not be resolved: {str(e)}"}
+        models['eye_screentime']['pipeline'] = pipeline
+        stats = DivergenceStats(primary)
+        models['shadow'] = {'primary': primary, 'pipeline': pipeline, 'stats': stats}
+        register_section('shadow', stats.snapshot)
+        return models
+    return load
+
+
+def predict_shadow_batch(records, models):
+    """
+    Score records with both models (one predict_proba call each) and return
+    the primary model's results; records divergence where both models scored
+    """
+    from eye_health_batch import (
+        to_columns,
+        predict_eye_health_with_screentime_batch,
+        get_risk_level_array,
+        get_confidence_score_array,
+    )
+    from eye_health_predictor_screentime import calculate_screen_time_impact
+
+    shadow = models['shadow']
+    pipeline = shadow['pipeline']
+
+    with span('model.original'):
+        original_results = predict_eye_health_with_screentime_batch(records, models)
+
+    with span('model.screentime'):
+        columns = to_columns(records, {'ageGroup': '25–34', 'sex': 'Male', 'screenTime': 8})
+        age, gender, screen, valid = encode_pipeline_columns(
+            pipeline, columns['ageGroup'], columns['sex'], columns['screenTime'])
+        screentime_prob = predict_pipeline_probabilities(pipeline, age, gender, screen, valid)
+        risk_levels = get_risk_level_array(screentime_prob)
+        confidences = get_confidence_score_array(screentime_prob)
+
+    original_valid = np.array(['error' not in result for result in original_results], dtype=bool)
+    both = original_valid & valid
+    shadow['stats'].record(
+        [original_results[i]['eye_risk'] for i in np.flatnonzero(both)],
+        np.round(screentime_prob[both] * 100, 2),
+        [original_results[i]['risk_level'] for i in np.flatnonzero(both)],
+        risk_levels[both].tolist(),
+        only_original=int((original_valid & ~valid).sum()),
+        only_screentime=int((valid & ~original_valid).sum())
+    )
+
+    if shadow['primary'] != 'screentime':
+        return original_results
+
+    results = []
+    for i, result in enumerate(original_results):
+        if not valid[i]:
+            # Fall back to the original model when the screen time model cannot score
+            results.append(result)
+            continue
+        results.append({
+            "eye_risk": round(float(screentime_prob[i]) * 100, 2),
+            "risk_level": str(risk_levels[i]),
+            "confidence": str(confidences[i]),
+            "model_used": "screen_time_model",
+            "screen_time_impact": calculate_screen_time_impact(columns['screenTime'][i])
+        })
+    return results
+
+
+def predict_shadow(data, models):
+    """Shadow scoring for one record"""
+    return predict_shadow_batch([data], models)[0]
+
+
+def verify_shadow(primary='original'):
+    """
+    Check the shadow path: with primary 'original' results equal the batch
+    function, and screen time probabilities equal a direct predict_proba on
+    rows encoded with the fitted LabelEncoders
+    Returns (mismatches, divergence snapshot)
+    """
+    from eye_health_predictor_screentime import load_eye_models_with_screentime
+    from eye_health_batch import predict_eye_health_with_screentime_batch
+
+    models = with_shadow(load_eye_models_with_screentime, primary)()
+    if "error" in models:
+        return [{"error": models["error"]}], None
+
+    age_groups = ['0–14', '15–24', '25–34', '35–44', '45–54', '55–64', '65–74', '75–84', '85+',
+                  '18–24', 'Below 18', '45 and above', 'bogus', None]
+    records = [
+        {'ageGroup': age_group, 'sex': sex, 'screenTime': screen_time}
+        for age_group in age_groups
+        for sex in ('Male', 'Female', 'Persons')
+        for screen_time in (0, 2, 3, 4, 5, 6.5, 8, 9, 10, 11, 24, 'x')
+    ]
+
+    mismatches = []
+    results = predict_shadow_batch(records, models)
+    if primary == 'original':
+        expected = predict_eye_health_with_screentime_batch(records, models)
+        mismatches.extend({'path': 'primary', 'input': r, 'shadow': a, 'expected': b}
+                          for r, a, b in zip(records, results, expected) if a != b)
+
+    # Independent encoding with the fitted LabelEncoders
+    pipeline = models['shadow']['pipeline']
+    encoders = models['eye_screentime']['encoders']
+    keys = pipeline['encoder_keys']
+    columns = pipeline['columns']
+    expected_age = {'0–14': 'Below 18', '15–24': '18–24', '25–34': '25–34', '35–44': '35–44',
+                    '45–54': '45 and above', '55–64': '45 and above', '65–74': '45 and above',
+                    '75–84': '45 and above', '85+': '45 and above', '18–24': '18–24',
+                    'Below 18': 'Below 18', '45 and above': '45 and above'}
+    expected_screen = [(4, '2–4'), (6, '4–6'), (8, '6–8'), (10, '8-10'), (float('inf'), 'More than 10')]
+    age, gender, screen, valid = encode_pipeline_columns(
+        pipeline, [r['ageGroup'] for r in records], [r['sex'] for r in records],
+        [r['screenTime'] for r in records])
+    prob = predict_pipeline_probabilities(pipeline, age, gender, screen, valid)
+    for i, record in enumerate(records):
+        age_label = expected_age.get(record['ageGroup'])
+        if age_label is None or not isinstance(record['screenTime'], (int, float)):
+            if valid[i]:
+                mismatches.append({'path': 'validity', 'input': record})
+            continue
+        screen_label = next(label for upper, label in expected_screen if record['screenTime'] <= upper)
+        sexes = [record['sex']] if record['sex'] in ('Male', 'Female') else ['Female', 'Male']
+        row_probs = []
+        for sex in sexes:
+            row = [0, 0, 0]
+            row[columns['age']] = encoders[keys[columns['age']]].transform([age_label])[0]
+            row[columns['gender']] = encoders[keys[columns['gender']]].transform([sex])[0]
+            row[columns['screen']] = encoders[keys[columns['screen']]].transform([screen_label])[0]
+            row_probs.append(pipeline['model'].predict_proba(np.array([row]))[:, 1][0])
+        if not valid[i] or abs(np.mean(row_probs) - prob[i]) > 1e-12:
+            mismatches.append({'path': 'screentime', 'input': record,
+                               'expected': float(np.mean(row_probs)), 'shadow': float(prob[i])})
+
+    return mismatches, models['shadow']['stats'].snapshot()
+
+
+def main():
+    """Check the shadow pipeline and print divergence over a grid of inputs (--check)"""
+    if '--check' not in sys.argv:
+        print("Usage: python eye_health_shadow.py --check [--primary original|screentime]", file=sys.stderr)
+        sys.exit(2)
+
+    mismatches, divergence = verify_shadow(get_primary_model(sys.argv[1:]))
+    print(json.dumps({
+        "parity": not mismatches,
+        "mismatches": len(mismatches),
+        "examples": mismatches[:5],
+        "divergence": divergence
+    }, default=str))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
@@ -0,0 +1,95 @@
+"""
+Import-light startup helpers for the eye health predictor scripts
+Defers heavy imports until first use and records cold-start time per phase
+"""
+import sys
+import os
+import time
+import importlib
+import importlib.util
+from contextlib import contextmanager
+
+# Modules the predictors need before the first prediction (lightgbm and
+# sklearn are pulled in by unpickling the models)
+HEAVY_MODULES = ('numpy', 'joblib', 'sklearn.preprocessing', 'lightgbm')
+
+_phases = {}
+_profile_started = time.perf_counter()
+
+
+def lazy_import(name):
+    """Return a module that is only executed on first attribute access"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def interpreter_start_phase():
+    """
+    (phase name, seconds) from process start to this module's import
+    Wall time from /proc where it exists (Linux); elsewhere the CPU time the
+    process has used so far, reported as interpreter_start_cpu
+    """
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # Field 22 (starttime) follows the parenthesised command name
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return 'interpreter_start', max(0.0, uptime - started - (time.perf_counter() - _profile_started))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 'interpreter_start_cpu', time.process_time()
+
+
+_interpreter_start = interpreter_start_phase()
+
+
+def record_phase(name, seconds):
+    """Add time to a named startup phase"""
+    _phases[name] = _phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed_phase(name):
+    """Time the enclosed block as a startup phase"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def import_heavy_modules(names=HEAVY_MODULES):
+    """Import numpy/joblib/sklearn/lightgbm now so they show up as one phase"""
+    with timed_phase('imports'):
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+
+
+def load_artifact(path):
+    """joblib.load one artifact and record its load time"""
+    import joblib
+    with timed_phase(f"load:{os.path.basename(path)}"):
+        return joblib.load(path)
+
+
+def startup_report():
+    """Per-phase cold-start timings in milliseconds"""
+    name, seconds = _interpreter_start
+    report = {name: round(seconds * 1000, 2)}
+    for name, seconds in _phases.items():
+        report[name] = round(seconds * 1000, 2)
+    report['total_since_import'] = round((time.perf_counter() - _profile_started) * 1000, 2)
+    return report
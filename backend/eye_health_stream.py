@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Streaming NDJSON/CSV scoring for the eye health predictor scripts
+Reads records incrementally, scores them in fixed-size chunks with the batch
+API and writes one NDJSON result per input record, so memory stays constant
+regardless of input size
+"""
+import sys
+import json
+import csv
+import io
+import itertools
+
+from eye_health_validation import invalid_result
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# CSV columns understood by the predictors; other columns are passed through
+CSV_NUMERIC_FIELDS = ('screenTime',)
+
+
+def get_option(argv, name, default=None):
+    """Read the value following '--name' in argv"""
+    if name in argv:
+        index = argv.index(name)
+        if index + 1 < len(argv) and not argv[index + 1].startswith('--'):
+            return argv[index + 1]
+    return default
+
+
+def read_ndjson(stream):
+    """Yield (record, error) per non-blank line"""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield None, f"Line {line_number}: invalid JSON: {str(e)}"
+            continue
+        if not isinstance(record, dict):
+            yield None, f"Line {line_number}: expected a JSON object"
+            continue
+        yield record, None
+
+
+def read_csv(stream):
+    """Yield (record, error) per CSV row; empty cells fall back to the predictor defaults"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        record = {}
+        error = None
+        for field, value in row.items():
+            if field is None or value is None or value == '':
+                continue
+            value = value.strip()
+            if field in CSV_NUMERIC_FIELDS:
+                try:
+                    value = float(value)
+                except ValueError:
+                    error = f"Line {reader.line_num}: {field} must be a number, got {value!r}"
+                    break
+            record[field] = value
+        if error:
+            yield None, error
+        else:
+            yield record, None
+
+
+def iter_chunks(iterable, size):
+    """Yield lists of at most size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def score_stream(entries, models, predict_batch, render_result,
+                 default_input, out, chunk_size=DEFAULT_CHUNK_SIZE, validate=None):
+    """
+    Score (record, error) entries chunk by chunk and write NDJSON results in input order
+    render_result: function(record, prediction_result) -> result JSON with recommendations
+    validate: function(records, models) -> (normalized records, errors per record);
+    records with errors are rejected before scoring
+    Returns counts of scored and rejected records
+    """
+    scored = 0
+    rejected = 0
+    for chunk in iter_chunks(entries, chunk_size):
+        records = [record or dict(default_input) for record, error in chunk if error is None]
+        if validate is not None and records:
+            records, record_errors = validate(records, models)
+        else:
+            record_errors = [None] * len(records)
+        valid_records = [record for record, errors in zip(records, record_errors) if errors is None]
+        predictions = iter(predict_batch(valid_records, models) if valid_records else [])
+        records = iter(zip(records, record_errors))
+
+        lines = []
+        for _, error in chunk:
+            if error is not None:
+                rejected += 1
+                lines.append(json.dumps({"error": error}))
+                continue
+            record, errors = next(records)
+            if errors is not None:
+                rejected += 1
+                lines.append(json.dumps(invalid_result(errors)))
+                continue
+            prediction_result = next(predictions)
+            lines.append(render_result(record, prediction_result))
+            scored += 1
+
+        out.write("\n".join(lines) + "\n")
+        out.flush()
+    return {"scored": scored, "rejected": rejected}
+
+
+def open_input(source, encoding='utf-8'):
+    """Open a path for streaming text reads; '-' or None means stdin"""
+    if source in (None, '-'):
+        return io.TextIOWrapper(sys.stdin.buffer, encoding=encoding, newline='')
+    return open(source, 'r', encoding=encoding, newline='')
+
+
+def run_stream(argv, load_models, predict_batch, render_result, default_input, validate=None):
+    """
+    Entry point used by the predictor scripts' --stream flag
+    --stream [PATH|-]     input file, stdin when omitted or '-'
+    --format ndjson|csv   defaults to csv for *.csv paths, else ndjson
+    --chunk-size N        records scored per predict_proba call
+    --output PATH         output file, stdout when omitted
+    """
+    source = get_option(argv, '--stream')
+    input_format = get_option(argv, '--format')
+    if input_format is None:
+        input_format = 'csv' if source and source.lower().endswith('.csv') else 'ndjson'
+    if input_format not in ('ndjson', 'csv'):
+        print(json.dumps({"error": f"Unsupported stream format: {input_format}"}))
+        return
+
+    try:
+        chunk_size = int(get_option(argv, '--chunk-size', DEFAULT_CHUNK_SIZE))
+        if chunk_size < 1:
+            raise ValueError
+    except ValueError:
+        print(json.dumps({"error": "--chunk-size must be a positive integer"}))
+        return
+
+    models = load_models()
+    if "error" in models:
+        print(json.dumps({"error": models["error"]}))
+        return
+
+    output_path = get_option(argv, '--output')
+    reader = read_csv if input_format == 'csv' else read_ndjson
+    with open_input(source) as stream:
+        out = open(output_path, 'w', encoding='utf-8') if output_path else sys.stdout
+        try:
+            counts = score_stream(reader(stream), models, predict_batch,
+                                  render_result, default_input, out, chunk_size, validate)
+        finally:
+            if output_path:
+                out.close()
+
+    print(json.dumps({"stream_summary": counts}), file=sys.stderr)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Screen time risk-curve sweep for interactive what-if sliders
+Returns the whole eye risk curve from predict_with_original_model_and_screentime_adjustment
+across screen time (0-24h at a configurable step) for one or more age/sex
+combinations, with one predict_proba call and one broadcast adjustment
+
+Request:
+{"ageGroups": ["25–34", "65–74"], "sexes": ["Female"], "step": 0.5}
+or {"combinations": [{"ageGroup": "25–34", "sex": "Male"}], "min": 2, "max": 12}
+"""
+import sys
+import json
+import itertools
+import warnings
+
+import numpy as np
+
+from eye_health_batch import (
+    encode_age_groups,
+    predict_base_probabilities,
+    apply_screen_time_adjustment_array,
+    get_risk_level_array,
+    get_confidence_score_array,
+)
+from eye_health_metrics import span, increment
+from eye_health_validation import get_validator, invalid_result, SCREEN_TIME_RANGE
+from eye_health_predictor_screentime import (
+    load_eye_models_with_screentime,
+    predict_with_original_model_and_screentime_adjustment,
+    calculate_screen_time_impact,
+    VALIDATED_FIELDS,
+    DEFAULT_INPUT,
+)
+
+DEFAULT_STEP = 0.5
+MIN_STEP = 0.01
+MAX_COMBINATIONS = 100
+
+
+def as_list(value):
+    """A single value or a list of values as a list"""
+    return value if isinstance(value, list) else [value]
+
+
+def parse_sweep_request(payload):
+    """
+    Combinations and screen time grid of a sweep request
+    Returns (combinations, hours, errors); errors maps field -> message
+    """
+    if not isinstance(payload, dict):
+        return None, None, {"input": f"Input must be a JSON object, got {type(payload).__name__}"}
+
+    errors = {}
+    if 'combinations' in payload:
+        combinations = payload['combinations']
+        if not isinstance(combinations, list) or not all(isinstance(c, dict) for c in combinations):
+            errors['combinations'] = "combinations must be a list of {ageGroup, sex} objects"
+            combinations = []
+        combinations = [{'ageGroup': c.get('ageGroup', DEFAULT_INPUT['ageGroup']),
+                         'sex': c.get('sex', DEFAULT_INPUT['sex'])} for c in combinations]
+    else:
+        age_groups = as_list(payload.get('ageGroups', payload.get('ageGroup', DEFAULT_INPUT['ageGroup'])))
+        sexes = as_list(payload.get('sexes', payload.get('sex', DEFAULT_INPUT['sex'])))
+        combinations = [{'ageGroup': age_group, 'sex': sex}
+                        for age_group, sex in itertools.product(age_groups, sexes)]
+    if not combinations and 'combinations' not in errors:
+        errors['combinations'] = "At least one age/sex combination is required"
+    elif len(combinations) > MAX_COMBINATIONS:
+        errors['combinations'] = f"At most {MAX_COMBINATIONS} combinations per sweep, got {len(combinations)}"
+
+    low, high = SCREEN_TIME_RANGE
+    grid = {}
+    for field, default, minimum in (('step', DEFAULT_STEP, MIN_STEP), ('min', low, low), ('max', high, low)):
+        value = payload.get(field, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not minimum <= value <= high:
+            errors[field] = f"{field} must be a number between {minimum} and {high}, got {value!r}"
+        else:
+            grid[field] = value
+    if 'min' in grid and 'max' in grid and grid['min'] > grid['max']:
+        errors['max'] = f"max must not be below min ({grid['min']})"
+
+    if errors:
+        return combinations, None, errors
+
+    # Grid points are rounded so 0.1-step sweeps land on 0.3, not 0.30000000000000004
+    n_points = int(np.floor((grid['max'] - grid['min']) / grid['step'] + 1e-9)) + 1
+    hours = np.round(grid['min'] + np.arange(n_points) * grid['step'], 6)
+    return combinations, hours, None
+
+
+def sweep_screen_time(payload, models):
+    """
+    Risk curves across screen time for each requested age/sex combination
+    Matches predict_with_original_model_and_screentime_adjustment point for point
+    """
+    combinations, hours, errors = parse_sweep_request(payload)
+    errors = dict(errors or {})
+    if combinations and 'combinations' not in errors:
+        validator = get_validator(models, VALIDATED_FIELDS)
+        for i, combination in enumerate(combinations):
+            combinations[i], combination_errors = validator.validate(combination)
+            for field, message in (combination_errors or {}).items():
+                errors[f"combinations[{i}].{field}"] = message
+    if errors:
+        increment('sweep.rejected')
+        return invalid_result(errors)
+
+    increment('sweep.requests')
+    eye_models = models.get('eye_original') or models['eye']
+    age_groups = list(dict.fromkeys(combination['ageGroup'] for combination in combinations))
+
+    # One predict_proba call over the distinct age groups, then a broadcast adjustment
+    with span('encode'):
+        codes = encode_age_groups(age_groups, eye_models)
+    with span('predict_proba'):
+        base_prob = predict_base_probabilities(codes, eye_models)
+    with span('adjustment'):
+        adjusted_prob = apply_screen_time_adjustment_array(base_prob[:, np.newaxis], hours[np.newaxis, :])
+        eye_risk = adjusted_prob * 100
+        risk_levels = get_risk_level_array(adjusted_prob)
+        confidences = get_confidence_score_array(adjusted_prob)
+
+    curves = {}
+    for row, age_group in enumerate(age_groups):
+        curves[age_group] = {
+            "base_risk": round(float(base_prob[row]) * 100, 2),
+            "eye_risk": [round(value, 2) for value in eye_risk[row].tolist()],
+            "risk_level": risk_levels[row].tolist(),
+            "confidence": confidences[row].tolist(),
+        }
+
+    screen_times = hours.tolist()
+    return {
+        "model_used": "original_with_screentime_adjustment",
+        "screenTime": screen_times,
+        "screen_time_impact": [calculate_screen_time_impact(hour) for hour in screen_times],
+        "curves": [{**combination, **curves[combination['ageGroup']]} for combination in combinations],
+    }
+
+
+def verify_sweep_parity():
+    """Compare sweep curves with per-request predictions at every grid point"""
+    models = load_eye_models_with_screentime(include_screentime_model=False)
+    age_groups = ['0–14', '15–24', '25–34', '35–44', '45–54', '55–64', '65–74', '75–84', '85+']
+    result = sweep_screen_time({'ageGroups': age_groups, 'sexes': ['Male', 'Female', 'Persons'],
+                                'step': 0.25}, models)
+
+    mismatches = []
+    for curve in result['curves']:
+        for i, hour in enumerate(result['screenTime']):
+            data = {'ageGroup': curve['ageGroup'], 'sex': curve['sex'], 'screenTime': hour}
+            expected = predict_with_original_model_and_screentime_adjustment(data, models['eye_original'])
+            point = {
+                "eye_risk": curve['eye_risk'][i],
+                "risk_level": curve['risk_level'][i],
+                "confidence": curve['confidence'][i],
+                "model_used": result['model_used'],
+                "screen_time_impact": result['screen_time_impact'][i],
+                "base_risk": curve['base_risk'],
+            }
+            if point != expected:
+                mismatches.append({'input': data, 'sweep': point, 'expected': expected})
+    return mismatches
+
+
+def main():
+    """Print a sweep for a JSON request, or check parity with --check"""
+    if '--check' in sys.argv:
+        mismatches = verify_sweep_parity()
+        print(json.dumps({
+            "parity": not mismatches,
+            "mismatches": len(mismatches),
+            "examples": mismatches[:5]
+        }, default=str))
+        if mismatches:
+            sys.exit(1)
+        return
+
+    positional = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not positional:
+        print("Usage: python eye_health_sweep.py '{\"ageGroups\": [\"25–34\"], \"step\": 0.5}' | --check",
+              file=sys.stderr)
+        sys.exit(2)
+
+    models = load_eye_models_with_screentime(include_screentime_model=False)
+    if "error" in models:
+        print(json.dumps({"error": models["error"]}))
+        return
+    print(json.dumps(sweep_screen_time(json.loads(positional[0]), models)))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Pure-NumPy Tree Ensemble Evaluator for the LightGBM eye models
+Extracts the trees into flat arrays and evaluates them over a batch without
+importing lightgbm; the arrays can be memory-mapped so worker processes share
+one physical copy
+"""
+import sys
+import json
+import os
+import math
+import logging
+import warnings
+
+import numpy as np
+
+from eye_health_startup import load_artifact, timed_phase
+from eye_health_encoding import attach_compiled_encoders
+from eye_health_bundle import load_bundle_models, file_sha256, file_stat, source_matches
+from eye_health_metrics import get_logger, log_event
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+COMPILED_DIR = os.path.join(MODELS_DIR, 'compiled')
+
+# LightGBM missing value handling per split
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+# LightGBM treats |x| <= kZeroThreshold as zero
+ZERO_THRESHOLD = 1e-35
+
+# Batches larger than this are deduplicated before evaluation
+DEDUPLICATE_MIN_ROWS = 256
+
+log = get_logger('trees')
+
+ARRAY_NAMES = ('roots', 'feature', 'threshold', 'left', 'right',
+               'default_left', 'missing_type', 'leaf_value')
+
+
+def extract_tree_arrays(model):
+    """
+    Flatten a fitted binary LGBMClassifier into node arrays
+    Leaves have feature -1 and carry leaf_value; internal nodes carry the split
+    """
+    dump = model.booster_.dump_model()
+    if dump['num_tree_per_iteration'] != 1 or not dump['objective'].startswith('binary'):
+        raise ValueError(f"Unsupported objective for tree extraction: {dump['objective']}")
+    if dump.get('average_output'):
+        raise ValueError("Averaged (random forest) output is not supported")
+
+    sigmoid = 1.0
+    for part in dump['objective'].split():
+        if part.startswith('sigmoid:'):
+            sigmoid = float(part.split(':', 1)[1])
+
+    feature, threshold, left, right = [], [], [], []
+    default_left, missing_type, leaf_value = [], [], []
+    roots = []
+
+    def add_node(node):
+        index = len(feature)
+        feature.append(-1)
+        threshold.append(0.0)
+        left.append(-1)
+        right.append(-1)
+        default_left.append(False)
+        missing_type.append(MISSING_NONE)
+        leaf_value.append(0.0)
+
+        if 'split_index' not in node:
+            leaf_value[index] = float(node['leaf_value'])
+            return index
+
+        if node['decision_type'] != '<=':
+            raise ValueError(f"Unsupported split type: {node['decision_type']}")
+        feature[index] = int(node['split_feature'])
+        threshold[index] = float(node['threshold'])
+        default_left[index] = bool(node['default_left'])
+        missing_type[index] = MISSING_TYPES[node['missing_type']]
+        left[index] = add_node(node['left_child'])
+        right[index] = add_node(node['right_child'])
+        return index
+
+    for tree in dump['tree_info']:
+        roots.append(add_node(tree['tree_structure']))
+
+    arrays = {
+        'roots': np.asarray(roots, dtype=np.int32),
+        'feature': np.asarray(feature, dtype=np.int32),
+        'threshold': np.asarray(threshold, dtype=np.float64),
+        'left': np.asarray(left, dtype=np.int32),
+        'right': np.asarray(right, dtype=np.int32),
+        'default_left': np.asarray(default_left, dtype=np.bool_),
+        'missing_type': np.asarray(missing_type, dtype=np.int8),
+        'leaf_value': np.asarray(leaf_value, dtype=np.float64),
+    }
+    meta = {
+        'sigmoid': sigmoid,
+        'n_features': int(dump['max_feature_idx']) + 1,
+        'feature_names': dump['feature_names'],
+        'n_trees': len(roots),
+    }
+    return arrays, meta
+
+
+class TreeEnsemble:
+    """Vectorized evaluator over flat tree arrays with a predict_proba interface"""
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        self.n_features_in_ = meta['n_features']
+        self.classes_ = np.array([0, 1])
+        self._has_missing_handling = bool(np.any(arrays['missing_type'] != MISSING_NONE))
+
+    def predict_raw(self, X):
+        """Sum of leaf values per row (log-odds)"""
+        # LightGBM's Python API converts integer input to float32
+        X = np.asarray(X)
+        if X.dtype != np.float32 and X.dtype != np.float64:
+            X = X.astype(np.float32)
+        X = X.astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input with {self.n_features_in_} features, got shape {X.shape}")
+
+        # Inputs are encoded categories, so large batches repeat rows heavily;
+        # evaluate each distinct row once and scatter the results back
+        if X.shape[0] > DEDUPLICATE_MIN_ROWS and not np.isnan(X).any():
+            unique_rows, inverse = np.unique(X, axis=0, return_inverse=True)
+            if len(unique_rows) < X.shape[0] // 2:
+                return self._evaluate(unique_rows)[inverse.ravel()]
+        return self._evaluate(X)
+
+    def _evaluate(self, X):
+        """Walk every tree for every row of a float64 matrix"""
+
+        feature = self.arrays['feature']
+        threshold = self.arrays['threshold']
+        left = self.arrays['left']
+        right = self.arrays['right']
+        roots = self.arrays['roots']
+
+        n_rows, n_features = X.shape
+        n_trees = len(roots)
+        # Without NaN inputs and with only missing type None, a split is a plain <=
+        plain_splits = not self._has_missing_handling and not np.isnan(X).any()
+        X_flat = X.ravel()
+
+        # One slot per (row, tree); only slots still at an internal node advance
+        node = np.tile(roots, n_rows)
+        active = np.flatnonzero(feature[node] >= 0)
+        while active.size:
+            current = node[active]
+            split_feature = feature[current]
+            fval = X_flat[(active // n_trees) * n_features + split_feature]
+            if plain_splits:
+                go_left = fval <= threshold[current]
+            else:
+                go_left = self._decide_with_missing(fval, current)
+
+            next_node = np.where(go_left, left[current], right[current])
+            node[active] = next_node
+            active = active[feature[next_node] >= 0]
+
+        # LightGBM adds tree outputs one after another; cumsum keeps that order
+        values = self.arrays['leaf_value'][node].reshape(n_rows, n_trees)
+        return np.cumsum(values, axis=1)[:, -1]
+
+    def _decide_with_missing(self, fval, current):
+        """Split decisions honouring LightGBM's missing value rules"""
+        node_missing = self.arrays['missing_type'][current]
+        is_nan = np.isnan(fval)
+        # Missing types None and Zero treat NaN as 0.0
+        fval = np.where(is_nan & (node_missing != MISSING_NAN), 0.0, fval)
+        use_default = ((node_missing == MISSING_NAN) & is_nan) | (
+            (node_missing == MISSING_ZERO) & (np.abs(fval) <= ZERO_THRESHOLD))
+        return np.where(use_default, self.arrays['default_left'][current],
+                        fval <= self.arrays['threshold'][current])
+
+    def predict_proba(self, X):
+        """Class probabilities, same layout as LGBMClassifier.predict_proba"""
+        scaled = -self.meta['sigmoid'] * self.predict_raw(X)
+        # math.exp (libm) rather than np.exp so results match LightGBM bit for bit
+        exp = np.fromiter((math.exp(value) for value in scaled), dtype=np.float64, count=len(scaled))
+        prob = 1.0 / (1.0 + exp)
+        return np.column_stack([1.0 - prob, prob])
+
+
+def save_tree_arrays(arrays, meta, directory, source_path):
+    """
+    Write one .npy per array plus meta.json so the arrays can be memory-mapped
+    meta.json records the sha256, size and mtime of the source pickle
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(directory, f"{name}.npy"), arrays[name])
+    source = {'sha256': file_sha256(source_path), 'stat': file_stat(source_path)}
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({**meta, 'source': source}, f)
+
+
+def load_tree_arrays(directory, mmap=True):
+    """Load compiled arrays; with mmap, pages are shared between processes"""
+    with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    mmap_mode = 'r' if mmap else None
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in ARRAY_NAMES
+    }
+    return arrays, meta
+
+
+def load_tree_model(model_filename, mmap=True):
+    """
+    Load a TreeEnsemble for a model file
+    Uses models/compiled/<name>/ when it was built from the current pickle,
+    otherwise extracts from the pickle
+    """
+    name = os.path.splitext(model_filename)[0]
+    directory = os.path.join(COMPILED_DIR, name)
+    path = os.path.join(MODELS_DIR, model_filename)
+    if os.path.isfile(os.path.join(directory, 'meta.json')):
+        with timed_phase(f"load:compiled/{name}"):
+            arrays, meta = load_tree_arrays(directory, mmap=mmap)
+        source = meta.get('source') or {}
+        if source.get('sha256') and source_matches(path, source['sha256'], source.get('stat')):
+            return TreeEnsemble(arrays, meta)
+        log_event(log, logging.WARNING, 'compiled_trees_stale', model=model_filename,
+                  hint='run eye_health_trees.py --build')
+    else:
+        log_event(log, logging.WARNING, 'compiled_trees_missing', model=model_filename,
+                  hint='run eye_health_trees.py --build')
+    model = load_artifact(path)
+    return TreeEnsemble(*extract_tree_arrays(model))
+
+
+def load_eye_models_trees(mmap=True):
+    """load_eye_models() with the LightGBM model replaced by the NumPy evaluator"""
+    # The bundle already holds the flattened trees
+    bundle = load_bundle_models(['eye'])
+    if bundle is not None:
+        return attach_compiled_encoders({'eye': bundle['eye']})
+    try:
+        return attach_compiled_encoders({
+            'eye': {
+                'model': load_tree_model('eye_model_final.pkl', mmap=mmap),
+                'le_type': load_artifact(os.path.join(MODELS_DIR, 'le_type_eye_final.pkl')),
+                'le_value': load_artifact(os.path.join(MODELS_DIR, 'le_value_eye_final.pkl')),
+                'le_dim': load_artifact(os.path.join(MODELS_DIR, 'le_dim.pkl'))
+            }
+        })
+    except Exception as e:
+        return {"error": f"Eye model loading failed: {str(e)}"}
+
+
+def load_eye_models_with_screentime_trees(include_screentime_model=True, mmap=True):
+    """load_eye_models_with_screentime() backed by the NumPy evaluator"""
+    bundle = load_bundle_models(['eye', 'eye_screentime'] if include_screentime_model else ['eye'])
+    if bundle is not None:
+        bundle['eye_original'] = bundle.pop('eye')
+        return attach_compiled_encoders(bundle)
+    models = load_eye_models_trees(mmap=mmap)
+    if "error" in models:
+        return models
+    models = {'eye_original': models['eye']}
+    if include_screentime_model:
+        try:
+            models['eye_screentime'] = {
+                'model': load_tree_model('eye_model_screentime.pkl', mmap=mmap),
+                'encoders': load_artifact(os.path.join(MODELS_DIR, 'eye_encoders_screentime.pkl'))
+            }
+        except Exception as e:
+            return {"error": f"Eye model loading failed: {str(e)}"}
+    return attach_compiled_encoders(models)
+
+
+def encoded_input_space(encoders):
+    """Every combination of encoder codes, one row per combination"""
+    grids = np.meshgrid(*[np.arange(len(le.classes_)) for le in encoders], indexing='ij')
+    return np.column_stack([grid.ravel() for grid in grids])
+
+
+def verify_tree_parity():
+    """Compare the NumPy evaluator with model.predict_proba over the full encoded input space"""
+    eye_model = load_artifact(os.path.join(MODELS_DIR, 'eye_model_final.pkl'))
+    screentime_model = load_artifact(os.path.join(MODELS_DIR, 'eye_model_screentime.pkl'))
+    eye_encoders = [load_artifact(os.path.join(MODELS_DIR, name))
+                    for name in ('le_type_eye_final.pkl', 'le_value_eye_final.pkl', 'le_dim.pkl')]
+    screentime_encoders = load_artifact(os.path.join(MODELS_DIR, 'eye_encoders_screentime.pkl'))
+
+    checks = [
+        ('eye_model_final.pkl', eye_model, encoded_input_space(eye_encoders)),
+        ('eye_model_screentime.pkl', screentime_model,
+         encoded_input_space(list(screentime_encoders.values()))),
+    ]
+
+    report = {}
+    for filename, model, X in checks:
+        expected = model.predict_proba(X)
+        actual = load_tree_model(filename).predict_proba(X)
+        diff = np.abs(expected - actual)
+        report[filename] = {
+            "rows": int(X.shape[0]),
+            "exact_matches": int(np.sum(np.all(expected == actual, axis=1))),
+            "max_abs_diff": float(diff.max()),
+            "parity": bool(np.array_equal(expected, actual)),
+        }
+    return report
+
+
+def main():
+    """Compile the eye models to memory-mappable arrays (--build) or check parity (--check)"""
+    if '--build' in sys.argv:
+        built = {}
+        for filename in ('eye_model_final.pkl', 'eye_model_screentime.pkl'):
+            path = os.path.join(MODELS_DIR, filename)
+            arrays, meta = extract_tree_arrays(load_artifact(path))
+            directory = os.path.join(COMPILED_DIR, os.path.splitext(filename)[0])
+            save_tree_arrays(arrays, meta, directory, path)
+            built[filename] = {"directory": directory, "trees": meta['n_trees'],
+                               "nodes": int(len(arrays['feature']))}
+        print(json.dumps(built))
+        return
+
+    if '--check' in sys.argv:
+        report = verify_tree_parity()
+        print(json.dumps(report))
+        if not all(check['parity'] for check in report.values()):
+            sys.exit(1)
+        return
+
+    print("Usage: python eye_health_trees.py --build | --check", file=sys.stderr)
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
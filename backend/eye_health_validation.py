@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Input normalization and validation for the eye health predictor scripts
+Runs ahead of prediction: variant spellings ('25-34', 'female', '8') are
+mapped onto the encoders' categories through alias tables built once from the
+encoder classes, and malformed fields come back as structured per-field
+errors instead of exceptions and 50% fallback results
+"""
+import sys
+import json
+import math
+import re
+import warnings
+
+from eye_health_encoding import get_compiled_eye_encoders
+from eye_health_metrics import increment
+
+# Hyphen-like characters accepted in place of the en dash used by the encoders
+DASHES = re.compile(r'\s*[-‐‑‒–—−]\s*')
+
+# Sexes the predictors understand ('Persons' is the frontend's all-sexes option)
+DEFAULT_SEXES = ('Female', 'Male')
+ALL_SEXES = 'Persons'
+SEX_ALIASES = {
+    'm': 'Male', 'man': 'Male', 'men': 'Male', 'males': 'Male',
+    'f': 'Female', 'woman': 'Female', 'women': 'Female', 'females': 'Female',
+    'person': 'Persons', 'all': 'Persons', 'both': 'Persons', 'people': 'Persons',
+}
+
+# Plausible daily screen time in hours
+SCREEN_TIME_RANGE = (0, 24)
+
+# Upper bound on memoized values per field
+VALUE_CACHE_SIZE = 4096
+
+
+def alias_key(value):
+    """
+    Lookup key for a category: whitespace collapsed, case folded, any dash
+    turned into an en dash, ' to ' ranges and a trailing 'years' folded in
+    """
+    text = ' '.join(value.split()).casefold()
+    text = re.sub(r'\s*(?:years?|yrs?)$', '', text)
+    text = re.sub(r'(\d)\s+to\s+(\d)', r'\1–\2', text)
+    text = DASHES.sub('–', text)
+    return re.sub(r'\s+\+', '+', text)
+
+
+def build_alias_table(classes, aliases=None):
+    """
+    alias key -> category for every class; the exact class strings map to
+    themselves, so inputs the encoders already accept are never changed
+    When several classes share a key, the one without surrounding whitespace wins
+    """
+    table = {}
+    for value in sorted(classes, key=lambda value: (value != value.strip(), value)):
+        table.setdefault(alias_key(value), value)
+    for alias, value in (aliases or {}).items():
+        if value in classes:
+            table.setdefault(alias_key(alias), value)
+    table.update({value: value for value in classes})
+    return table
+
+
+def get_sex_classes(models):
+    """Sex categories of the loaded screen time model, or the defaults"""
+    encoders = models.get('eye_screentime', {}).get('compiled') or {}
+    for name, encoder in encoders.items():
+        if 'gender' in name.lower() or 'sex' in name.lower():
+            return [str(value) for value in encoder.classes_.tolist()]
+    return list(DEFAULT_SEXES)
+
+
+class InputValidator:
+    """Validates and normalizes request records for one predictor script"""
+
+    def __init__(self, age_groups, sexes, fields):
+        self.fields = tuple(fields)
+        self.age_groups = build_alias_table(age_groups)
+        self.sexes = build_alias_table(list(sexes) + [ALL_SEXES], SEX_ALIASES)
+        self.sex_names = ', '.join(sorted(set(self.sexes.values())))
+        self.cache = {field: {} for field in self.fields}
+
+    def normalize_age_group(self, value):
+        """(category, None) or (None, message)"""
+        if not isinstance(value, str):
+            return None, f"ageGroup must be a string, got {type(value).__name__}"
+        category = self.age_groups.get(value)
+        if category is None:
+            category = self.age_groups.get(alias_key(value))
+        if category is None:
+            return None, f"Unknown age group {value!r}"
+        return category, None
+
+    def normalize_sex(self, value):
+        """(category, None) or (None, message); '' means no sex given"""
+        if not isinstance(value, str):
+            return None, f"sex must be a string, got {type(value).__name__}"
+        if value == '':
+            return value, None
+        category = self.sexes.get(value)
+        if category is None:
+            category = self.sexes.get(alias_key(value))
+        if category is None:
+            return None, f"Unknown sex {value!r} (expected one of {self.sex_names})"
+        return category, None
+
+    def normalize_screen_time(self, value):
+        """(hours, None) or (None, message); numeric strings are converted"""
+        low, high = SCREEN_TIME_RANGE
+        message = f"screenTime must be a number of hours between {low} and {high}, got {value!r}"
+        if isinstance(value, bool):
+            return None, message
+        if isinstance(value, str):
+            text = value.strip()
+            try:
+                value = int(text)
+            except ValueError:
+                try:
+                    value = float(text)
+                except ValueError:
+                    return None, message
+        if not isinstance(value, (int, float)) or not math.isfinite(value) or not low <= value <= high:
+            return None, message
+        return value, None
+
+    def normalize(self, field, value):
+        """Normalize one field value, memoized per distinct hashable value"""
+        cache = self.cache[field]
+        try:
+            return cache[(type(value), value)]
+        except KeyError:
+            pass
+        except TypeError:
+            return NORMALIZERS[field](self, value)
+        result = NORMALIZERS[field](self, value)
+        if len(cache) >= VALUE_CACHE_SIZE:
+            cache.clear()
+        cache[(type(value), value)] = result
+        return result
+
+    def validate(self, record):
+        """
+        (normalized record, None) or (record, {field: message})
+        Fields the record omits are left for the predictor defaults
+        """
+        if not isinstance(record, dict):
+            increment('validation.rejected')
+            return record, {"input": f"Input must be a JSON object, got {type(record).__name__}"}
+
+        normalized = record
+        errors = None
+        for field in self.fields:
+            if field not in record:
+                continue
+            value = record[field]
+            category, message = self.normalize(field, value)
+            if message is not None:
+                if errors is None:
+                    errors = {}
+                errors[field] = message
+                increment(f"validation.invalid.{field}")
+            elif category != value or type(category) is not type(value):
+                if normalized is record:
+                    normalized = dict(record)
+                normalized[field] = category
+                increment(f"validation.normalized.{field}")
+
+        if errors is not None:
+            increment('validation.rejected')
+            return record, errors
+        return normalized, None
+
+    def validate_many(self, records):
+        """Validate a batch; returns (records, errors) lists in input order (errors None when valid)"""
+        checked = [self.validate(record) for record in records]
+        return [record for record, _ in checked], [errors for _, errors in checked]
+
+
+NORMALIZERS = {
+    'ageGroup': InputValidator.normalize_age_group,
+    'sex': InputValidator.normalize_sex,
+    'screenTime': InputValidator.normalize_screen_time,
+}
+
+
+def get_validator(models, fields):
+    """Validator for a loaded model set and field list, built on first use and kept with the models"""
+    validators = models.setdefault('validators', {})
+    validator = validators.get(tuple(fields))
+    if validator is None:
+        eye_models = models.get('eye') or models.get('eye_original')
+        age_groups = [str(value) for value in get_compiled_eye_encoders(eye_models)['value'].classes_.tolist()]
+        validator = validators[tuple(fields)] = InputValidator(age_groups, get_sex_classes(models), fields)
+    return validator
+
+
+def invalid_result(errors):
+    """Prediction result for a rejected record"""
+    return {
+        "error": "Invalid input: " + ", ".join(errors),
+        "errors": errors
+    }
+
+
+def main():
+    """Validate JSON records from the command line against the screen time script's categories"""
+    from eye_health_predictor_screentime import load_eye_models_with_screentime, VALIDATED_FIELDS
+
+    records = [json.loads(arg) for arg in sys.argv[1:]]
+    if not records:
+        print("Usage: python eye_health_validation.py '{\"ageGroup\": \"25-34\", \"sex\": \"f\"}' ...",
+              file=sys.stderr)
+        sys.exit(2)
+
+    models = load_eye_models_with_screentime()
+    if "error" in models:
+        print(json.dumps({"error": models["error"]}))
+        sys.exit(1)
+    normalized, errors = get_validator(models, VALIDATED_FIELDS).validate_many(records)
+    for record, record_errors in zip(normalized, errors):
+        print(json.dumps({"errors": record_errors} if record_errors else {"normalized": record},
+                         ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()
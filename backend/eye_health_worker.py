@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Persistent worker mode for the eye health predictor scripts
+Loads the models once, then answers newline-delimited JSON requests
+over stdin/stdout or a Unix socket
+
+Request:  {"id": 1, "data": {"ageGroup": "25–34", "sex": "Male"}}
+Response: {"id": 1, "result": {...}}  or  {"id": 1, "error": "..."}
+
+Metrics:  {"id": 2, "op": "metrics"} -> {"id": 2, "result": {counters, spans}}
+Other ops a script registers (e.g. "sweep") take "data" like a prediction
+
+Results carry the "model_version" that served them; changed model files are
+picked up without a restart (see eye_health_reload.py)
+
+With --coalesce, stdin requests are handled concurrently so pipelined
+predictions share batch calls (see eye_health_coalesce.py); responses are
+then written as they finish and must be matched by "id"
+"""
+import sys
+import json
+import io
+import os
+import threading
+
+from eye_health_metrics import span, increment, metrics_snapshot
+from eye_health_reload import create_model_manager
+
+
+class RawJSON(str):
+    """A result that is already serialized JSON text"""
+
+
+def handle_request_line(line, handler):
+    """Decode one request line, run the handler and build the response"""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": None, "error": f"Invalid request: {str(e)}"}
+
+    if not isinstance(request, dict):
+        return {"id": None, "error": "Invalid request: expected a JSON object"}
+
+    request_id = request.get("id")
+    if request.get("op") == "metrics":
+        return {"id": request_id, "result": metrics_snapshot()}
+
+    op = request.get("op")
+    if op is not None and op not in handler.ops:
+        return {"id": request_id, "error": f"Invalid request: unknown op {op!r}"}
+
+    increment('requests')
+    data = request.get("data") or {}
+    if not isinstance(data, dict):
+        return {"id": request_id, "error": "Invalid request: 'data' must be a JSON object"}
+
+    try:
+        result, version = handler(data, op)
+    except Exception as e:
+        increment('request_errors')
+        return {"id": request_id, "error": f"Prediction failed: {str(e)}"}
+    response = {"id": request_id, "result": result}
+    if version is not None:
+        response["model_version"] = version
+    return response
+
+
+def encode_response(response):
+    """
+    Serialize one response line; pre-rendered results are spliced in as-is
+    NaN and Infinity are not JSON: a result holding them becomes an error line
+    """
+    with span('serialization'):
+        result = response.get("result")
+        if isinstance(result, RawJSON):
+            version = ""
+            if "model_version" in response:
+                version = f', "model_version": {json.dumps(response["model_version"])}'
+            return f'{{"id": {json.dumps(response["id"])}, "result": {result}{version}}}\n'
+        try:
+            return json.dumps(response, allow_nan=False) + "\n"
+        except ValueError as e:
+            increment('request_errors')
+            return json.dumps({"id": response.get("id"), "error": f"Prediction failed: {str(e)}"}) + "\n"
+
+
+def utf8_stdio():
+    """
+    (stdin, stdout) as UTF-8 text: pipes otherwise use the locale encoding
+    (cp1252 for a Windows `py` worker), which garbles age groups like '25–34'
+    """
+    infile = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    outfile = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='\n')
+    return infile, outfile
+
+
+def serve_stream(handler, infile, outfile):
+    """Serve requests line by line until the input stream closes"""
+    for line in infile:
+        if not line.strip():
+            continue
+        response = handle_request_line(line, handler)
+        outfile.write(encode_response(response))
+        outfile.flush()
+
+
+def serve_stream_concurrent(handler, infile, outfile, threads):
+    """Serve requests from a thread pool; responses are written in completion order"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    write_lock = threading.Lock()
+
+    def respond(line):
+        response = encode_response(handle_request_line(line, handler))
+        with write_lock:
+            outfile.write(response)
+            outfile.flush()
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request') as executor:
+        for line in infile:
+            if line.strip():
+                executor.submit(respond, line)
+
+
+def serve_unix_socket(handler, socket_path):
+    """Serve requests on a Unix socket, one thread per connection"""
+    import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw_line in self.rfile:
+                line = raw_line.decode('utf-8')
+                if not line.strip():
+                    continue
+                response = handle_request_line(line, handler)
+                self.wfile.write(encode_response(response).encode('utf-8'))
+                self.wfile.flush()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with Server(socket_path, RequestHandler) as server:
+        print(f"Eye health worker listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def run_worker(argv, load_models, build_result, render_result=None, ops=None, golden_inputs=None):
+    """
+    Entry point used by the predictor scripts' --worker flag
+    argv: remaining command line arguments (supports --socket PATH,
+    --reload-interval SECONDS, --max-drift POINTS and --coalesce
+    [--max-batch N] [--batch-window-ms MS])
+    load_models: the script's model loader, called again when the files change
+    build_result: function(input_data, models) -> response dict
+    render_result: optional function(input_data, models) -> the same response
+    as JSON text; used instead of build_result when given
+    ops: optional {op name: function(data, models) -> response dict}
+    golden_inputs: records a reloaded model set must score cleanly before it
+    is swapped in (default: one empty record)
+    """
+    socket_path = None
+    if '--socket' in argv:
+        index = argv.index('--socket')
+        if index + 1 >= len(argv):
+            print(json.dumps({"error": "--socket requires a path"}))
+            return
+        socket_path = argv[index + 1]
+
+    with span('load'):
+        manager = create_model_manager(argv, load_models, build_result, golden_inputs)
+    # Memory report for the metrics op (best-effort where RSS is not available)
+    from eye_health_memory import track_memory
+    track_memory(lambda: manager.models)
+
+    def handler(data, op=None):
+        """(result, model_version) from the model set serving when the request started"""
+        models = manager.models
+        version = models.get('model_version')
+        if "error" in models:
+            return {"error": models["error"]}, version
+        if op is not None:
+            return ops[op](data, models), version
+        if render_result is not None:
+            return RawJSON(render_result(data, models)), version
+        return build_result(data, models), version
+    handler.ops = dict(ops or {})
+
+    if socket_path:
+        serve_unix_socket(handler, socket_path)
+    elif '--coalesce' in argv:
+        from eye_health_coalesce import coalesce_options
+        max_batch, _ = coalesce_options(argv)
+        serve_stream_concurrent(handler, *utf8_stdio(), max_batch)
+    else:
+        serve_stream(handler, *utf8_stdio())
@@ -3,6 +3,7 @@ const cors = require('cors');
 const helmet = require('helmet');
 const { spawn } = require('child_process');
 const path = require('path');
+const { StringDecoder } = require('string_decoder');
 require('dotenv').config();
 
 const app = express();
@@ -37,6 +38,14 @@ app.post('/api/wellness/predict', async (req, res) => {
     // Call Python script for prediction
     const result = await runPythonPrediction(userData);
     
+    // No model family could be scored; errors names the unknown categories
+    if (result.error && result.errors) {
+      return res.status(400).json({ 
+        error: result.error,
+        errors: result.errors
+      });
+    }
+
     if (result.error) {
       return res.status(500).json({ 
         error: result.error 
@@ -46,7 +55,8 @@ app.post('/api/wellness/predict', async (req, res) => {
     res.json({
       success: true,
       data: result,
-      timestamp: new Date().toISOString()
+      timestamp: new Date().toISOString(),
+      model_version: resultModelVersions.get(result)
     });
 
   } catch (error) {
@@ -73,6 +83,14 @@ app.post('/api/eye-health/analyze', async (req, res) => {
     // Call Python script for eye health prediction
     const result = await runEyeHealthPrediction(eyeData);
     
+    // Per-field errors from the predictor's input validation
+    if (result.errors) {
+      return res.status(400).json({ 
+        error: result.error,
+        errors: result.errors
+      });
+    }
+
     if (result.error) {
       return res.status(500).json({ 
         error: result.error 
@@ -82,7 +100,8 @@ app.post('/api/eye-health/analyze', async (req, res) => {
     res.json({
       success: true,
       data: result,
-      timestamp: new Date().toISOString()
+      timestamp: new Date().toISOString(),
+      model_version: resultModelVersions.get(result)
     });
 
   } catch (error) {
@@ -94,6 +113,135 @@ app.post('/api/eye-health/analyze', async (req, res) => {
   }
 });
 
+// Eye risk curves across screen time for the what-if slider
+app.post('/api/eye-health/sweep', async (req, res) => {
+  try {
+    const result = await runWorkerRequest(
+      path.join(__dirname, 'eye_health_predictor_screentime.py'), req.body || {}, 'sweep');
+
+    if (result.errors) {
+      return res.status(400).json({ 
+        error: result.error,
+        errors: result.errors
+      });
+    }
+
+    if (result.error) {
+      return res.status(500).json({ 
+        error: result.error 
+      });
+    }
+
+    res.json({
+      success: true,
+      data: result,
+      timestamp: new Date().toISOString(),
+      model_version: resultModelVersions.get(result)
+    });
+
+  } catch (error) {
+    console.error('Eye health sweep error:', error);
+    res.status(500).json({ 
+      error: 'Internal server error',
+      details: error.message 
+    });
+  }
+});
+
+// Weighted eye risk distribution over a population given as counts per cell
+app.post('/api/eye-health/aggregate', async (req, res) => {
+  try {
+    const payload = req.body || {};
+    const pythonScript = payload.predictor === 'final'
+      ? path.join(__dirname, 'eye_health_predictor_final.py')
+      : path.join(__dirname, 'eye_health_predictor_screentime.py');
+    const result = await runWorkerRequest(pythonScript, payload, 'aggregate');
+
+    if (result.errors) {
+      return res.status(400).json({ 
+        error: result.error,
+        errors: result.errors
+      });
+    }
+
+    if (result.error) {
+      return res.status(500).json({ 
+        error: result.error 
+      });
+    }
+
+    res.json({
+      success: true,
+      data: result,
+      timestamp: new Date().toISOString(),
+      model_version: resultModelVersions.get(result)
+    });
+
+  } catch (error) {
+    console.error('Eye health aggregation error:', error);
+    res.status(500).json({ 
+      error: 'Internal server error',
+      details: error.message 
+    });
+  }
+});
+
+// Eye risk with per-feature contributions (precomputed by the workers at load)
+app.post('/api/eye-health/explain', async (req, res) => {
+  try {
+    const payload = req.body || {};
+    const pythonScript = payload.predictor === 'final'
+      ? path.join(__dirname, 'eye_health_predictor_final.py')
+      : path.join(__dirname, 'eye_health_predictor_screentime.py');
+    const result = await runWorkerRequest(pythonScript, payload, 'explain');
+
+    if (result.errors) {
+      return res.status(400).json({ 
+        error: result.error,
+        errors: result.errors
+      });
+    }
+
+    if (result.error) {
+      return res.status(500).json({ 
+        error: result.error 
+      });
+    }
+
+    res.json({
+      success: true,
+      data: result,
+      timestamp: new Date().toISOString(),
+      model_version: resultModelVersions.get(result)
+    });
+
+  } catch (error) {
+    console.error('Eye health explanation error:', error);
+    res.status(500).json({ 
+      error: 'Internal server error',
+      details: error.message 
+    });
+  }
+});
+
+// Per-stage timings and fallback counters from the running prediction workers
+app.get('/api/eye-health/metrics', async (req, res) => {
+  const metrics = {};
+  for (const pythonScript of predictionWorkers.keys()) {
+    try {
+      metrics[path.basename(pythonScript)] = await runWorkerRequest(pythonScript, null, 'metrics');
+    } catch (error) {
+      metrics[path.basename(pythonScript)] = { error: error.message };
+    }
+  }
+
+  res.json({
+    success: true,
+    data: metrics,
+    timestamp: new Date().toISOString()
+  });
+});
+
 // Get available input options
 app.get('/api/wellness/options', (req, res) => {
   res.json({
@@ -118,160 +266,165 @@ app.get('/api/wellness/options', (req, res) => {
   });
 });
 
-// Run enhanced eye health prediction script with screen time support
-function runEyeHealthPrediction(eyeData) {
-  return new Promise((resolve, reject) => {
-    console.log('👁️ Starting enhanced eye health prediction with data:', JSON.stringify(eyeData, null, 2));
+// Persistent prediction workers, one per Python script.
+// Each worker loads its models once and answers newline-delimited JSON
+// requests tagged with an id, so concurrent requests never share a file.
+const PREDICTION_REQUEST_TIMEOUT_MS = 30000;
+const predictionWorkers = new Map();
+let nextPredictionRequestId = 1;
+// Model version that served each worker result (workers reload changed model
+// files without restarting and tag every response with the version used)
+const resultModelVersions = new WeakMap();
 
-    // Use screen time model if screenTime is provided
-    const hasScreenTime = eyeData.screenTime !== undefined && eyeData.screenTime !== null;
-    const pythonScript = hasScreenTime 
-      ? path.join(__dirname, 'eye_health_predictor_screentime.py')
-      : path.join(__dirname, 'eye_health_predictor_final.py');
-    
-    const inputFile = path.join(__dirname, 'temp_eye_input.json');
-    console.log('🐍 Eye health script path:', pythonScript);
-    console.log('📄 Input file path:', inputFile);
-    console.log('⏰ Screen time data included:', hasScreenTime);
-    
-    // Write input data to temporary file
-    const fs = require('fs');
-    try {
-      fs.writeFileSync(inputFile, JSON.stringify(eyeData, null, 2));
-      console.log('✅ Eye health input data written to file');
-    } catch (writeError) {
-      console.error('❌ Failed to write eye health input file:', writeError);
-      reject(new Error(`Failed to write input file: ${writeError.message}`));
-      return;
+// EYE_HEALTH_SHADOW=1 scores screen time requests with both eye models and
+// serves EYE_HEALTH_PRIMARY_MODEL (inherited by the worker, default original)
+// EYE_HEALTH_COALESCE=1 batches concurrent eye predictions in the worker;
+// responses may then arrive out of order and are matched by id
+function getPredictionWorkerArgs(pythonScript) {
+  const args = [pythonScript, '--worker'];
+  if (process.env.EYE_HEALTH_SHADOW === '1' && pythonScript.endsWith('eye_health_predictor_screentime.py')) {
+    args.push('--shadow');
+  } else if (pythonScript.endsWith('eye_health_predictor_screentime.py')) {
+    // The active path never uses the screen time model; only --shadow needs it
+    args.push('--lazy');
+  }
+  if (process.env.EYE_HEALTH_COALESCE === '1' && pythonScript.includes('eye_health_predictor')) {
+    args.push('--coalesce');
+  }
+  return args;
+}
+
+function getPredictionWorker(pythonScript) {
+  const existing = predictionWorkers.get(pythonScript);
+  if (existing) {
+    return existing;
+  }
+
+  console.log('🐍 Starting prediction worker:', pythonScript);
+  const pythonProcess = spawn('py', getPredictionWorkerArgs(pythonScript));
+  // Workers speak UTF-8 JSON lines; the decoder keeps multi-byte characters
+  // that straddle two chunks intact
+  const worker = { process: pythonProcess, pending: new Map(), buffer: '', decoder: new StringDecoder('utf8') };
+  predictionWorkers.set(pythonScript, worker);
+
+  const failPending = (error) => {
+    for (const { reject, timer } of worker.pending.values()) {
+      clearTimeout(timer);
+      reject(error);
     }
-    
-    const pythonProcess = spawn('py', [pythonScript, inputFile]);
-    
-    let output = '';
-    let errorOutput = '';
+    worker.pending.clear();
+  };
 
-    pythonProcess.stdout.on('data', (data) => {
-      const dataStr = data.toString();
-      console.log('📤 Eye health stdout:', dataStr);
-      output += dataStr;
-    });
+  // Forget this worker so the next request starts a fresh one
+  const forget = () => {
+    if (predictionWorkers.get(pythonScript) === worker) {
+      predictionWorkers.delete(pythonScript);
+    }
+  };
 
-    pythonProcess.stderr.on('data', (data) => {
-      const dataStr = data.toString();
-      console.log('⚠️ Eye health stderr:', dataStr);
-      errorOutput += dataStr;
-    });
+  // Stop a wedged worker; 'close' fails whatever else it still had pending
+  worker.kill = () => {
+    forget();
+    pythonProcess.kill('SIGKILL');
+  };
 
-    pythonProcess.on('close', (code) => {
-      console.log(`🔚 Eye health process closed with code: ${code}`);
-      console.log('📤 Final eye health output:', output);
-      console.log('⚠️ Final eye health error output:', errorOutput);
-      
-      // Clean up temporary file
-      try {
-        fs.unlinkSync(inputFile);
-        console.log('🗑️ Eye health temporary file cleaned up');
-      } catch (cleanupError) {
-        console.warn('⚠️ Failed to clean up eye health temporary file:', cleanupError);
-      }
-      
-      if (code !== 0) {
-        console.error('❌ Eye health script execution failed:', errorOutput);
-        reject(new Error(`Eye health script execution failed, exit code: ${code}. Error: ${errorOutput}`));
-        return;
+  pythonProcess.stdout.on('data', (data) => {
+    worker.buffer += worker.decoder.write(data);
+    let newlineIndex;
+    while ((newlineIndex = worker.buffer.indexOf('\n')) !== -1) {
+      const line = worker.buffer.slice(0, newlineIndex).trim();
+      worker.buffer = worker.buffer.slice(newlineIndex + 1);
+      if (!line) {
+        continue;
       }
 
+      let response;
       try {
-        const result = JSON.parse(output);
-        console.log('✅ Successfully parsed eye health result:', result);
-        resolve(result);
+        response = JSON.parse(line);
       } catch (parseError) {
-        console.error('❌ Failed to parse eye health output:', output);
-        console.error('❌ Parse error:', parseError);
-        reject(new Error(`Failed to parse eye health result: ${parseError.message}`));
+        console.error('❌ Failed to parse prediction worker output:', line);
+        continue;
       }
-    });
 
-    pythonProcess.on('error', (error) => {
-      console.error('❌ Failed to start eye health process:', error);
-      reject(new Error(`Unable to start eye health prediction service: ${error.message}`));
-    });
+      const entry = worker.pending.get(response.id);
+      if (!entry) {
+        console.warn('⚠️ Prediction worker response for unknown request:', response.id);
+        continue;
+      }
+      worker.pending.delete(response.id);
+      clearTimeout(entry.timer);
+
+      if (response.error) {
+        entry.reject(new Error(response.error));
+      } else {
+        if (response.model_version && response.result && typeof response.result === 'object') {
+          resultModelVersions.set(response.result, response.model_version);
+        }
+        entry.resolve(response.result);
+      }
+    }
   });
+
+  pythonProcess.stderr.on('data', (data) => {
+    console.log('⚠️ Prediction worker stderr:', data.toString());
+  });
+
+  // A worker that died between requests makes the next write fail with EPIPE
+  pythonProcess.stdin.on('error', (error) => {
+    console.error('❌ Prediction worker stdin error:', error.message);
+    forget();
+    failPending(new Error(`Prediction worker unavailable: ${error.message}`));
+  });
+
+  pythonProcess.on('close', (code) => {
+    console.log(`🔚 Prediction worker closed with code: ${code}`);
+    forget();
+    failPending(new Error(`Prediction worker exited with code: ${code}`));
+  });
+
+  pythonProcess.on('error', (error) => {
+    console.error('❌ Failed to start prediction worker:', error);
+    forget();
+    failPending(new Error(`Unable to start prediction service: ${error.message}`));
+  });
+
+  return worker;
 }
 
-// Run Python prediction script
-function runPythonPrediction(userData) {
+// Send one request to a script's persistent worker
+// (op: optional worker operation such as 'metrics' or 'sweep' instead of a prediction)
+function runWorkerRequest(pythonScript, data, op) {
   return new Promise((resolve, reject) => {
-    console.log('🔍 Starting Python prediction with data:', JSON.stringify(userData, null, 2));
-    
-    const pythonScript = path.join(__dirname, 'wellness_predictor.py');
-    const inputFile = path.join(__dirname, 'temp_input.json');
-    console.log('🐍 Python script path:', pythonScript);
-    console.log('📄 Input file path:', inputFile);
-    
-    // Write input data to temporary file
-    const fs = require('fs');
-    try {
-      fs.writeFileSync(inputFile, JSON.stringify(userData, null, 2));
-      console.log('✅ Input data written to file');
-    } catch (writeError) {
-      console.error('❌ Failed to write input file:', writeError);
-      reject(new Error(`Failed to write input file: ${writeError.message}`));
-      return;
-    }
-    
-    const pythonProcess = spawn('py', [pythonScript, inputFile]);
-    
-    let output = '';
-    let errorOutput = '';
+    const worker = getPredictionWorker(pythonScript);
+    const id = nextPredictionRequestId++;
 
-    pythonProcess.stdout.on('data', (data) => {
-      const dataStr = data.toString();
-      console.log('📤 Python stdout:', dataStr);
-      output += dataStr;
-    });
+    const timer = setTimeout(() => {
+      worker.pending.delete(id);
+      reject(new Error(`Prediction timed out after ${PREDICTION_REQUEST_TIMEOUT_MS}ms`));
+      // The worker is stuck; later requests go to a fresh one instead of waiting out the timeout
+      worker.kill();
+    }, PREDICTION_REQUEST_TIMEOUT_MS);
 
-    pythonProcess.stderr.on('data', (data) => {
-      const dataStr = data.toString();
-      console.log('⚠️ Python stderr:', dataStr);
-      errorOutput += dataStr;
-    });
+    worker.pending.set(id, { resolve, reject, timer });
+    const message = op ? { id, op, data } : { id, data };
+    worker.process.stdin.write(JSON.stringify(message) + '\n');
+  });
+}
 
-    pythonProcess.on('close', (code) => {
-      console.log(`🔚 Python process closed with code: ${code}`);
-      console.log('📤 Final output:', output);
-      console.log('⚠️ Final error output:', errorOutput);
-      
-      // Clean up temporary file
-      try {
-        fs.unlinkSync(inputFile);
-        console.log('🗑️ Temporary file cleaned up');
-      } catch (cleanupError) {
-        console.warn('⚠️ Failed to clean up temporary file:', cleanupError);
-      }
-      
-      if (code !== 0) {
-        console.error('❌ Python script execution failed:', errorOutput);
-        reject(new Error(`Python script execution failed, exit code: ${code}. Error: ${errorOutput}`));
-        return;
-      }
+// Run enhanced eye health prediction with screen time support
+function runEyeHealthPrediction(eyeData) {
+  // Use screen time model if screenTime is provided
+  const hasScreenTime = eyeData.screenTime !== undefined && eyeData.screenTime !== null;
+  const pythonScript = hasScreenTime 
+    ? path.join(__dirname, 'eye_health_predictor_screentime.py')
+    : path.join(__dirname, 'eye_health_predictor_final.py');
 
-      try {
-        const result = JSON.parse(output);
-        console.log('✅ Successfully parsed Python result:', result);
-        resolve(result);
-      } catch (parseError) {
-        console.error('❌ Failed to parse Python output:', output);
-        console.error('❌ Parse error:', parseError);
-        reject(new Error(`Failed to parse prediction result: ${parseError.message}`));
-      }
-    });
+  return runWorkerRequest(pythonScript, eyeData);
+}
 
-    pythonProcess.on('error', (error) => {
-      console.error('❌ Failed to start Python process:', error);
-      reject(new Error(`Unable to start prediction service: ${error.message}`));
-    });
-  });
+// Run unified wellness prediction (vitamin D, eye and posture models)
+function runPythonPrediction(userData) {
+  return runWorkerRequest(path.join(__dirname, 'wellness_predictor.py'), userData);
 }
 
 // Error handling middleware
@@ -0,0 +1,8 @@
+"""
+Pytest setup for the backend checks
+The scripts are flat modules in backend/, imported the way they import each other
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
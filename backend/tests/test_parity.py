@@ -0,0 +1,69 @@
+"""
+Parity of the precompiled and batched serving paths with the live model path
+The same checks as the eye_health_*.py --check entry points
+"""
+from eye_health_predictor_final import load_eye_models
+from eye_health_lookup import load_risk_table, verify_table_parity
+from eye_health_batch import verify_batch_parity
+from eye_health_render import verify_render_parity
+from eye_health_shadow import verify_shadow
+from eye_health_sweep import verify_sweep_parity
+from eye_health_aggregate import verify_aggregate_parity
+from eye_health_bundle import write_bundle, verify_bundle
+from eye_health_explain import verify_explain_parity
+from eye_health_coalesce import verify_coalesce_parity
+from eye_health_trees import verify_tree_parity
+from eye_health_memory import verify_slim_parity
+
+
+def test_tree_evaluator_matches_predict_proba():
+    report = verify_tree_parity()
+    for filename, check in report.items():
+        assert check['parity'], (filename, check)
+        assert check['exact_matches'] == check['rows'], (filename, check)
+
+
+def test_slim_profile_matches_pickles():
+    report = verify_slim_parity()
+    assert report['parity'], report['examples']
+
+
+def test_risk_table_matches_live_model():
+    models = load_eye_models()
+    assert not verify_table_parity(load_risk_table(models['eye']), models)
+
+
+def test_batch_matches_per_record():
+    assert not verify_batch_parity()
+
+
+def test_rendered_responses_match_json_dumps():
+    assert not verify_render_parity()
+
+
+def test_shadow_path_matches_batch():
+    mismatches, divergence = verify_shadow()
+    assert not mismatches, mismatches[:5]
+
+
+def test_sweep_matches_per_request_predictions():
+    assert not verify_sweep_parity()
+
+
+def test_aggregate_matches_per_person_scoring():
+    assert not verify_aggregate_parity()
+
+
+def test_bundle_matches_pickles(tmp_path):
+    path = str(tmp_path / 'eye_models.bundle')
+    write_bundle(path)
+    assert not verify_bundle(path)[1]
+
+
+def test_explanations_match_live_predictions():
+    assert not verify_explain_parity()
+
+
+def test_coalesced_results_match_per_record():
+    report = verify_coalesce_parity()
+    assert report['parity'], report['examples']
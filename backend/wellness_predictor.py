@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Unified Wellness Risk Prediction Script
+Loads the vitamin D, eye and posture models once and scores a record (or a
+batch) against all three in one pass, running the predict_proba calls
+concurrently (LightGBM releases the GIL)
+
+Input fields: type, value, dimension, metric
+Per-family overrides: {"vitamin_d": {...}, "eye": {...}, "posture": {...}}
+"""
+import sys
+import json
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from eye_health_startup import lazy_import, load_artifact
+from eye_health_encoding import compile_encoder, UNKNOWN_CODE
+from eye_health_validation import invalid_result
+
+# Heavy imports are deferred until first use
+np = lazy_import('numpy')
+
+# Get model file paths
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+
+# Model file and (input field, encoder file) pairs in feature order
+MODEL_FAMILIES = {
+    'vitamin_d': {
+        'model': 'vitd_model_final.pkl',
+        'features': [('type', 'le_type_vitd_final.pkl'), ('value', 'le_value_vitd_final.pkl')]
+    },
+    'eye': {
+        'model': 'eye_model_final.pkl',
+        'features': [('type', 'le_type_eye_final.pkl'), ('value', 'le_value_eye_final.pkl'),
+                     ('dimension', 'le_dim.pkl')]
+    },
+    'posture': {
+        'model': 'posture_model_final.pkl',
+        'features': [('type', 'le_type_posture_final.pkl'), ('value', 'le_value_posture_final.pkl'),
+                     ('metric', 'le_metric_final.pkl')]
+    }
+}
+
+# Response keys per family, matching the documented API
+RISK_KEYS = {
+    'vitamin_d': 'vitamin_d_risk',
+    'eye': 'eye_risk',
+    'posture': 'posture_risk'
+}
+
+# Weights of each family in overall_wellness_score
+WELLNESS_WEIGHTS = {
+    'vitamin_d': 1.0,
+    'eye': 1.0,
+    'posture': 1.0
+}
+
+# Top-level fields a record may leave out
+FIELD_DEFAULTS = {
+    "type": "Age",
+    "value": "25–34",
+    "dimension": "Unnamed: 2",
+    "metric": "Unnamed: 2"
+}
+
+# Used for an empty request; the overrides give every family known categories
+DEFAULT_INPUT = {
+    **FIELD_DEFAULTS,
+    "vitamin_d": {"type": "Winter", "value": "NSW"},
+    "posture": {"value": "Mostly sitting"}
+}
+
+# Reload golden set
+GOLDEN_INPUTS = [
+    {**DEFAULT_INPUT, "value": age_group, "vitamin_d": {"type": season, "value": "NSW"}}
+    for age_group in ("25–34", "45–54")
+    for season in ("Winter", "Autumn")
+]
+
+# Shared by every request; one thread per model family
+_executor = ThreadPoolExecutor(max_workers=len(MODEL_FAMILIES), thread_name_prefix='wellness')
+
+
+def load_wellness_models():
+    """Load all three model families; encoders shared between families load once"""
+    models = {}
+    encoders = {}
+    try:
+        for family, spec in MODEL_FAMILIES.items():
+            features = []
+            for field, filename in spec['features']:
+                if filename not in encoders:
+                    encoders[filename] = compile_encoder(load_artifact(os.path.join(MODELS_DIR, filename)))
+                features.append((field, filename))
+            models[family] = {
+                'model': load_artifact(os.path.join(MODELS_DIR, spec['model'])),
+                'features': features
+            }
+        models['encoders'] = encoders
+        return models
+    except Exception as e:
+        return {"error": f"Wellness model loading failed: {str(e)}"}
+
+
+def get_family_inputs(record, family):
+    """Top-level fields with any per-family override applied"""
+    inputs = {field: record.get(field, default) for field, default in FIELD_DEFAULTS.items()}
+    override = record.get(family)
+    if isinstance(override, dict):
+        inputs.update(override)
+    return inputs
+
+
+def factorize(values):
+    """Distinct values in first-seen order and each row's position among them"""
+    positions = {}
+    distinct = []
+    inverse = np.empty(len(values), dtype=np.int64)
+    for i, value in enumerate(values):
+        try:
+            position = positions.get(value)
+            if position is None:
+                position = positions[value] = len(distinct)
+                distinct.append(value)
+        except TypeError:
+            # Unhashable values never match an encoder class
+            position = len(distinct)
+            distinct.append(None)
+        inverse[i] = position
+    return distinct, inverse
+
+
+def encode_distinct(distinct, encoder):
+    """Codes for distinct values; unknown values become UNKNOWN_CODE"""
+    return np.array([encoder.encode(value) if value is not None else UNKNOWN_CODE
+                     for value in distinct], dtype=np.int64)
+
+
+def encode_records(records, models):
+    """
+    Build each family's feature matrix
+    Input fields are extracted and deduplicated once and shared by every family
+    without overrides; each encoder only maps distinct values
+    Returns family -> (matrix, valid_mask, {row: [(field, value), ...]} for invalid rows)
+    """
+    shared_columns = {
+        field: factorize([record.get(field, default) for record in records])
+        for field, default in FIELD_DEFAULTS.items()
+    }
+
+    encoded = {}
+    for family in MODEL_FAMILIES:
+        has_override = any(isinstance(record.get(family), dict) for record in records)
+        inputs = [get_family_inputs(record, family) for record in records] if has_override else None
+
+        features = models[family]['features']
+        matrix = np.empty((len(records), len(features)), dtype=np.int64)
+        columns = []
+        for j, (field, filename) in enumerate(features):
+            if has_override:
+                distinct, inverse = factorize([row[field] for row in inputs])
+            else:
+                distinct, inverse = shared_columns[field]
+            matrix[:, j] = encode_distinct(distinct, models['encoders'][filename])[inverse]
+            columns.append((field, distinct, inverse))
+
+        valid = (matrix != UNKNOWN_CODE).all(axis=1)
+        unknown = {}
+        for i in np.flatnonzero(~valid).tolist():
+            unknown[i] = [(field, distinct[inverse[i]]) for j, (field, distinct, inverse)
+                          in enumerate(columns) if matrix[i, j] == UNKNOWN_CODE]
+        encoded[family] = (matrix, valid, unknown)
+    return encoded
+
+
+def predict_family_probabilities(model, matrix, valid):
+    """predict_proba over the valid rows; NaN elsewhere"""
+    prob = np.full(len(matrix), np.nan, dtype=np.float64)
+    if valid.any():
+        prob[valid] = model.predict_proba(matrix[valid])[:, 1]
+    return prob
+
+
+def get_risk_level(probability):
+    """Determine risk level based on probability"""
+    if probability < 0.3:
+        return "Low"
+    elif probability < 0.7:
+        return "Medium"
+    else:
+        return "High"
+
+
+def get_confidence_score(probability):
+    """Determine confidence score based on probability"""
+    if probability < 0.2 or probability > 0.8:
+        return "High"
+    elif probability < 0.4 or probability > 0.6:
+        return "Medium"
+    else:
+        return "Low"
+
+
+def predict_wellness_batch(records, models):
+    """
+    Score every record against all three model families, results in input order
+    Records that are not JSON objects get an error result; the rest are still scored
+    """
+    scored = [i for i, record in enumerate(records) if isinstance(record, dict)]
+    if len(scored) < len(records):
+        results = [invalid_result({"input": f"Input must be a JSON object, got {type(record).__name__}"})
+                   for record in records]
+        for i, result in zip(scored, predict_wellness_batch([records[i] for i in scored], models)):
+            results[i] = result
+        return results
+
+    encoded = encode_records(records, models)
+
+    # One predict_proba per family, run concurrently
+    futures = {
+        family: _executor.submit(predict_family_probabilities, models[family]['model'],
+                                 encoded[family][0], encoded[family][1])
+        for family in MODEL_FAMILIES
+    }
+    probabilities = {family: future.result() for family, future in futures.items()}
+
+    results = []
+    for i in range(len(records)):
+        result = {}
+        details = {}
+        errors = {}
+        weighted_sum = 0.0
+        weight_total = 0.0
+        scored = []
+        for family in MODEL_FAMILIES:
+            unknown = encoded[family][2].get(i)
+            if unknown:
+                # Same fallback as the eye health scripts
+                result[RISK_KEYS[family]] = 50.0
+                details[family] = {"risk": 50.0, "risk_level": "Medium", "confidence": "Low"}
+                errors[family] = "Unknown categories: " + ", ".join(
+                    f"{field}={value!r}" for field, value in unknown)
+                continue
+
+            prob = float(probabilities[family][i])
+            risk = round(prob * 100, 2)
+            result[RISK_KEYS[family]] = risk
+            details[family] = {
+                "risk": risk,
+                "risk_level": get_risk_level(prob),
+                "confidence": get_confidence_score(prob)
+            }
+            weighted_sum += prob * 100 * WELLNESS_WEIGHTS[family]
+            weight_total += WELLNESS_WEIGHTS[family]
+            scored.append(family)
+
+        # Fallback families are left out of the overall score; say which ones it covers
+        if scored:
+            result["overall_wellness_score"] = round(weighted_sum / weight_total, 2)
+        else:
+            result["error"] = "No model family could be scored with these inputs"
+            result["overall_wellness_score"] = None
+        result["overall_families"] = scored
+        result["details"] = details
+        if errors:
+            result["errors"] = errors
+        results.append(result)
+    return results
+
+
+def predict_wellness(data, models):
+    """Score one record against all three model families"""
+    return predict_wellness_batch([data], models)[0]
+
+
+def build_wellness_result(input_data, models):
+    """Score one record and echo the input"""
+    if not input_data:
+        input_data = dict(DEFAULT_INPUT)
+    return {
+        **predict_wellness(input_data, models),
+        "input_data": input_data
+    }
+
+
+def main():
+    """Main function to run the wellness prediction"""
+    try:
+        flags = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+        positional = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+
+        # Long-running worker mode: load models once, serve NDJSON requests
+        if '--worker' in flags:
+            from eye_health_worker import run_worker
+            run_worker(sys.argv[1:], load_wellness_models, build_wellness_result,
+                       golden_inputs=GOLDEN_INPUTS)
+            return
+
+        # Read input data (a record or a list of records)
+        if not positional:
+            input_data = {}
+        else:
+            input_source = positional[0]
+            if os.path.isfile(input_source):
+                with open(input_source, 'r', encoding='utf-8') as f:
+                    input_data = json.load(f)
+            else:
+                try:
+                    input_data = json.loads(input_source)
+                except json.JSONDecodeError:
+                    input_data = {}
+
+        models = load_wellness_models()
+        if "error" in models:
+            print(json.dumps({"error": models["error"]}))
+            return
+
+        if isinstance(input_data, list):
+            result = predict_wellness_batch([dict(DEFAULT_INPUT) if record == {} else record
+                                             for record in input_data], models)
+        else:
+            result = build_wellness_result(input_data, models)
+
+        # Return results (only JSON to stdout)
+        print(json.dumps(result))
+
+    except Exception as e:
+        error_result = {"error": f"Wellness prediction failed: {str(e)}"}
+        print(json.dumps(error_result))
+
+
+if __name__ == "__main__":
+    # Suppress sklearn warnings
+    warnings.filterwarnings('ignore')
+    main()